@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# TDOA Capture (headless), for GNU Radio 3.10
+#
+# Written by hand rather than generated from a .grc, because the rx_time
+# tagger is an embedded Python block; keep edits here.
+#
+# Headless counterpart of n3pay_tdoa_capture.py: no Qt sinks and no full-rate
+# filtering. The dongle stream goes to disk untouched (complex64, .cf32) with
+# rx_time tags, and a sidecar JSON (see capture_format.py) that
+# ThreeStationTDOA loads directly. Monitoring is an optional decimated
+# frequency-xlating path written to its own file (or a named pipe).
+
+from gnuradio import blocks
+from gnuradio import filter
+from gnuradio.filter import firdes
+from gnuradio import gr
+from gnuradio.fft import window
+import sys
+import signal
+from argparse import ArgumentParser
+from gnuradio.eng_arg import eng_float, intx
+from gnuradio import eng_notation
+import json
+import numpy as np
+import os
+import pmt
+import time
+
+
+class rx_time_tagger(gr.sync_block):
+    """
+    Pass-through that stamps rx_time tags every tag_interval samples and keeps
+    the (sample index, time) pairs for the sidecar. A live stream is dated
+    from the host clock when each buffer arrives; a file replay is dated from
+    start_time and the sample clock.
+    """
+
+    def __init__(self, sample_rate=2.048e6, tag_interval=2048000, start_time=None):
+        gr.sync_block.__init__(self, name='rx_time_tagger',
+                               in_sig=[np.complex64], out_sig=[np.complex64])
+        self.sample_rate = sample_rate
+        self.tag_interval = int(tag_interval)
+        self.live = start_time is None
+        self.start_time = start_time
+        self.rx_times = []
+        self._next_tag = 0
+
+    def work(self, input_items, output_items):
+        n = len(input_items[0])
+        output_items[0][:] = input_items[0]
+
+        start = self.nitems_written(0)
+        now = time.time()
+        if self.start_time is None:
+            # Back-date the first buffer to its first sample
+            self.start_time = now - (start + n) / self.sample_rate
+
+        while self._next_tag < start + n:
+            if self.live:
+                t = now - (start + n - self._next_tag) / self.sample_rate
+            else:
+                t = self.start_time + self._next_tag / self.sample_rate
+            secs = int(t)
+            self.add_item_tag(0, self._next_tag, pmt.intern('rx_time'),
+                              pmt.make_tuple(pmt.from_uint64(secs), pmt.from_double(t - secs)))
+            self.rx_times.append([int(self._next_tag), t])
+            self._next_tag += self.tag_interval
+
+        return n
+
+
+class n3pay_tdoa_capture_headless(gr.top_block):
+
+    def __init__(self, station_id='station1', output_dir='.', input_file='', start_time=0,
+                 duration=0, center_frequency=162.4e6, samp_rate=2.048e6, gain=10,
+                 monitor_file='', monitor_offset=0, monitor_decimation=64):
+        gr.top_block.__init__(self, "TDOA Capture (headless)", catch_exceptions=True)
+
+        ##################################################
+        # Variables
+        ##################################################
+        self.station_id = station_id
+        self.samp_rate = samp_rate
+        self.center_frequency = center_frequency
+        self.capture_start = capture_start = start_time if start_time else time.time()
+        self.base_path = base_path = os.path.join(
+            output_dir, f"tdoa_{station_id}_{int(capture_start)}")
+        self.samples_path = base_path + '.cf32'
+        self.sidecar_path = base_path + '.sidecar.json'
+
+        ##################################################
+        # Blocks
+        ##################################################
+
+        if input_file:
+            # Replay a recorded complex64 stream (tests, reprocessing)
+            self.source = blocks.file_source(gr.sizeof_gr_complex*1, input_file, False, 0, 0)
+            self.source.set_begin_tag(pmt.PMT_NIL)
+        else:
+            import osmosdr
+            self.source = osmosdr.source(
+                args="numchan=" + str(1) + " " + ""
+            )
+            self.source.set_sample_rate(samp_rate)
+            self.source.set_center_freq(center_frequency, 0)
+            self.source.set_freq_corr(0, 0)
+            self.source.set_dc_offset_mode(0, 0)
+            self.source.set_iq_balance_mode(0, 0)
+            self.source.set_gain_mode(False, 0)
+            self.source.set_gain(gain, 0)
+            self.source.set_if_gain(20, 0)
+            self.source.set_bb_gain(20, 0)
+            self.source.set_antenna('', 0)
+            self.source.set_bandwidth(0, 0)
+
+        self.rx_time_tagger_0 = rx_time_tagger(
+            sample_rate=samp_rate,
+            tag_interval=int(samp_rate),
+            start_time=capture_start if input_file else None)
+
+        self.blocks_file_sink_0 = blocks.file_sink(gr.sizeof_gr_complex*1, self.samples_path, False)
+        self.blocks_file_sink_0.set_unbuffered(False)
+
+        upstream = self.source
+        if duration:
+            self.blocks_head_0 = blocks.head(gr.sizeof_gr_complex*1, int(duration * samp_rate))
+            self.connect((self.source, 0), (self.blocks_head_0, 0))
+            upstream = self.blocks_head_0
+
+        ##################################################
+        # Connections
+        ##################################################
+        self.connect((upstream, 0), (self.rx_time_tagger_0, 0))
+        self.connect((self.rx_time_tagger_0, 0), (self.blocks_file_sink_0, 0))
+
+        if monitor_file:
+            # Optional monitor: one channel translated to DC and decimated, with
+            # taps designed at the real dongle rate (12.5 kHz NFM channel)
+            self.monitor_taps = firdes.low_pass(
+                1, samp_rate, 8e3, 4e3, window.WIN_HAMMING, 6.76)
+            self.freq_xlating_fir_filter_0 = filter.freq_xlating_fir_filter_ccc(
+                monitor_decimation, self.monitor_taps, monitor_offset, samp_rate)
+            self.blocks_file_sink_1 = blocks.file_sink(gr.sizeof_gr_complex*1, monitor_file, False)
+            self.blocks_file_sink_1.set_unbuffered(True)
+            self.connect((self.rx_time_tagger_0, 0), (self.freq_xlating_fir_filter_0, 0))
+            self.connect((self.freq_xlating_fir_filter_0, 0), (self.blocks_file_sink_1, 0))
+
+    def write_sidecar(self):
+        """Publish the capture metadata once the stream has been flushed"""
+        self.blocks_file_sink_0.close()
+        num_samples = os.path.getsize(self.samples_path) // gr.sizeof_gr_complex
+        rx_times = self.rx_time_tagger_0.rx_times
+        timestamp = rx_times[0][1] if rx_times else self.capture_start
+
+        sidecar = {
+            'version': 1,
+            'station_id': self.station_id,
+            'timestamp': timestamp,
+            'sample_rate': float(self.samp_rate),
+            'center_freq': float(self.center_frequency),
+            'rx_time': rx_times,
+            'arrays': {
+                'samples': {
+                    'file': os.path.basename(self.samples_path),
+                    'dtype': 'complex64',
+                    'count': num_samples
+                }
+            }
+        }
+
+        tmp_path = self.sidecar_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(sidecar, f, indent=2)
+        os.replace(tmp_path, self.sidecar_path)
+        return self.sidecar_path
+
+    def get_samp_rate(self):
+        return self.samp_rate
+
+    def get_center_frequency(self):
+        return self.center_frequency
+
+    def set_center_frequency(self, center_frequency):
+        self.center_frequency = center_frequency
+        if hasattr(self.source, 'set_center_freq'):
+            self.source.set_center_freq(center_frequency, 0)
+
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--station-id", dest="station_id", type=str, default='station1',
+        help="Set station id used in the capture file name [default=%(default)r]")
+    parser.add_argument(
+        "--output-dir", dest="output_dir", type=str, default='.',
+        help="Set capture directory [default=%(default)r]")
+    parser.add_argument(
+        "--input-file", dest="input_file", type=str, default='',
+        help="Replay a complex64 file instead of the RTL-SDR [default=%(default)r]")
+    parser.add_argument(
+        "--start-time", dest="start_time", type=eng_float, default=eng_notation.num_to_str(float(0)),
+        help="Set time of the first sample in unix seconds (0 = now) [default=%(default)r]")
+    parser.add_argument(
+        "--duration", dest="duration", type=eng_float, default=eng_notation.num_to_str(float(0)),
+        help="Set capture duration in seconds (0 = until interrupted) [default=%(default)r]")
+    parser.add_argument(
+        "-f", "--center-frequency", dest="center_frequency", type=eng_float, default=eng_notation.num_to_str(float(162.4e6)),
+        help="Set center frequency [default=%(default)r]")
+    parser.add_argument(
+        "-s", "--samp-rate", dest="samp_rate", type=eng_float, default=eng_notation.num_to_str(float(2.048e6)),
+        help="Set sample rate [default=%(default)r]")
+    parser.add_argument(
+        "-g", "--gain", dest="gain", type=eng_float, default=eng_notation.num_to_str(float(10)),
+        help="Set RF gain [default=%(default)r]")
+    parser.add_argument(
+        "--monitor-file", dest="monitor_file", type=str, default='',
+        help="Write a decimated monitor channel to this file or FIFO [default=%(default)r]")
+    parser.add_argument(
+        "--monitor-offset", dest="monitor_offset", type=eng_float, default=eng_notation.num_to_str(float(0)),
+        help="Set monitor channel offset from center in Hz [default=%(default)r]")
+    parser.add_argument(
+        "--monitor-decimation", dest="monitor_decimation", type=intx, default=64,
+        help="Set monitor decimation [default=%(default)r]")
+    return parser
+
+
+def main(top_block_cls=n3pay_tdoa_capture_headless, options=None):
+    if options is None:
+        options = argument_parser().parse_args()
+
+    tb = top_block_cls(
+        station_id=options.station_id, output_dir=options.output_dir,
+        input_file=options.input_file, start_time=options.start_time,
+        duration=options.duration, center_frequency=options.center_frequency,
+        samp_rate=options.samp_rate, gain=options.gain,
+        monitor_file=options.monitor_file, monitor_offset=options.monitor_offset,
+        monitor_decimation=options.monitor_decimation)
+
+    def sig_handler(sig=None, frame=None):
+        tb.stop()
+        tb.wait()
+        print(f"Saved to {tb.write_sidecar()}")
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, sig_handler)
+    signal.signal(signal.SIGTERM, sig_handler)
+
+    tb.start()
+    tb.wait()
+    print(f"Saved to {tb.write_sidecar()}")
+
+
+if __name__ == '__main__':
+    main()
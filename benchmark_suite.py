@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the TDOA processor on synthetic scenarios
+Runs a matrix of capture lengths and station counts through each pipeline
+stage, timing every stage and scoring the fix against the scenario's ground
+truth, so performance changes can be checked for accuracy regressions
+"""
+
+import contextlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from scenario_generator import Scenario, load_truth, configure_processor, truth_tdoa
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+STAGES = ('find_files', 'load', 'correlate_pair', 'compute_tdoa', 'multilateration', 'full_pipeline')
+
+
+def timed(func, *args):
+    """(result, seconds) with the processor's console output suppressed"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+
+def run_case(data_dir, full_pipeline=True):
+    """Time each stage on one scenario directory and score it against the truth"""
+    truth = load_truth(data_dir)
+    processor = configure_processor(ThreeStationTDOA(data_dir), truth)
+    times = {}
+
+    _, times['find_files'] = timed(processor.find_synchronized_files)
+    _, times['load'] = timed(processor.load_station_data)
+    timed(processor.check_capture_integrity)
+    timed(processor.align_reference_clocks)
+
+    stations = list(processor.station_data)
+    data1, data2 = processor.station_data[stations[0]], processor.station_data[stations[1]]
+    _, times['correlate_pair'] = timed(processor.calculate_correlation,
+                                       data1['samples'], data2['samples'], data1['sample_rate'])
+    _, times['compute_tdoa'] = timed(processor.compute_all_tdoa)
+    _, times['multilateration'] = timed(processor.multilateration)
+
+    tdoa_errors = [pair['tdoa'] - truth_tdoa(truth, *pair['stations'])
+                   for pair in processor.tdoa_pairs.values()]
+    position = processor.estimated_position
+
+    if full_pipeline:
+        # Fresh processor so nothing computed above is reused (maps, plots and
+        # the results store included)
+        processor = configure_processor(ThreeStationTDOA(data_dir), truth)
+
+        def pipeline():
+            processor.run_analysis()
+            processor.close_renderer()  # plots finish at shutdown; keep them in the time
+
+        _, times['full_pipeline'] = timed(pipeline)
+
+    return {
+        'times': times,
+        'evaluations': position.get('evaluations'),
+        'error_meters': float(position['error_meters']),
+        'tdoa_rms_ns': float(np.sqrt(np.mean(np.square(tdoa_errors))) * 1e9)
+    }
+
+
+def run_matrix(durations, station_counts, repeats=1, snr_db=20.0, fmt='npz',
+               full_pipeline=True, work_dir=None, seed=0):
+    """One result dict per (duration, station count, repeat)"""
+    results = []
+    for duration in durations:
+        for n_stations in station_counts:
+            for repeat in range(repeats):
+                case_seed = seed + repeat
+                scenario = Scenario.random(n_stations=n_stations, duration=duration,
+                                           snr_db=snr_db, seed=case_seed)
+                case_dir = tempfile.mkdtemp(prefix='tdoa_bench_', dir=work_dir)
+                try:
+                    _, generate_time = timed(scenario.write, case_dir, fmt)
+                    result = run_case(case_dir, full_pipeline)
+                finally:
+                    shutil.rmtree(case_dir, ignore_errors=True)
+
+                result.update(duration=duration, stations=n_stations, seed=case_seed,
+                              snr_db=snr_db, format=fmt, generate_seconds=generate_time)
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_result(result):
+    stages = '  '.join(f"{result['times'][stage]*1e3:8.1f}" if stage in result['times'] else f"{'-':>8}"
+                       for stage in STAGES)
+    print(f"{result['duration']:6.2f} {result['stations']:4d} {result['seed']:5d}  {stages}  "
+          f"{result['error_meters']:9.1f} {result['tdoa_rms_ns']:9.1f}")
+
+
+def print_header():
+    print("Stage times in ms; position error in m; TDOA RMS error in ns")
+    print(f"{'dur s':>6} {'stns':>4} {'seed':>5}  " + '  '.join(f"{stage[:8]:>8}" for stage in STAGES) +
+          f"  {'error m':>9} {'tdoa ns':>9}")
+
+
+def check_baseline(results, baseline_path):
+    """
+    Compare accuracy with a previous run's JSON lines. An error counts as a
+    regression when it exceeds both 1.25x and 10 m over the baseline case.
+    Returns the list of regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = [json.loads(line) for line in f if line.strip()]
+    baseline = {(r['duration'], r['stations'], r['seed']): r for r in baseline}
+
+    regressions = []
+    for result in results:
+        old = baseline.get((result['duration'], result['stations'], result['seed']))
+        if old is None:
+            continue
+        limit = max(1.25 * old['error_meters'], old['error_meters'] + 10.0)
+        if result['error_meters'] > limit:
+            regressions.append((result, old))
+    return regressions
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark the TDOA pipeline on synthetic scenarios")
+    parser.add_argument('--durations', type=float, nargs='+', default=[0.25, 1.0, 2.0],
+                        help="Capture lengths in seconds [default=%(default)r]")
+    parser.add_argument('--stations', type=int, nargs='+', default=[3, 4, 6],
+                        help="Station counts [default=%(default)r]")
+    parser.add_argument('--repeats', type=int, default=1,
+                        help="Scenarios (seeds) per case [default=%(default)r]")
+    parser.add_argument('--snr', type=float, default=20.0, help="SNR in dB [default=%(default)r]")
+    parser.add_argument('--format', choices=('npz', 'sidecar'), default='npz',
+                        help="Capture format [default=%(default)r]")
+    parser.add_argument('--seed', type=int, default=0, help="First scenario seed [default=%(default)r]")
+    parser.add_argument('--skip-full', action='store_true',
+                        help="Skip the full run_analysis pass (maps and plots)")
+    parser.add_argument('--work-dir', default=None,
+                        help="Where scenarios are written [default=system temp]")
+    parser.add_argument('--output', default=None,
+                        help="Append results as JSON lines to this file")
+    parser.add_argument('--baseline', default=None,
+                        help="JSON lines from an earlier run; exit 1 if accuracy regresses")
+    args = parser.parse_args()
+
+    print_header()
+    results = run_matrix(args.durations, args.stations, args.repeats, args.snr, args.format,
+                         full_pipeline=not args.skip_full, work_dir=args.work_dir, seed=args.seed)
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        print(f"\nResults appended to {args.output}")
+
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline)
+        for result, old in regressions:
+            print(f"REGRESSION: {result['duration']} s, {result['stations']} stations, seed {result['seed']}: "
+                  f"{result['error_meters']:.1f} m (baseline {old['error_meters']:.1f} m)")
+        if regressions:
+            sys.exit(1)
+        print("No accuracy regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
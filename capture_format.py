@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Capture file formats shared by the collectors and the processor
+
+  tdoa_<station>_<ts>.npz            - sync_collect_samples.py (np.savez_compressed)
+  tdoa_<station>_<ts>.sidecar.json   - raw IQ captures (headless GNU Radio flowgraph,
+                                       network receiver); metadata plus one raw file
+                                       per array, e.g. tdoa_<station>_<ts>.cf32
+"""
+
+import numpy as np
+import json
+import os
+import struct
+import uuid
+import zipfile
+
+CAPTURE_PATTERNS = ('tdoa_*.npz', 'tdoa_*.sidecar.json')
+SIDECAR_SUFFIX = '.sidecar.json'
+SIDECAR_VERSION = 1
+
+
+class SidecarCapture:
+    """
+    Read-only view of a sidecar capture that mirrors np.load()'s NpzFile:
+    `.files` lists the keys, arrays come back as read-only memmaps and
+    nested metadata (e.g. integrity) as JSON strings, like the .npz files
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self._dir = os.path.dirname(path)
+        self._arrays = self.meta.get('arrays', {})
+        self.files = list(self._arrays) + [k for k in self.meta if k not in ('arrays', 'version')]
+
+    def __contains__(self, key):
+        return key in self.files
+
+    def __getitem__(self, key):
+        if key in self._arrays:
+            spec = self._arrays[key]
+            filepath = os.path.join(self._dir, spec['file'])
+            dtype = np.dtype(spec.get('dtype', 'complex64'))
+            count = spec.get('count')
+            if count is None:
+                count = os.path.getsize(filepath) // dtype.itemsize
+            if count == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.memmap(filepath, dtype=dtype, mode='r', shape=(count,))
+
+        value = self.meta[key]
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return np.asarray(value)
+
+    def close(self):
+        pass
+
+
+def open_capture(filepath):
+    """Open a capture of either format with an np.load()-like interface"""
+    if filepath.endswith(SIDECAR_SUFFIX):
+        return SidecarCapture(filepath)
+    return np.load(filepath)
+
+
+class NpyStreamReader:
+    """
+    Lazy 1-D array inside a compressed .npz member. Slices decompress only
+    what they cover; forward access is sequential, a backward slice re-opens
+    the member. np.asarray() still materialises the whole array.
+    """
+
+    def __init__(self, path, name, chunk_bytes=1 << 22):
+        self.path = path
+        self.member = name + '.npy'
+        self.chunk_bytes = chunk_bytes
+        self._zip = None
+        self._open()
+        if len(self.shape) != 1:
+            raise ValueError(f"{self.member}: only 1-D arrays can be streamed")
+
+    def _open(self):
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        self._file = self._zip.open(self.member)
+        version = np.lib.format.read_magic(self._file)
+        if version == (1, 0):
+            self.shape, _, self.dtype = np.lib.format.read_array_header_1_0(self._file)
+        else:
+            self.shape, _, self.dtype = np.lib.format.read_array_header_2_0(self._file)
+        self._pos = 0
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return 1
+
+    def _skip(self, count):
+        remaining = count * self.dtype.itemsize
+        while remaining:
+            remaining -= len(self._file.read(min(remaining, self.chunk_bytes)))
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("NpyStreamReader only supports contiguous slices")
+        start, stop, _ = key.indices(len(self))
+        stop = max(start, stop)
+
+        if start < self._pos:
+            self._file.close()
+            self._open()
+        self._skip(start - self._pos)
+
+        data = self._file.read((stop - start) * self.dtype.itemsize)
+        self._pos = stop
+        return np.frombuffer(data, dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def close(self):
+        self._file.close()
+        self._zip.close()
+
+
+def _stored_npy_memmap(path, info):
+    """Read-only memmap of an uncompressed .npz member, or None if it can't be mapped"""
+    with open(path, 'rb') as f:
+        # Local file header: fixed 30 bytes, then the name and extra fields
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if dtype.hasobject or len(shape) != 1:
+        return None
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
+def capture_array(data, name):
+    """
+    An array from an open capture without reading it into memory: sidecar
+    arrays and uncompressed .npz members are memmapped, compressed members
+    are streamed (NpyStreamReader)
+    """
+    zf = getattr(data, 'zip', None)
+    if zf is None:
+        return data[name]
+
+    info = zf.getinfo(name + '.npy')
+    if info.compress_type == zipfile.ZIP_STORED:
+        array = _stored_npy_memmap(zf.filename, info)
+        if array is not None:
+            return array
+    return NpyStreamReader(zf.filename, name)
+
+
+def read_block(array, start, stop, dtype=np.complex64):
+    """array[start:stop] as `dtype`, zero-filled where the range runs outside the array"""
+    block = np.zeros(stop - start, dtype=dtype)
+    lo, hi = max(start, 0), min(stop, len(array))
+    if hi > lo:
+        block[lo - start:hi - start] = array[lo:hi]
+    return block
+
+
+def sidecar_base(filepath):
+    """Strip the sidecar suffix: tdoa_station1_123.sidecar.json -> tdoa_station1_123"""
+    if filepath.endswith(SIDECAR_SUFFIX):
+        return filepath[:-len(SIDECAR_SUFFIX)]
+    return os.path.splitext(filepath)[0]
+
+
+class SidecarWriter:
+    """
+    Stream a capture to disk as raw arrays plus a sidecar. Arrays are written
+    to private temporary files and renamed into place, then the sidecar is
+    written (atomically), so a capture only becomes visible once complete and
+    an unfinished rewrite of the same base never touches the published one.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self._files = {}
+        self._temp_paths = {}
+        self._arrays = {}
+
+    def array_path(self, name):
+        suffix = '.cf32' if name == 'samples' else f'.{name}.cf32'
+        return self.base_path + suffix
+
+    def write(self, name, buffer, dtype='complex64'):
+        """Append raw bytes (or an array) to the named array"""
+        if name not in self._files:
+            self._temp_paths[name] = f"{self.array_path(name)}.{uuid.uuid4().hex}.part"
+            self._files[name] = open(self._temp_paths[name], 'xb')
+            self._arrays[name] = {
+                'file': os.path.basename(self.array_path(name)),
+                'dtype': str(np.dtype(dtype)),
+                'count': 0
+            }
+        if isinstance(buffer, np.ndarray):
+            buffer = np.ascontiguousarray(buffer, dtype=dtype)
+        view = memoryview(buffer).cast('B')
+        self._files[name].write(view)
+        self._arrays[name]['count'] += len(view) // np.dtype(self._arrays[name]['dtype']).itemsize
+
+    def abort(self):
+        """Drop an unfinished capture: close and delete its temporary array files"""
+        for name, f in self._files.items():
+            f.close()
+            if os.path.exists(self._temp_paths[name]):
+                os.remove(self._temp_paths[name])
+        self._files = {}
+        self._temp_paths = {}
+        self._arrays = {}
+
+    def close(self, metadata):
+        """Finish the arrays and publish the sidecar; returns its path"""
+        for name, f in self._files.items():
+            f.close()
+            os.replace(self._temp_paths[name], self.array_path(name))
+        self._files = {}
+
+        sidecar = dict(metadata)
+        sidecar['version'] = SIDECAR_VERSION
+        sidecar['arrays'] = self._arrays
+
+        path = self.base_path + SIDECAR_SUFFIX
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sidecar, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
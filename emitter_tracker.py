@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Emitter tracking for the TDOA fix stream
+Constant-velocity Kalman filters, one per emitter, held as stacked arrays so a
+batch of fixes updates every touched track in one vectorized step
+"""
+
+import json
+import sys
+import numpy as np
+from tdoa_processor_three_stations import lat_lon_to_xy, xy_to_lat_lon
+
+# Position rows of the state [x, y, vx, vy]
+H = np.array([[1.0, 0.0, 0.0, 0.0],
+              [0.0, 1.0, 0.0, 0.0]])
+
+
+def fix_covariance(position):
+    """2x2 position covariance (m^2) from a fix's error ellipse, or None"""
+    if 'semi_major_m' not in position:
+        return None
+    theta = np.radians(position['orientation_deg'])
+    major = np.array([np.sin(theta), np.cos(theta)])   # bearing from north, x east
+    minor = np.array([np.cos(theta), -np.sin(theta)])
+    return (position['semi_major_m'] ** 2 * np.outer(major, major) +
+            position['semi_minor_m'] ** 2 * np.outer(minor, minor))
+
+
+class TrackBank:
+    """
+    One constant-velocity Kalman filter per emitter key (the channel centre
+    frequency by default). Fixes are the measurements, with the solver's error
+    ellipse as their covariance, so the TDOAs behind each fix are fused over time
+    through the linearised fix. Fixes outside the gate are rejected; a track that
+    misses max_misses fixes in a row restarts from the next one.
+    """
+
+    def __init__(self, ref_lat, ref_lon, process_noise=0.01, initial_speed_sigma=10.0,
+                 gate=13.8, max_misses=3, fallback_sigma=1000.0):
+        self.ref_lat = ref_lat
+        self.ref_lon = ref_lon
+        self.process_noise = process_noise            # white acceleration, m^2/s^3
+        self.initial_speed_sigma = initial_speed_sigma  # m/s
+        self.gate = gate                              # chi-square, 2 dof (99.9%)
+        self.max_misses = max_misses
+        self.fallback_sigma = fallback_sigma          # m, for fixes without an ellipse
+
+        self.keys = []
+        self.index = {}
+        self.x = np.zeros((0, 4))
+        self.P = np.zeros((0, 4, 4))
+        self.t = np.zeros(0)
+        self.updates = np.zeros(0, dtype=int)
+        self.misses = np.zeros(0, dtype=int)
+
+    @staticmethod
+    def key_for(fix):
+        freq = fix.get('center_freq')
+        return None if freq is None else int(round(freq))
+
+    def _transition(self, dt):
+        """Stacked F and Q for time steps dt (n,)"""
+        n = len(dt)
+        F = np.tile(np.eye(4), (n, 1, 1))
+        F[:, 0, 2] = F[:, 1, 3] = dt
+
+        q = self.process_noise
+        Q = np.zeros((n, 4, 4))
+        Q[:, 0, 0] = Q[:, 1, 1] = q * dt**3 / 3
+        Q[:, 0, 2] = Q[:, 2, 0] = Q[:, 1, 3] = Q[:, 3, 1] = q * dt**2 / 2
+        Q[:, 2, 2] = Q[:, 3, 3] = q * dt
+        return F, Q
+
+    def _predicted(self, rows, times):
+        dt = np.maximum(np.asarray(times, dtype=float) - self.t[rows], 0.0)
+        F, Q = self._transition(dt)
+        x = np.einsum('nij,nj->ni', F, self.x[rows])
+        P = F @ self.P[rows] @ F.transpose(0, 2, 1) + Q
+        return x, P
+
+    def predict(self, key, t):
+        """Predicted {'lat', 'lon', 'cov'} for a track at time t, or None if untracked"""
+        row = self.index.get(key)
+        if row is None:
+            return None
+        x, P = self._predicted([row], [t])
+        lat, lon = xy_to_lat_lon(x[0, 0], x[0, 1], self.ref_lat, self.ref_lon)
+        return {'lat': lat, 'lon': lon, 'cov': P[0, :2, :2]}
+
+    def _start(self, rows, z, R, times):
+        self.x[rows] = 0.0
+        self.x[rows, :2] = z
+        self.P[rows] = 0.0
+        self.P[rows, :2, :2] = R
+        self.P[rows, 2, 2] = self.P[rows, 3, 3] = self.initial_speed_sigma ** 2
+        self.t[rows] = times
+        self.updates[rows] = 1
+        self.misses[rows] = 0
+
+    def update(self, fixes):
+        """Fold a batch of fix summaries into their tracks; returns one track state per fix"""
+        states = [None] * len(fixes)
+        order = sorted((i for i, fix in enumerate(fixes) if fix.get('estimated_position')),
+                       key=lambda i: fixes[i]['timestamp'])
+
+        # Each round holds at most one fix per track so the update can be batched
+        while order:
+            batch, seen, rest = [], set(), []
+            for i in order:
+                key = self.key_for(fixes[i])
+                (rest if key in seen else batch).append(i)
+                seen.add(key)
+            order = rest
+
+            for i, state in zip(batch, self._update_batch([fixes[i] for i in batch])):
+                states[i] = state
+
+        return states
+
+    def _update_batch(self, fixes):
+        n = len(fixes)
+        keys = [self.key_for(fix) for fix in fixes]
+        times = np.array([fix['timestamp'] for fix in fixes], dtype=float)
+        z = np.array([lat_lon_to_xy(fix['estimated_position']['lat'], fix['estimated_position']['lon'],
+                                    self.ref_lat, self.ref_lon) for fix in fixes])
+        R = np.empty((n, 2, 2))
+        for i, fix in enumerate(fixes):
+            cov = fix_covariance(fix['estimated_position'])
+            R[i] = cov if cov is not None else np.eye(2) * self.fallback_sigma ** 2
+
+        # New keys get a row; they start from their first fix
+        new = [i for i, key in enumerate(keys) if key not in self.index]
+        if new:
+            first = len(self.keys)
+            for j, i in enumerate(new):
+                self.index[keys[i]] = first + j
+                self.keys.append(keys[i])
+            self.x = np.concatenate([self.x, np.zeros((len(new), 4))])
+            self.P = np.concatenate([self.P, np.zeros((len(new), 4, 4))])
+            self.t = np.concatenate([self.t, np.zeros(len(new))])
+            self.updates = np.concatenate([self.updates, np.zeros(len(new), dtype=int)])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=int)])
+            self._start(np.arange(first, len(self.keys)), z[new], R[new], times[new])
+
+        is_new = np.zeros(n, dtype=bool)
+        is_new[new] = True
+        rows = np.array([self.index[key] for key in keys])
+        accepted = np.zeros(n, dtype=bool)
+        accepted[is_new] = True
+        nis = np.zeros(n)
+
+        old = ~is_new
+        if old.any():
+            r = rows[old]
+            x, P = self._predicted(r, times[old])
+
+            # Innovation, its covariance and the Mahalanobis gate, all stacked
+            y = z[old] - x[:, :2]
+            S = P[:, :2, :2] + R[old]
+            S_inv = np.linalg.inv(S)
+            d2 = np.einsum('ni,nij,nj->n', y, S_inv, y)
+            ok = d2 <= self.gate
+
+            K = P[:, :, :2] @ S_inv
+            x_upd = x + np.einsum('nij,nj->ni', K, y)
+            P_upd = P - K @ S @ K.transpose(0, 2, 1)
+
+            self.x[r[ok]] = x_upd[ok]
+            self.P[r[ok]] = P_upd[ok]
+            self.t[r[ok]] = times[old][ok]
+            self.updates[r[ok]] += 1
+            self.misses[r[ok]] = 0
+            self.misses[r[~ok]] += 1
+
+            # Tracks that keep rejecting fixes have lost the emitter: restart them
+            lost = ~ok & (self.misses[r] >= self.max_misses)
+            if lost.any():
+                self._start(r[lost], z[old][lost], R[old][lost], times[old][lost])
+                ok = ok | lost
+
+            accepted[old] = ok
+            nis[old] = d2
+
+        return [self.state(row, accepted=bool(accepted[i]), nis=float(nis[i]))
+                for i, row in enumerate(rows)]
+
+    def state(self, row, **extra):
+        """JSON-safe track state for one row"""
+        x, P = self.x[row], self.P[row]
+        lat, lon = xy_to_lat_lon(x[0], x[1], self.ref_lat, self.ref_lon)
+        eigvals = np.linalg.eigvalsh(P[:2, :2])
+        state = {
+            'key': self.keys[row],
+            'time': float(self.t[row]),
+            'lat': float(lat),
+            'lon': float(lon),
+            'vx_m_s': float(x[2]),
+            'vy_m_s': float(x[3]),
+            'semi_major_m': float(np.sqrt(max(eigvals[1], 0.0))),
+            'semi_minor_m': float(np.sqrt(max(eigvals[0], 0.0))),
+            'updates': int(self.updates[row])
+        }
+        state.update(extra)
+        return state
+
+    def tracks(self):
+        return [self.state(row) for row in range(len(self.keys))]
+
+
+def main():
+    # Usage: emitter_tracker.py fixes.jsonl   (e.g. from fusion_service.py --jsonl
+    # or results_store.py --jsonl); prints the smoothed track after each fix
+    from tdoa_processor_three_stations import ThreeStationTDOA
+
+    path = sys.argv[1] if len(sys.argv) > 1 else 'fixes.jsonl'
+    stations = ThreeStationTDOA().station_positions.values()
+    bank = TrackBank(np.mean([s['lat'] for s in stations]), np.mean([s['lon'] for s in stations]))
+
+    with open(path) as f:
+        fixes = [json.loads(line) for line in f if line.strip()]
+
+    for fix, state in zip(fixes, bank.update(fixes)):
+        if state is None:
+            continue
+        print(f"{fix['timestamp']:.1f}  track {state['key']}: {state['lat']:.6f}, {state['lon']:.6f} "
+              f"+/- {state['semi_major_m']:.0f} x {state['semi_minor_m']:.0f} m "
+              f"({state['updates']} fixes{'' if state['accepted'] else ', fix rejected'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Single-precision FFT cross-correlation for the TDOA processor
+Segments are normalised into reusable complex64 scratch buffers and transformed
+with multithreaded scipy.fft at a fast FFT length; a station's spectrum is
+computed once and shared by every pair it belongs to. Windows too long for
+memory are correlated block by block (StreamingCorrelator).
+"""
+
+import os
+import threading
+from functools import lru_cache
+import numpy as np
+from scipy import fft as sfft
+from capture_format import read_block
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+class CrossCorrelator:
+    """Full-mode cross-correlation of segments up to `length` samples"""
+
+    def __init__(self, length, workers=DEFAULT_WORKERS):
+        self.length = length
+        self.nfft = sfft.next_fast_len(2 * length - 1)
+        self.workers = workers
+        # Scratch buffers are per thread so pairs can run concurrently
+        self._local = threading.local()
+
+    def _scratch(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty(self.nfft, dtype=np.complex64)
+        return buffer
+
+    def spectrum(self, segment, workers=None):
+        """(spectrum, n) of a zero-mean, unit-power segment, zero-padded to nfft"""
+        n = min(len(segment), self.length)
+        buffer = self._scratch()
+        head = buffer[:n]
+        head[:] = segment[:n]
+        head -= head.mean()
+        head /= head.std() + 1e-10
+        buffer[n:] = 0
+
+        return sfft.fft(buffer, workers=workers or self.workers), n
+
+    def correlate(self, spec1, spec2, workers=None):
+        """scipy.signal.correlate(seg1, seg2, 'full') and its lags, from two spectra"""
+        (s1, n1), (s2, n2) = spec1, spec2
+        buffer = self._scratch()
+        np.conjugate(s2, out=buffer)
+        buffer *= s1
+        circular = sfft.ifft(buffer, workers=workers or self.workers, overwrite_x=True)
+
+        # Negative lags wrap to the end of the circular correlation
+        correlation = np.concatenate((circular[self.nfft - (n2 - 1):], circular[:n1]))
+        lags = np.arange(-(n2 - 1), n1)
+        return correlation, lags
+
+
+@lru_cache(maxsize=8)
+def correlator_for(length, workers=DEFAULT_WORKERS):
+    """Shared CrossCorrelator per segment length (keeps scratch buffers alive between calls)"""
+    return CrossCorrelator(length, workers)
+
+
+def correlation_bytes(n_signals, n_pairs, length):
+    """Working set of the in-memory path: each signal's window, one spectrum per signal and pair plus scratch"""
+    return (n_signals + n_pairs + 2) * sfft.next_fast_len(2 * max(length, 1) - 1) * 8 + n_signals * length * 8
+
+
+class StreamingCorrelator:
+    """
+    Cross-correlation of arbitrarily long signals for lags within +/- max_lag
+    samples, under a memory budget. Each block of B samples of sig2 is
+    correlated against the matching block of sig1 extended by max_lag on both
+    sides; the cross-spectra of all blocks share one alignment, so they are
+    summed and inverted once at the end. Signals are read strictly forward,
+    one block at a time, so memmaps and compressed .npz streams both work.
+    """
+
+    def __init__(self, max_lag, memory_budget, n_buffers, workers=DEFAULT_WORKERS):
+        self.max_lag = int(max_lag)
+        # Largest power-of-two FFT whose n_buffers complex64 spectra fit the budget
+        nfft = 1 << int(np.log2(max(memory_budget // (8 * n_buffers), 2)))
+        self.block = nfft - 2 * self.max_lag
+        if self.block < self.max_lag:
+            raise ValueError(f"Memory budget of {memory_budget/2**20:.0f} MB is too small "
+                             f"for a +/-{self.max_lag} sample lag search")
+        self.nfft = nfft
+        self.workers = workers
+
+    @staticmethod
+    def _read(signal, start, stop, n):
+        """signal[start:stop] as complex64, zero from sample n on"""
+        block = np.zeros(stop - start, dtype=np.complex64)
+        hi = min(stop, n)
+        if hi > start:
+            block[:hi - start] = read_block(signal, start, hi)
+        return block
+
+    def correlate(self, signals, pairs, n):
+        """
+        {pair: (correlation, lags)} for the first n samples of each named signal,
+        normalised like CrossCorrelator (zero-mean, unit-power inputs). Blocks
+        are centred on the first block's mean; the residual mean is removed
+        exactly at the end, from each signal's sum and its first and last
+        max_lag samples, so the result matches the one-shot correlation.
+        """
+        K, B, nfft = self.max_lag, self.block, self.nfft
+        names = sorted({name for pair in pairs for name in pair})
+        first = {pair[0] for pair in pairs}
+        second = {pair[1] for pair in pairs}
+
+        accumulators = {pair: np.zeros(nfft, dtype=np.complex64) for pair in pairs}
+        energy = dict.fromkeys(names, 0.0)
+        total = dict.fromkeys(names, 0)
+        dc, leading, trailing = {}, {}, {}
+        carry = {}
+        scratch = np.zeros(nfft, dtype=np.complex64)
+
+        for start in range(0, n, B):
+            stop = min(start + B, n)
+            spectra_ext, spectra_core = {}, {}
+
+            for name in names:
+                # Extended block sig[start-K : start+B+K]: the 2K samples carried
+                # from the previous block plus the next B, read strictly forward
+                if start == 0:
+                    head = self._read(signals[name], 0, B + K, n)
+                    valid = min(B + K, n)
+                    dc[name] = head[:valid].mean() if valid else 0
+                    head[:valid] -= dc[name]
+                    extended = np.concatenate((np.zeros(K, dtype=np.complex64), head))
+                else:
+                    new = self._read(signals[name], start + K, start + B + K, n)
+                    new[:max(0, n - start - K)] -= dc[name]
+                    extended = np.concatenate((carry[name], new))
+                carry[name] = extended[len(extended) - 2 * K:]
+
+                core = extended[K:K + (stop - start)]
+                energy[name] += float(np.vdot(core, core).real)
+                total[name] += core.astype(np.complex128).sum()
+                if start == 0:
+                    leading[name] = extended[K:K + min(K, n)].astype(np.complex128)
+                if stop == n:
+                    # The K samples before n, partly carried from earlier blocks
+                    trailing[name] = extended[K + n - start - min(K, n):K + n - start].astype(np.complex128)
+
+                if name in first:
+                    scratch[:len(extended)] = extended
+                    scratch[len(extended):] = 0
+                    spectra_ext[name] = sfft.fft(scratch, workers=self.workers)
+                if name in second:
+                    scratch[:len(core)] = core
+                    scratch[len(core):] = 0
+                    spectra_core[name] = sfft.fft(scratch, workers=self.workers)
+
+            for pair, acc in accumulators.items():
+                acc += spectra_ext[pair[0]] * np.conj(spectra_core[pair[1]])
+
+        # Sums of the first and last m samples, m = 0..K, and the residual means
+        lags = np.arange(-K, K + 1)
+        m = np.minimum(np.arange(K + 1), n)
+        prefix = {name: np.concatenate(([0], np.cumsum(leading[name])))[m] for name in names}
+        suffix = {name: np.concatenate(([0], np.cumsum(trailing[name][::-1])))[m] for name in names}
+        residual = {name: total[name] / n for name in names}
+        overlap = np.maximum(n - np.abs(lags), 0)
+
+        results = {}
+        for (name1, name2), acc in accumulators.items():
+            circular = sfft.ifft(acc, workers=self.workers, overwrite_x=True)
+            # correlation[l] = sum over the overlap of y1[i + l] * conj(y2[i]); with
+            # y = z + residual, remove the residual terms to correlate the z
+            sum1 = total[name1] - np.where(lags >= 0, prefix[name1][np.abs(lags)], suffix[name1][np.abs(lags)])
+            sum2 = total[name2] - np.where(lags >= 0, suffix[name2][np.abs(lags)], prefix[name2][np.abs(lags)])
+            r1, r2 = residual[name1], residual[name2]
+            correlation = (circular[:2 * K + 1] - np.conj(r2) * sum1 - r1 * np.conj(sum2) +
+                           r1 * np.conj(r2) * overlap)
+
+            energy1 = energy[name1] - n * abs(r1) ** 2
+            energy2 = energy[name2] - n * abs(r2) ** 2
+            scale = n / np.sqrt(energy1 * energy2 + 1e-30)
+            results[(name1, name2)] = ((correlation * scale).astype(np.complex64), lags)
+        return results
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Central TDOA fusion service
+Ingests captures from all stations as they arrive, matches them by timestamp,
+solves each complete group in a process pool and publishes fixes immediately
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from emitter_tracker import TrackBank
+from results_store import ResultsStore
+from sample_transport import CaptureReceiver, DEFAULT_PORT
+from tdoa_processor_three_stations import ThreeStationTDOA, solve_capture_group
+
+
+class JsonlSubscriber:
+    """Append each fix as one JSON line"""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def publish(self, fix):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(fix) + '\n')
+
+    async def close(self):
+        pass
+
+
+class StoreSubscriber:
+    """Append each fix to the SQLite results store"""
+
+    def __init__(self, path):
+        self.store = ResultsStore(path)
+
+    async def publish(self, fix):
+        self.store.add_fix(fix)
+
+    async def close(self):
+        self.store.close()
+
+
+class SocketSubscriber:
+    """Broadcast each fix as a JSON line to every client of a local (Unix) socket"""
+
+    def __init__(self, path):
+        self.path = path
+        self.clients = set()
+        self.server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._on_client, path=self.path)
+
+    async def _on_client(self, reader, writer):
+        self.clients.add(writer)
+        try:
+            await reader.read()  # hold the connection until the client leaves
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def publish(self, fix):
+        line = (json.dumps(fix) + '\n').encode()
+        for writer in list(self.clients):
+            try:
+                writer.write(line)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self.clients.discard(writer)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class FusionService:
+    """
+    Match incoming captures into groups (one per station, timestamps within
+    `tolerance` seconds) and solve each group the moment its last capture lands
+    """
+
+    def __init__(self, data_dir, stations=None, tolerance=0.5, max_age=60.0,
+                 workers=None, subscribers=(), track=False):
+        self.data_dir = data_dir
+        positions = ThreeStationTDOA(data_dir).station_positions
+        self.expected = set(stations or positions)
+        self.tolerance = tolerance
+        self.max_age = max_age
+        self.subscribers = list(subscribers)
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        
+        # Optional tracker: smooths the fix stream and warm-starts each solve
+        self.tracker = None
+        if track:
+            self.tracker = TrackBank(sum(p['lat'] for p in positions.values()) / len(positions),
+                                     sum(p['lon'] for p in positions.values()) / len(positions))
+
+        self.pending = []
+        self.fixes = 0
+        self._tasks = set()
+
+    async def ingest(self, station_id, timestamp, path, center_freq=None):
+        """Add one stored capture; dispatches its group if this completes it"""
+        arrived = time.time()
+        self._expire(arrived)
+
+        if station_id not in self.expected:
+            print(f"Ignoring capture from unknown station {station_id}")
+            return
+
+        group = None
+        for candidate in self.pending:
+            if (station_id not in candidate['captures'] and
+                    abs(candidate['timestamp'] - timestamp) <= self.tolerance):
+                group = candidate
+                break
+
+        if group is None:
+            group = {'timestamp': timestamp, 'center_freq': center_freq, 'captures': {}, 'arrived': {}}
+            self.pending.append(group)
+
+        group['captures'][station_id] = path
+        group['arrived'][station_id] = arrived
+
+        if set(group['captures']) == self.expected:
+            self.pending.remove(group)
+            task = asyncio.ensure_future(self._solve(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _expire(self, now):
+        """Drop groups that can no longer complete"""
+        for group in list(self.pending):
+            if now - max(group['arrived'].values()) > self.max_age:
+                self.pending.remove(group)
+                print(f"Dropping incomplete group at {group['timestamp']:.1f} "
+                      f"({', '.join(sorted(group['captures']))})")
+
+    async def _solve(self, group):
+        loop = asyncio.get_running_loop()
+        last_arrival = max(group['arrived'].values())
+
+        initial_position = None
+        if self.tracker is not None:
+            initial_position = self.tracker.predict(
+                self.tracker.key_for(group), group['timestamp'])
+
+        try:
+            fix = await loop.run_in_executor(self.pool, solve_capture_group,
+                                             self.data_dir, group['captures'], initial_position)
+        except Exception as e:
+            print(f"Solve failed for group at {group['timestamp']:.1f}: {e}")
+            return
+
+        now = time.time()
+        pos = fix['estimated_position']
+        fix['latency'] = {
+            'capture_to_fix': now - group['timestamp'],
+            'last_arrival_to_fix': now - last_arrival
+        }
+        self.fixes += 1
+        if self.tracker is not None and pos:
+            fix['track'] = self.tracker.update([fix])[0]
+
+        where = f"{pos['lat']:.6f}, {pos['lon']:.6f}" if pos else "no position (fewer than 3 stations)"
+        print(f"Fix {self.fixes}: {where} - capture-to-fix "
+              f"{fix['latency']['capture_to_fix']*1e3:.0f} ms, solve "
+              f"{fix['latency']['last_arrival_to_fix']*1e3:.0f} ms")
+
+        for subscriber in self.subscribers:
+            await subscriber.publish(fix)
+
+    def receiver_callback(self, loop):
+        """Bridge CaptureReceiver's handler threads into the event loop"""
+        def on_capture(capture, path):
+            asyncio.run_coroutine_threadsafe(
+                self.ingest(capture['station_id'], capture['timestamp'], path,
+                            capture.get('center_freq')), loop)
+        return on_capture
+
+    async def run(self, host='0.0.0.0', port=DEFAULT_PORT):
+        """Serve the station transport until cancelled"""
+        loop = asyncio.get_running_loop()
+        for subscriber in self.subscribers:
+            if hasattr(subscriber, 'start'):
+                await subscriber.start()
+
+        receiver = CaptureReceiver(self.data_dir, host=host, port=port,
+                                   on_capture=self.receiver_callback(loop)).start()
+        print(f"Fusion service listening on port {receiver.port}, "
+              f"expecting {', '.join(sorted(self.expected))}")
+
+        try:
+            while True:
+                await asyncio.sleep(1.0)
+                self._expire(time.time())
+        finally:
+            receiver.stop()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            for subscriber in self.subscribers:
+                await subscriber.close()
+            self.pool.shutdown()
+
+
+def main():
+    parser = ArgumentParser(description="Central TDOA fusion service")
+    parser.add_argument('data_dir', nargs='?', default='nice_data',
+                        help="Capture store the receiver writes into [default=%(default)r]")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help="Station transport port [default=%(default)r]")
+    parser.add_argument('--jsonl', default=None,
+                        help="Append fixes to this JSON lines file")
+    parser.add_argument('--db', default=None,
+                        help="Append fixes to this results store [default: <data_dir>/tdoa_results.db]")
+    parser.add_argument('--socket', default=None,
+                        help="Publish fixes to clients of this Unix socket")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Max capture timestamp spread within a group, seconds [default=%(default)r]")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Solver processes [default: CPU count]")
+    parser.add_argument('--track', action='store_true',
+                        help="Track emitters across fixes and warm-start each solve from the track")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    subscribers = [StoreSubscriber(args.db or os.path.join(args.data_dir, 'tdoa_results.db'))]
+    if args.jsonl:
+        subscribers.append(JsonlSubscriber(args.jsonl))
+    if args.socket:
+        subscribers.append(SocketSubscriber(args.socket))
+
+    service = FusionService(args.data_dir, tolerance=args.tolerance,
+                            workers=args.workers, subscribers=subscribers, track=args.track)
+    try:
+        asyncio.run(service.run(port=args.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Folium map layers for TDOA results
+TDOA hyperbolas for a single fix, computed for all pairs at once, and a
+campaign layer that bins the whole fix history into a density grid so the
+map stays the same size however many fixes the results store holds
+"""
+
+import numpy as np
+import folium
+from folium import plugins
+from tdoa_processor_three_stations import lat_lon_to_xy, xy_to_lat_lon
+
+PAIR_COLORS = ['purple', 'orange', 'darkblue', 'darkgreen', 'cadetblue', 'darkred', 'black', 'pink']
+
+
+def hyperbola_curves(station_xy, tdoa_pairs, ref_lat, ref_lon, c=299792458.0,
+                     extent_m=30000.0, n_points=256):
+    """
+    Locus of every measured TDOA: points P with |P - s1| - |P - s2| = c * tdoa.
+    Returns [{'pair', 'tdoa', 'locations': [[lat, lon], ...]}]; pairs whose
+    range difference exceeds the baseline (no real curve) are left out.
+    """
+    pairs = [(key, data) for key, data in tdoa_pairs.items()
+             if data['stations'][0] in station_xy and data['stations'][1] in station_xy]
+    if not pairs:
+        return []
+
+    s1 = np.array([station_xy[data['stations'][0]] for _, data in pairs], dtype=float)
+    s2 = np.array([station_xy[data['stations'][1]] for _, data in pairs], dtype=float)
+    tdoa = np.array([data['tdoa'] for _, data in pairs], dtype=float)
+
+    # Frame per pair: origin between the stations, u from s2 towards s1
+    centre = (s1 + s2) / 2
+    focus = np.linalg.norm(s1 - s2, axis=1) / 2
+    u = (s1 - s2) / focus[:, None] / 2
+    v = np.stack([-u[:, 1], u[:, 0]], axis=1)
+
+    a = c * tdoa / 2
+    valid = np.abs(a) < focus
+    b = np.sqrt(np.where(valid, focus**2 - a**2, 1.0))
+
+    # x = -a cosh(t), y = b sinh(t): the branch on s2's side for a positive TDOA
+    # (farther from s1); t is spaced so the curve reaches extent_m from the axis
+    t = np.linspace(-1.0, 1.0, n_points)[None, :] * np.arcsinh(extent_m / b)[:, None]
+    x = -a[:, None] * np.cosh(t)
+    y = b[:, None] * np.sinh(t)
+    points = centre[:, None, :] + x[..., None] * u[:, None, :] + y[..., None] * v[:, None, :]
+    lat, lon = xy_to_lat_lon(points[..., 0], points[..., 1], ref_lat, ref_lon)
+
+    return [{'pair': key, 'tdoa': float(data['tdoa']),
+             'locations': np.stack([lat[i], lon[i]], axis=1).round(6).tolist()}
+            for i, (key, data) in enumerate(pairs) if valid[i]]
+
+
+def add_hyperbolas(fmap, curves):
+    """Draw hyperbola_curves() output as a toggleable layer"""
+    layer = folium.FeatureGroup(name='TDOA hyperbolas')
+    for i, curve in enumerate(curves):
+        folium.PolyLine(
+            locations=curve['locations'],
+            color=PAIR_COLORS[i % len(PAIR_COLORS)],
+            weight=2,
+            opacity=0.8,
+            tooltip=f"{curve['pair']}: {curve['tdoa']*1e6:+.2f} μs"
+        ).add_to(layer)
+    layer.add_to(fmap)
+    return layer
+
+
+def density_grid(positions, cell_m=100.0, max_cells=20000, clip_percentile=1.0):
+    """
+    Bin fix positions ((n, 2) lat, lon) onto a cell_m grid with np.histogram2d.
+    The grid spans the central positions (clip_percentile trimmed from each
+    side, then padded) so a few wild fixes can't stretch it, and the densest
+    max_cells non-empty cells are kept. Returns (lat, lon, count) arrays and
+    the number of fixes that fell outside the grid.
+    """
+    if len(positions) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0, dtype=int), 0
+
+    lat, lon = positions[:, 0], positions[:, 1]
+    ref_lat, ref_lon = np.median(lat), np.median(lon)
+    xy = lat_lon_to_xy(lat, lon, ref_lat, ref_lon)
+
+    lo = np.percentile(xy, clip_percentile, axis=1)
+    hi = np.percentile(xy, 100 - clip_percentile, axis=1)
+    pad = np.maximum(0.1 * (hi - lo), cell_m)
+    lo, hi = lo - pad, hi + pad
+    bins = np.clip(np.ceil((hi - lo) / cell_m), 1, 4096).astype(int)
+
+    counts, x_edges, y_edges = np.histogram2d(xy[0], xy[1], bins=bins, range=[[lo[0], hi[0]], [lo[1], hi[1]]])
+    outside = len(positions) - int(counts.sum())
+
+    i, j = np.nonzero(counts)
+    cell_counts = counts[i, j].astype(int)
+    if len(cell_counts) > max_cells:
+        keep = np.argpartition(cell_counts, -max_cells)[-max_cells:]
+        i, j, cell_counts = i[keep], j[keep], cell_counts[keep]
+
+    x = (x_edges[i] + x_edges[i + 1]) / 2
+    y = (y_edges[j] + y_edges[j + 1]) / 2
+    cell_lat, cell_lon = xy_to_lat_lon(x, y, ref_lat, ref_lon)
+    return cell_lat, cell_lon, cell_counts, outside
+
+
+def add_campaign_layers(fmap, positions, cell_m=100.0, max_cells=20000, max_markers=200):
+    """
+    Heatmap of the binned fix density plus a marker layer for the densest
+    cells. The HTML grows with the number of occupied cells (at most
+    max_cells), not with the number of fixes.
+    """
+    cell_lat, cell_lon, counts, outside = density_grid(positions, cell_m, max_cells)
+    if not len(counts):
+        return {'fixes': 0, 'cells': 0, 'outside': 0}
+
+    peak = counts.max()
+    plugins.HeatMap(
+        np.stack([cell_lat.round(6), cell_lon.round(6), counts / peak], axis=1).tolist(),
+        name=f'Fix density ({len(positions)} fixes)',
+        min_opacity=0.3,
+        radius=15,
+        blur=10
+    ).add_to(fmap)
+
+    layer = folium.FeatureGroup(name=f'Densest {min(max_markers, len(counts))} cells')
+    for k in np.argsort(counts)[::-1][:max_markers]:
+        folium.CircleMarker(
+            location=[float(cell_lat[k]), float(cell_lon[k])],
+            radius=float(3 + 12 * np.sqrt(counts[k] / peak)),
+            color='red',
+            fill=True,
+            fill_opacity=0.6,
+            weight=1,
+            tooltip=f"{counts[k]} fixes"
+        ).add_to(layer)
+    layer.add_to(fmap)
+
+    return {'fixes': len(positions), 'cells': len(counts), 'outside': outside,
+            'peak_lat': float(cell_lat[np.argmax(counts)]), 'peak_lon': float(cell_lon[np.argmax(counts)])}
+
+
+def create_campaign_map(store, output_file, station_positions=None, cell_m=100.0,
+                        max_cells=20000, max_markers=200, **filters):
+    """Map of every stored fix matching filters (see ResultsStore.positions)"""
+    positions = store.positions(**filters)
+    centre = np.median(positions, axis=0).tolist() if len(positions) else [41.2565, -96.0244]
+    fmap = folium.Map(location=centre, zoom_start=11)
+
+    for stat_id, pos in (station_positions or {}).items():
+        folium.Marker(
+            location=[pos['lat'], pos['lon']],
+            popup=f"<b>{stat_id}</b><br>{pos['name']}",
+            icon=folium.Icon(color=pos['color'], icon='wifi', prefix='fa')
+        ).add_to(fmap)
+
+    stats = add_campaign_layers(fmap, positions, cell_m, max_cells, max_markers)
+    folium.LayerControl().add_to(fmap)
+    fmap.save(output_file)
+    return stats
+
+
+def main():
+    from argparse import ArgumentParser
+    from results_store import ResultsStore, parse_time
+    from tdoa_processor_three_stations import ThreeStationTDOA
+
+    parser = ArgumentParser(description="Campaign map: density of every stored TDOA fix")
+    parser.add_argument('db', nargs='?', default='nice_data/tdoa_results.db',
+                        help="Results database [default=%(default)r]")
+    parser.add_argument('-o', '--output', default='tdoa_campaign_map.html',
+                        help="Output HTML file [default=%(default)r]")
+    parser.add_argument('--start', type=parse_time, default=None,
+                        help="Earliest capture time (unix seconds or ISO)")
+    parser.add_argument('--end', type=parse_time, default=None,
+                        help="Latest capture time, exclusive (unix seconds or ISO)")
+    parser.add_argument('--channel', type=float, default=None,
+                        help="Channel centre frequency in MHz")
+    parser.add_argument('--cell', type=float, default=100.0,
+                        help="Density grid cell size in m [default=%(default)r]")
+    parser.add_argument('--max-cells', type=int, default=20000,
+                        help="Most grid cells drawn in the heatmap [default=%(default)r]")
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        stats = create_campaign_map(store, args.output, ThreeStationTDOA().station_positions,
+                                    cell_m=args.cell, max_cells=args.max_cells,
+                                    start=args.start, end=args.end,
+                                    center_freq=args.channel * 1e6 if args.channel else None)
+
+    print(f"{stats['fixes']} fixes in {stats['cells']} cells of {args.cell:g} m "
+          f"({stats['outside']} outliers off the grid) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
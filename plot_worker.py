@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Background rendering of the TDOA analysis plots
+The processor reduces each fix to a compact payload (peak-windowed, decimated
+correlation traces and the fix summary) and a worker process draws it, so
+fixes are saved without waiting on matplotlib.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+
+def decimate_peaks(values, max_points):
+    """Indices of values keeping the largest sample of each of (at most) max_points buckets"""
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    bucket = -(-n // max_points)
+    padded = np.full(bucket * (-(-n // bucket)), -np.inf)
+    padded[:n] = values
+    return np.argmax(padded.reshape(-1, bucket), axis=1) + np.arange(0, len(padded), bucket)
+
+
+def correlation_trace(data, window_s=200e-6, max_points=2000):
+    """
+    (time_us, magnitude) of a pair's correlation within +/- window_s of its
+    peak, on the clock-corrected TDOA axis, decimated to at most max_points
+    """
+    correlation, lags, rate = data['correlation'], data['lags'], data['sample_rate']
+    peak = int(np.argmax(np.abs(correlation)))
+    half = max(int(window_s * rate), 64)
+    lo, hi = max(peak - half, 0), min(peak + half + 1, len(correlation))
+
+    magnitude = np.abs(correlation[lo:hi])
+    keep = decimate_peaks(magnitude, max_points)
+    # Shift raw lags by the clock correction so the peak sits at the TDOA
+    shift = data['tdoa'] - data.get('lag_delay', data['tdoa'])
+    time_us = (lags[lo:hi][keep] / rate + shift) * 1e6
+    return time_us.astype(np.float32), magnitude[keep].astype(np.float32)
+
+
+def plot_payload(processor, window_s=200e-6, max_points=2000):
+    """Everything the plots need from a processor, small enough to send to a worker"""
+    stations = {stat_id: processor.station_positions[stat_id]
+                for stat_id in processor.station_data if stat_id in processor.station_positions}
+    first = next(iter(processor.station_data.values()))
+
+    payload = {
+        'data_dir': processor.data_dir,
+        'stations': stations,
+        'actual_tx': dict(processor.actual_tx),
+        'sample_rate': first['sample_rate'],
+        'center_freq': first['center_freq'],
+        'pairs': [],
+        'estimated_position': None
+    }
+    for pair_key, data in processor.tdoa_pairs.items():
+        time_us, magnitude = correlation_trace(data, window_s, max_points)
+        payload['pairs'].append({
+            'pair': pair_key,
+            'tdoa': float(data['tdoa']),
+            'peak_value': float(data['peak_value']),
+            'time_us': time_us,
+            'magnitude': magnitude
+        })
+
+    position = getattr(processor, 'estimated_position', None)
+    if position:
+        payload['estimated_position'] = {k: float(position[k]) for k in ('lat', 'lon', 'error_meters')}
+    return payload
+
+
+def _save(fig, base_path, dpi, formats):
+    paths = []
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+        paths.append(path)
+    plt.close(fig)
+    return paths
+
+
+def render_correlations(payload, dpi=150, formats=('png',)):
+    """Cross-correlation of every pair around its peak"""
+    pairs = payload['pairs']
+    fig, axes = plt.subplots(len(pairs), 1, figsize=(12, 4 * len(pairs)), squeeze=False)
+
+    for ax, pair in zip(axes[:, 0], pairs):
+        ax.plot(pair['time_us'], pair['magnitude'], 'b-', alpha=0.7)
+
+        peak_time = pair['tdoa'] * 1e6
+        ax.axvline(x=peak_time, color='r', linestyle='--', linewidth=2,
+                   label=f'Peak: {peak_time:.2f} μs')
+
+        ax.set_xlabel('Time Difference (μs)')
+        ax.set_ylabel('Correlation')
+        ax.set_title(f'Cross-Correlation: {pair["pair"]} (Quality: {pair["peak_value"]:.3f})')
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+
+    fig.tight_layout()
+    return _save(fig, os.path.join(payload['data_dir'], 'correlation_analysis'), dpi, formats)
+
+
+def render_analysis(payload, dpi=150, formats=('png',)):
+    """Geographic view of the fix and bar chart of the TDOAs"""
+    estimate, actual = payload['estimated_position'], payload['actual_tx']
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
+
+    # Left plot: Geographic view
+    ax1.set_title('TDOA Direction Finding Results\nGeographic View', fontsize=14, fontweight='bold')
+
+    for stat_id, pos in payload['stations'].items():
+        ax1.scatter(pos['lon'], pos['lat'], s=200, c=pos['color'],
+                    marker='^', edgecolor='black', linewidth=2, zorder=5,
+                    label=f"{stat_id} ({pos['name']})")
+        ax1.text(pos['lon'], pos['lat'] - 0.01, stat_id, ha='center', fontsize=8)
+        ax1.plot([pos['lon'], estimate['lon']], [pos['lat'], estimate['lat']],
+                 'gray', alpha=0.3, linestyle='--', linewidth=1)
+
+    ax1.scatter(estimate['lon'], estimate['lat'], s=300, c='red', marker='*', edgecolor='black',
+                linewidth=2, zorder=6, label='Estimated Position')
+    ax1.scatter(actual['lon'], actual['lat'], s=300, c='green', marker='o', edgecolor='black',
+                linewidth=2, zorder=6, label=f"Actual {actual['name']}")
+    ax1.plot([estimate['lon'], actual['lon']], [estimate['lat'], actual['lat']],
+             'red', linewidth=2, label=f"Error: {estimate['error_meters']:.1f}m")
+
+    ax1.set_xlabel('Longitude')
+    ax1.set_ylabel('Latitude')
+    ax1.grid(True, alpha=0.3)
+    ax1.legend(loc='best')
+    ax1.set_aspect(1 / np.cos(np.radians(estimate['lat'])))
+
+    # Right plot: TDOA measurements
+    ax2.set_title('TDOA Measurements\nTime Differences', fontsize=14, fontweight='bold')
+
+    pairs = payload['pairs']
+    x = np.arange(len(pairs))
+    bars = ax2.bar(x, [pair['tdoa'] * 1e6 for pair in pairs], color=['blue', 'green', 'red'][:len(pairs)])
+    for bar, pair in zip(bars, pairs):
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width() / 2., height, f"{pair['peak_value']:.2f}",
+                 ha='center', va='bottom' if height > 0 else 'top')
+
+    ax2.set_xlabel('Station Pairs')
+    ax2.set_ylabel('Time Difference (μs)')
+    ax2.set_xticks(x)
+    ax2.set_xticklabels([pair['pair'] for pair in pairs], rotation=45)
+    ax2.grid(True, alpha=0.3, axis='y')
+    ax2.axhline(y=0, color='black', linewidth=0.5)
+
+    info_text = (
+        f"Sample Rate: {payload['sample_rate']/1e6:.3f} MHz\n"
+        f"Center Freq: {payload['center_freq']/1e6:.3f} MHz\n"
+        f"Position Error: {estimate['error_meters']:.1f} meters"
+    )
+    ax2.text(0.02, 0.98, info_text, transform=ax2.transAxes,
+             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5),
+             verticalalignment='top', fontsize=10)
+
+    fig.tight_layout()
+    return _save(fig, os.path.join(payload['data_dir'], 'tdoa_analysis_results'), dpi, formats)
+
+
+def render(payload, dpi=150, formats=('png',)):
+    """All plots for one payload; returns the files written"""
+    paths = []
+    if payload['pairs']:
+        paths += render_correlations(payload, dpi, formats)
+    if payload['estimated_position']:
+        paths += render_analysis(payload, dpi, formats)
+    return paths
+
+
+class PlotRenderer:
+    """A single background process drawing plot payloads in submission order"""
+
+    def __init__(self, dpi=150, formats=('png',)):
+        self.dpi = dpi
+        self.formats = tuple(formats)
+        # Spawned, not forked: by the time the first plot is queued the parent
+        # has scipy.fft worker threads running, and a forked child can inherit
+        # their locks held
+        self._pool = ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'))
+        self._pending = []
+
+    def submit(self, payload):
+        """Queue a payload; returns a Future of the written file paths"""
+        future = self._pool.submit(render, payload, self.dpi, self.formats)
+        self._pending.append(future)
+        return future
+
+    def wait(self):
+        """Block until every queued plot is written; returns their paths"""
+        pending, self._pending = self._pending, []
+        return [path for future in pending for path in future.result()]
+
+    def close(self):
+        """Wait for the queued plots, then stop the worker; returns their paths"""
+        paths = self.wait()
+        self._pool.shutdown()
+        return paths
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Content-addressed result cache for the TDOA processor
+Results are keyed on capture content hashes plus processing parameters and
+evicted least-recently-used once the cache exceeds its size budget
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from capture_format import SIDECAR_SUFFIX
+
+
+class ResultCache:
+    """Size-bounded on-disk cache of pickled results"""
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024**2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # File digests are memoised on (size, mtime) so unchanged captures are hashed once
+        self._digest_index_path = os.path.join(cache_dir, 'file_digests.json')
+        try:
+            with open(self._digest_index_path) as f:
+                self._digests = json.load(f)
+        except (OSError, ValueError):
+            self._digests = {}
+
+        self._total_bytes = sum(os.path.getsize(p) for p in self._entries())
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pkl'):
+                    yield os.path.join(root, name)
+
+    def file_digest(self, filepath):
+        """SHA-256 of a file's content (memoised on size and mtime)"""
+        st = os.stat(filepath)
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = self._digests.get(os.path.abspath(filepath))
+        if entry is not None and entry['stamp'] == stamp:
+            return entry['digest']
+
+        h = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+
+        self._digests[os.path.abspath(filepath)] = {'stamp': stamp, 'digest': digest}
+        tmp_path = self._digest_index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._digests, f)
+        os.replace(tmp_path, self._digest_index_path)
+        return digest
+
+    def capture_digest(self, filepath):
+        """Digest of a capture, covering a sidecar's raw array files as well"""
+        if not filepath.endswith(SIDECAR_SUFFIX):
+            return self.file_digest(filepath)
+
+        with open(filepath) as f:
+            arrays = json.load(f).get('arrays', {})
+        parts = [self.file_digest(filepath)]
+        for name in sorted(arrays):
+            parts.append(self.file_digest(os.path.join(os.path.dirname(filepath), arrays[name]['file'])))
+        return hashlib.sha256(''.join(parts).encode()).hexdigest()
+
+    @staticmethod
+    def key(kind, *parts):
+        """Cache key for a result kind and its JSON-serialisable inputs"""
+        blob = json.dumps([kind, parts], sort_keys=True, default=repr)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        self._total_bytes += os.path.getsize(path) - old_size
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Delete least-recently-used entries until back under the size budget"""
+        entries = sorted(self._entries(), key=lambda p: os.stat(p).st_mtime)
+        for path in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._total_bytes -= size
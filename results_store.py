@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Append-only SQLite store for TDOA fixes
+Every fix, with its per-pair TDOAs, qualities, sigmas and position uncertainty, is
+appended in one transaction; history is queried by time, channel and station set
+"""
+
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixes (
+    id INTEGER PRIMARY KEY,
+    capture_time REAL,
+    stored_at REAL NOT NULL,
+    center_freq REAL,
+    station_set TEXT NOT NULL,
+    lat REAL,
+    lon REAL,
+    optimization_error REAL,
+    success INTEGER,
+    error_meters REAL,
+    sigma_x_m REAL,
+    sigma_y_m REAL,
+    semi_major_m REAL,
+    semi_minor_m REAL,
+    orientation_deg REAL,
+    snr_db REAL,
+    files TEXT
+);
+CREATE TABLE IF NOT EXISTS tdoa (
+    fix_id INTEGER NOT NULL REFERENCES fixes(id),
+    pair TEXT NOT NULL,
+    station1 TEXT NOT NULL,
+    station2 TEXT NOT NULL,
+    tdoa REAL NOT NULL,
+    quality REAL,
+    sigma REAL,
+    weight REAL
+);
+CREATE INDEX IF NOT EXISTS fixes_time ON fixes(capture_time);
+CREATE INDEX IF NOT EXISTS fixes_channel_time ON fixes(center_freq, capture_time);
+CREATE INDEX IF NOT EXISTS fixes_stations_time ON fixes(station_set, capture_time);
+CREATE INDEX IF NOT EXISTS tdoa_fix ON tdoa(fix_id);
+"""
+
+# estimated_position keys stored as fixes columns
+POSITION_COLUMNS = ('lat', 'lon', 'optimization_error', 'success', 'error_meters',
+                    'sigma_x_m', 'sigma_y_m', 'semi_major_m', 'semi_minor_m', 'orientation_deg')
+
+
+def _real(value):
+    """Plain float for SQLite (numpy scalars would be stored as blobs)"""
+    return None if value is None else float(value)
+
+
+class ResultsStore:
+    """Append-only fix history (fix summaries in, fix summaries out)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets queries run while a service keeps appending
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        # Databases written before per-pair sigmas were stored
+        columns = [row['name'] for row in self.conn.execute('PRAGMA table_info(tdoa)')]
+        if 'sigma' not in columns:
+            self.conn.execute('ALTER TABLE tdoa ADD COLUMN sigma REAL')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_fix(self, summary):
+        """Append one fix summary; returns its row id"""
+        return self.add_fixes([summary])[0]
+
+    def add_fixes(self, summaries):
+        """Append a batch of fix summaries in a single transaction"""
+        stored_at = time.time()
+        ids = []
+
+        with self.conn:
+            for summary in summaries:
+                position = summary.get('estimated_position') or {}
+                row = {
+                    'capture_time': _real(summary.get('timestamp')),
+                    'stored_at': stored_at,
+                    'center_freq': _real(summary.get('center_freq')),
+                    'station_set': ','.join(sorted(summary.get('stations', []))),
+                    'snr_db': _real(summary.get('snr_db')),
+                    'files': json.dumps(summary.get('files', {}))
+                }
+                row.update({column: _real(position.get(column)) for column in POSITION_COLUMNS})
+                if position:
+                    row['success'] = int(bool(position.get('success')))
+
+                cursor = self.conn.execute(
+                    f"INSERT INTO fixes ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                    list(row.values()))
+                fix_id = cursor.lastrowid
+
+                self.conn.executemany(
+                    "INSERT INTO tdoa (fix_id, pair, station1, station2, tdoa, quality, sigma, weight) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(fix_id, pair, data['stations'][0], data['stations'][1],
+                      _real(data['tdoa']), _real(data.get('quality')), _real(data.get('sigma')),
+                      _real(data.get('weight', 1.0)))
+                     for pair, data in summary.get('tdoa', {}).items()])
+                ids.append(fix_id)
+
+        return ids
+
+    @staticmethod
+    def _where(start=None, end=None, center_freq=None, stations=None, freq_tolerance=1.0):
+        """WHERE clause and parameters for a time range, channel and station set"""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('capture_time >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('capture_time < ?')
+            params.append(end)
+        if center_freq is not None:
+            clauses.append('center_freq BETWEEN ? AND ?')
+            params += [center_freq - freq_tolerance, center_freq + freq_tolerance]
+        if stations is not None:
+            clauses.append('station_set = ?')
+            params.append(','.join(sorted(stations)))
+        return clauses, params
+
+    def query(self, start=None, end=None, center_freq=None, stations=None,
+              freq_tolerance=1.0, limit=None, with_tdoa=True):
+        """Fixes (as fix summaries, oldest first) matching a time range, channel and station set"""
+        clauses, params = self._where(start, end, center_freq, stations, freq_tolerance)
+
+        sql = 'SELECT * FROM fixes'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY capture_time, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+
+        fixes = [self._summary(row) for row in self.conn.execute(sql, params)]
+
+        if with_tdoa and fixes:
+            by_id = {fix['id']: fix for fix in fixes}
+            # Chunked to stay under SQLite's bound-parameter limit
+            ids = list(by_id)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT * FROM tdoa WHERE fix_id IN ({', '.join('?' * len(chunk))})", chunk)
+                for row in rows:
+                    by_id[row['fix_id']]['tdoa'][row['pair']] = {
+                        'stations': [row['station1'], row['station2']],
+                        'tdoa': row['tdoa'],
+                        'quality': row['quality'],
+                        'sigma': row['sigma'],
+                        'weight': row['weight']
+                    }
+
+        return fixes
+
+    @staticmethod
+    def _summary(row):
+        position = None
+        if row['lat'] is not None:
+            position = {column: row[column] for column in POSITION_COLUMNS if row[column] is not None}
+            position['success'] = bool(position.get('success'))
+
+        return {
+            'id': row['id'],
+            'timestamp': row['capture_time'],
+            'stored_at': row['stored_at'],
+            'center_freq': row['center_freq'],
+            'stations': row['station_set'].split(',') if row['station_set'] else [],
+            'files': json.loads(row['files']) if row['files'] else {},
+            'snr_db': row['snr_db'],
+            'tdoa': {},
+            'estimated_position': position
+        }
+
+    def positions(self, start=None, end=None, center_freq=None, stations=None, freq_tolerance=1.0):
+        """(n, 2) array of lat, lon of the successful fixes matching the filters"""
+        clauses, params = self._where(start, end, center_freq, stations, freq_tolerance)
+        clauses += ['lat IS NOT NULL', 'success = 1']
+        rows = self.conn.execute(f"SELECT lat, lon FROM fixes WHERE {' AND '.join(clauses)}", params)
+        return np.array(rows.fetchall(), dtype=float).reshape(-1, 2)
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM fixes').fetchone()[0]
+
+
+def parse_time(value):
+    """Unix seconds or an ISO date/time"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Query the TDOA fix history")
+    parser.add_argument('db', nargs='?', default='nice_data/tdoa_results.db',
+                        help="Results database [default=%(default)r]")
+    parser.add_argument('--start', type=parse_time, default=None,
+                        help="Earliest capture time (unix seconds or ISO, e.g. 2025-06-01)")
+    parser.add_argument('--end', type=parse_time, default=None,
+                        help="Latest capture time, exclusive (unix seconds or ISO)")
+    parser.add_argument('--channel', type=float, default=None,
+                        help="Channel centre frequency in MHz")
+    parser.add_argument('--stations', nargs='+', default=None,
+                        help="Exact station set, e.g. station1 station2 station3")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="Maximum number of fixes")
+    parser.add_argument('--jsonl', action='store_true',
+                        help="Print full fixes (with per-pair TDOAs) as JSON lines")
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        fixes = store.query(args.start, args.end,
+                            center_freq=args.channel * 1e6 if args.channel else None,
+                            stations=args.stations, limit=args.limit, with_tdoa=args.jsonl)
+
+        if args.jsonl:
+            for fix in fixes:
+                sys.stdout.write(json.dumps(fix) + '\n')
+            return
+
+        print(f"{len(fixes)} of {store.count()} fixes")
+        for fix in fixes:
+            when = datetime.fromtimestamp(fix['timestamp']).isoformat(sep=' ', timespec='seconds') \
+                if fix['timestamp'] is not None else '-'
+            freq = f"{fix['center_freq']/1e6:.3f} MHz" if fix['center_freq'] else '-'
+            pos = fix['estimated_position']
+            if pos:
+                where = f"{pos['lat']:.6f}, {pos['lon']:.6f}"
+                if 'semi_major_m' in pos:
+                    where += f" (+/- {pos['semi_major_m']:.0f} x {pos['semi_minor_m']:.0f} m)"
+            else:
+                where = 'no position'
+            print(f"  {when}  {freq}  {','.join(fix['stations'])}  {where}")
+
+
+if __name__ == "__main__":
+    main()
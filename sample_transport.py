@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Framed TCP transport for station captures
+Stations stream capture chunks plus metadata; the central receiver writes them
+straight into the processor's capture directory as sidecar captures
+"""
+
+import numpy as np
+import json
+import math
+import os
+import re
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import zlib
+from capture_format import SidecarWriter
+
+DEFAULT_PORT = 5555
+
+# Frame: magic, version, message type, flags, metadata length, payload length
+FRAME_HEADER = struct.Struct('!4sBBHIQ')
+MAGIC = b'TDOA'
+VERSION = 1
+
+MSG_BEGIN = 1   # capture metadata and array layout
+MSG_CHUNK = 2   # one slice of one array
+MSG_END = 3     # capture complete
+MSG_ACK = 4     # receiver -> sender
+
+FLAG_COMPRESSED = 0x1
+
+# Arrays streamed from a collector capture dict; everything else is metadata
+CAPTURE_ARRAYS = ('samples', 'ref_samples')
+
+# Limits on what a peer may send, checked before anything is allocated or written
+MAX_META_BYTES = 1 << 20
+MAX_PAYLOAD_BYTES = 1 << 26
+MAX_ARRAY_SAMPLES = 1 << 28  # 2 GiB of complex64
+STATION_ID = re.compile(r'station\d+')
+
+
+def _json_safe(value):
+    """Metadata values as plain JSON types (numpy scalars, nested dicts)"""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def send_frame(sock, msg_type, meta=None, payload=None, flags=0):
+    """Send one frame; payload may be any buffer and is sent without copying"""
+    meta_bytes = json.dumps(meta or {}).encode()
+    payload_len = 0 if payload is None else memoryview(payload).nbytes
+    sock.sendall(FRAME_HEADER.pack(MAGIC, VERSION, msg_type, flags, len(meta_bytes), payload_len) + meta_bytes)
+    if payload_len:
+        sock.sendall(payload)
+
+
+def recv_exact(sock, size, buffer=None):
+    """Receive exactly size bytes, into a reusable buffer when one is given"""
+    if buffer is None or len(buffer) < size:
+        buffer = bytearray(size)
+    view = memoryview(buffer)[:size]
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Connection closed mid-frame")
+        received += n
+    return view
+
+
+def recv_frame(sock, buffer=None):
+    """Receive one frame: (msg_type, flags, meta, payload memoryview)"""
+    header = recv_exact(sock, FRAME_HEADER.size)
+    magic, version, msg_type, flags, meta_len, payload_len = FRAME_HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Bad frame header {magic!r} v{version}")
+    if meta_len > MAX_META_BYTES or payload_len > MAX_PAYLOAD_BYTES:
+        raise ValueError(f"Oversized frame ({meta_len} metadata, {payload_len} payload bytes)")
+
+    meta = json.loads(bytes(recv_exact(sock, meta_len))) if meta_len else {}
+    payload = recv_exact(sock, payload_len, buffer) if payload_len else None
+    return msg_type, flags, meta, payload
+
+
+class SampleSender:
+    """Station side: stream captures to the central receiver"""
+
+    def __init__(self, host, port=DEFAULT_PORT, compress=False, chunk_bytes=1 << 20,
+                 window=8, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.compress = compress
+        self.chunk_bytes = chunk_bytes
+        # Chunks allowed in flight before waiting for the receiver's acks
+        self.window = window
+        self.timeout = timeout
+        self.sock = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _wait_ack(self):
+        msg_type, _, meta, _ = recv_frame(self.sock)
+        if msg_type != MSG_ACK:
+            raise ValueError(f"Expected ACK, got message type {msg_type}")
+        if 'error' in meta:
+            raise ValueError(f"Receiver rejected the capture: {meta['error']}")
+        return meta
+
+    def send_capture(self, data):
+        """Stream one capture dict (as returned by TDOACollector.collect_samples)"""
+        if self.sock is None:
+            self.connect()
+
+        arrays = {name: np.ascontiguousarray(data[name], dtype=np.complex64)
+                  for name in CAPTURE_ARRAYS if data.get(name) is not None}
+        meta = _json_safe({k: v for k, v in data.items() if k not in CAPTURE_ARRAYS})
+        meta['arrays'] = {name: {'dtype': 'complex64', 'count': len(arr)} for name, arr in arrays.items()}
+        meta['sent_at'] = time.time()
+
+        send_frame(self.sock, MSG_BEGIN, meta)
+
+        in_flight = 0
+        sent_bytes = 0
+        for name, arr in arrays.items():
+            view = memoryview(arr).cast('B')
+            for offset in range(0, len(view), self.chunk_bytes):
+                piece = view[offset:offset + self.chunk_bytes]
+                flags = 0
+                if self.compress:
+                    piece = zlib.compress(piece, 1)
+                    flags = FLAG_COMPRESSED
+
+                send_frame(self.sock, MSG_CHUNK, {'array': name, 'offset': offset}, piece, flags)
+                sent_bytes += len(piece)
+                in_flight += 1
+
+                # Backpressure: never run more than `window` chunks ahead of the receiver
+                while in_flight >= self.window:
+                    in_flight -= self._wait_ack().get('chunks', 1)
+
+        send_frame(self.sock, MSG_END, {'sent_bytes': sent_bytes})
+        while True:
+            ack = self._wait_ack()
+            if 'path' in ack:
+                ack['sent_bytes'] = sent_bytes
+                return ack
+
+
+def validate_begin(meta):
+    """
+    Check a BEGIN frame before its fields reach the filesystem: they name the
+    output files, so only station<N> ids, finite timestamps and the known
+    complex64 arrays (with a bounded size) are accepted. Raises ValueError.
+    """
+    station_id = meta.get('station_id')
+    if not isinstance(station_id, str) or not STATION_ID.fullmatch(station_id):
+        raise ValueError(f"Bad station_id {station_id!r}")
+
+    timestamp = meta.get('timestamp')
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)) or not math.isfinite(timestamp):
+        raise ValueError(f"Bad timestamp {timestamp!r}")
+
+    arrays = meta.get('arrays')
+    if not isinstance(arrays, dict) or not arrays:
+        raise ValueError("No arrays declared")
+    for name, layout in arrays.items():
+        if name not in CAPTURE_ARRAYS:
+            raise ValueError(f"Unknown array {name!r}")
+        if not isinstance(layout, dict) or layout.get('dtype') != 'complex64':
+            raise ValueError(f"Bad layout for array {name!r}: {layout!r}")
+        count = layout.get('count')
+        if isinstance(count, bool) or not isinstance(count, int) or not 0 <= count <= MAX_ARRAY_SAMPLES:
+            raise ValueError(f"Bad sample count for array {name!r}: {count!r}")
+    return meta
+
+
+def chunk_bytes(payload, flags, limit):
+    """A chunk's array bytes, refusing any that would run past limit (compressed or not)"""
+    if not flags & FLAG_COMPRESSED:
+        if len(payload) > limit:
+            raise ValueError("Chunk runs past the end of its array")
+        return payload
+
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, limit)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt compressed chunk: {e}")
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("Chunk runs past the end of its array")
+    return data
+
+
+class _CaptureHandler(socketserver.BaseRequestHandler):
+
+    def setup(self):
+        self.writer = None
+
+    def handle(self):
+        try:
+            self._receive()
+        except ValueError as e:
+            # Malformed or hostile stream: report it and drop the connection
+            print(f"Rejected capture stream from {self.client_address[0]}: {e}")
+            try:
+                send_frame(self.request, MSG_ACK, {'error': str(e)})
+            except OSError:
+                pass
+        finally:
+            # A capture the peer never finished leaves no files behind
+            if self.writer is not None:
+                self.writer.abort()
+                self.writer = None
+
+    def _receive(self):
+        receiver = self.server.receiver
+        sock = self.request
+        buffer = bytearray(1 << 20)
+
+        while True:
+            try:
+                msg_type, flags, meta, payload = recv_frame(sock, buffer)
+            except ConnectionError:
+                return
+
+            if msg_type == MSG_BEGIN:
+                if self.writer is not None:
+                    raise ValueError("BEGIN before the previous capture ended")
+                capture = validate_begin(meta)
+                capture['begin_at'] = time.time()
+                base = os.path.join(receiver.data_dir,
+                                    f"tdoa_{capture['station_id']}_{int(capture['timestamp'])}")
+                self.writer = SidecarWriter(base)
+                written = {name: 0 for name in capture['arrays']}
+                received_bytes = 0
+
+            elif msg_type == MSG_CHUNK:
+                if self.writer is None:
+                    raise ValueError("CHUNK outside a capture")
+                name = meta.get('array')
+                if name not in written:
+                    raise ValueError(f"Chunk for undeclared array {name!r}")
+                if meta.get('offset') != written[name]:
+                    raise ValueError(f"Chunk of {name!r} out of order at offset {meta.get('offset')!r}")
+
+                layout = capture['arrays'][name]
+                limit = layout['count'] * np.dtype(layout['dtype']).itemsize - written[name]
+                received_bytes += len(payload or b'')
+                data = chunk_bytes(payload or b'', flags, limit)
+                self.writer.write(name, data, layout['dtype'])
+                written[name] += len(data)
+                send_frame(sock, MSG_ACK, {'chunks': 1})
+
+            elif msg_type == MSG_END:
+                if self.writer is None:
+                    raise ValueError("END outside a capture")
+                for name, layout in capture['arrays'].items():
+                    if written[name] != layout['count'] * np.dtype(layout['dtype']).itemsize:
+                        raise ValueError(f"Array {name!r} incomplete at END")
+
+                stored_at = time.time()
+                capture.pop('arrays', None)
+                capture['received_at'] = stored_at
+                capture['transfer_time'] = stored_at - capture['begin_at']
+                capture['received_bytes'] = received_bytes
+                path = self.writer.close(capture)
+                self.writer = None
+
+                latency = stored_at - capture['timestamp']
+                receiver.record(capture, path, latency)
+                send_frame(sock, MSG_ACK, {'path': path, 'latency': latency,
+                                           'transfer_time': capture['transfer_time']})
+
+            else:
+                raise ValueError(f"Unexpected message type {msg_type}")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class CaptureReceiver:
+    """Central side: accept station streams and store them as sidecar captures"""
+
+    def __init__(self, data_dir, host='0.0.0.0', port=DEFAULT_PORT, on_capture=None):
+        self.data_dir = data_dir
+        self.on_capture = on_capture
+        self.latencies = []
+        self._lock = threading.Lock()
+        os.makedirs(data_dir, exist_ok=True)
+
+        self.server = _ThreadingServer((host, port), _CaptureHandler)
+        self.server.receiver = self
+        self.port = self.server.server_address[1]
+        self._thread = None
+
+    def record(self, capture, path, latency):
+        with self._lock:
+            self.latencies.append(latency)
+        print(f"Stored {os.path.basename(path)} from {capture['station_id']}: "
+              f"capture-to-store {latency*1e3:.1f} ms, transfer {capture['transfer_time']*1e3:.1f} ms")
+        if self.on_capture is not None:
+            self.on_capture(capture, path)
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def send_capture_file(filepath, host, port=DEFAULT_PORT, compress=False):
+    """Send an existing .npz capture to the receiver"""
+    data = dict(np.load(filepath))
+    for key, value in data.items():
+        if value.ndim == 0:
+            data[key] = value.item()
+    for key in ('integrity', 'detection'):
+        if isinstance(data.get(key), str):
+            data[key] = json.loads(data[key])
+    with SampleSender(host, port, compress=compress) as sender:
+        return sender.send_capture(data)
+
+
+def run_loopback(duration=2.0, compress=False, data_dir=None):
+    """Run both ends over localhost with a synthetic capture and report latency"""
+    import tempfile
+    data_dir = data_dir or tempfile.mkdtemp(prefix='tdoa_transport_')
+    receiver = CaptureReceiver(data_dir, host='127.0.0.1', port=0).start()
+
+    rng = np.random.default_rng(0)
+    n = int(2.048e6 * duration)
+    data = {
+        'station_id': 'station1',
+        'timestamp': time.time(),
+        'samples': (rng.normal(size=n) + 1j * rng.normal(size=n)).astype(np.complex64),
+        'sample_rate': 2.048e6,
+        'center_freq': 162.4e6,
+        'ref_freq': None
+    }
+
+    with SampleSender('127.0.0.1', receiver.port, compress=compress) as sender:
+        t0 = time.perf_counter()
+        ack = sender.send_capture(data)
+        elapsed = time.perf_counter() - t0
+
+    receiver.stop()
+    nbytes = data['samples'].nbytes
+    return {
+        'path': ack['path'],
+        'bytes': nbytes,
+        'wire_bytes': ack['sent_bytes'],
+        'send_time': elapsed,
+        'throughput_mb_s': nbytes / elapsed / 1e6,
+        'capture_to_store': ack['latency']
+    }
+
+
+def main():
+    # Usage:
+    #   sample_transport.py receive [data_dir] [port]
+    #   sample_transport.py send host[:port] capture.npz [...]
+    #   sample_transport.py loopback [duration_s] [--compress]
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'receive'
+
+    if mode == 'receive':
+        data_dir = sys.argv[2] if len(sys.argv) > 2 else 'nice_data'
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PORT
+        print(f"Receiving captures on port {port} into '{data_dir}'...")
+        receiver = CaptureReceiver(data_dir, port=port)
+        try:
+            receiver.serve_forever()
+        except KeyboardInterrupt:
+            receiver.stop()
+
+    elif mode == 'send':
+        host, _, port = sys.argv[2].partition(':')
+        for filepath in sys.argv[3:]:
+            ack = send_capture_file(filepath, host, int(port or DEFAULT_PORT))
+            print(f"Sent {filepath} -> {ack['path']} ({ack['latency']*1e3:.1f} ms capture-to-store)")
+
+    elif mode == 'loopback':
+        duration = float(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] != '--compress' else 2.0
+        report = run_loopback(duration, compress='--compress' in sys.argv)
+        print(f"Stored {report['path']}")
+        print(f"  Payload: {report['bytes']/1e6:.1f} MB ({report['wire_bytes']/1e6:.1f} MB on the wire)")
+        print(f"  Send time: {report['send_time']*1e3:.1f} ms ({report['throughput_mb_s']:.0f} MB/s)")
+        print(f"  Capture-to-store latency: {report['capture_to_store']*1e3:.1f} ms")
+
+    else:
+        print(f"Unknown mode '{mode}'")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Synthetic multi-station TDOA scenarios with known ground truth
+An NFM-like transmitter is received at any station geometry with exact
+propagation delays, per-station clock errors (ppm, timestamp error, start
+offset), multipath and noise, and written in the capture formats the
+processor reads, plus a scenario.json holding the ground truth
+"""
+
+import numpy as np
+import json
+import os
+from itertools import combinations
+from capture_format import SidecarWriter
+from tdoa_processor_three_stations import lat_lon_to_xy, xy_to_lat_lon
+
+C = 299792458.0
+TRUTH_FILE = 'scenario.json'
+STATION_COLORS = ['blue', 'red', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'darkgreen']
+
+# Centre of the default Omaha stations
+DEFAULT_CENTER = (41.2701, -95.9769)
+
+
+class NFMSource:
+    """
+    Narrowband FM transmitter. The audio is a sum of random tones, so the
+    phase has a closed form and the signal can be evaluated exactly at any
+    (delayed, clock-skewed) instant without resampling
+    """
+
+    def __init__(self, offset_hz=0.0, deviation=5e3, n_tones=16, audio_band=(300.0, 3000.0), seed=0):
+        rng = np.random.default_rng(seed)
+        self.offset_hz = offset_hz
+        self.tones = rng.uniform(*audio_band, size=n_tones)
+        self.phases = rng.uniform(0, 2 * np.pi, size=n_tones)
+        # Peak deviation shared between the tones; modulation index per tone
+        self.beta = (deviation / np.sqrt(n_tones)) / self.tones
+
+    def baseband(self, t):
+        """Complex envelope at times t (seconds, float64)"""
+        phase = 2 * np.pi * self.offset_hz * t
+        for f, theta, beta in zip(self.tones, self.phases, self.beta):
+            phase += beta * np.sin(2 * np.pi * f * t + theta)
+        return np.exp(1j * phase)
+
+
+class Scenario:
+    """One capture group: transmitter, stations, channel and station impairments"""
+
+    def __init__(self, stations, tx, sample_rate=2.048e6, center_freq=162.4e6, duration=1.0,
+                 timestamp=1700000000.0, snr_db=20.0, tx_offset_hz=0.0, deviation=5e3,
+                 ppm=None, clock_error=None, start_offsets=None, multipath=(),
+                 ref_tx=None, ref_freq=None, ref_snr_db=20.0, seed=0):
+        self.stations = {}
+        for i, (station_id, pos) in enumerate(stations.items()):
+            self.stations[station_id] = {
+                'name': pos.get('name', station_id),
+                'lat': pos['lat'],
+                'lon': pos['lon'],
+                'color': pos.get('color', STATION_COLORS[i % len(STATION_COLORS)])
+            }
+        self.tx = dict(tx)
+        self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.duration = duration
+        self.timestamp = timestamp
+        self.snr_db = snr_db
+        self.tx_offset_hz = tx_offset_hz
+        self.deviation = deviation
+        self.ppm = {s: (ppm or {}).get(s, 0.0) for s in self.stations}
+        # Reported timestamp minus true start time (e.g. GPS/NTP error)
+        self.clock_error = {s: (clock_error or {}).get(s, 0.0) for s in self.stations}
+        # True capture start relative to `timestamp`, rounded to what the float64
+        # metadata timestamp can hold so the waveform and metadata agree
+        self.start_offsets = {s: (timestamp + (start_offsets or {}).get(s, 0.0)) - timestamp
+                              for s in self.stations}
+        # (excess delay s, gain dB relative to the direct path), random phase per station
+        self.multipath = [tuple(path) for path in multipath]
+        self.ref_tx = dict(ref_tx) if ref_tx else None
+        self.ref_freq = ref_freq
+        self.ref_snr_db = ref_snr_db
+        self.seed = seed
+
+    @classmethod
+    def random(cls, n_stations=3, radius_m=8000.0, tx_range_m=15000.0, center=DEFAULT_CENTER,
+               clock_jitter=0.0, start_spread=5e-4, ppm_spread=0.0, seed=0, **kwargs):
+        """Stations on a jittered ring, transmitter anywhere within tx_range_m of the centre"""
+        rng = np.random.default_rng(seed)
+        angles = np.linspace(0, 2 * np.pi, n_stations, endpoint=False) + rng.uniform(0, 2 * np.pi)
+        radii = radius_m * rng.uniform(0.7, 1.0, size=n_stations)
+
+        stations = {}
+        for i, (angle, r) in enumerate(zip(angles, radii)):
+            lat, lon = xy_to_lat_lon(r * np.cos(angle), r * np.sin(angle), *center)
+            stations[f'station{i + 1}'] = {'lat': float(lat), 'lon': float(lon)}
+
+        tx_xy = rng.uniform(-tx_range_m, tx_range_m, size=2)
+        tx_lat, tx_lon = xy_to_lat_lon(tx_xy[0], tx_xy[1], *center)
+
+        kwargs.setdefault('clock_error', {s: float(rng.normal(0, clock_jitter)) for s in stations})
+        kwargs.setdefault('start_offsets', {s: float(rng.uniform(-start_spread, start_spread)) for s in stations})
+        kwargs.setdefault('ppm', {s: float(rng.normal(0, ppm_spread)) for s in stations})
+        return cls(stations, {'lat': float(tx_lat), 'lon': float(tx_lon)}, seed=seed, **kwargs)
+
+    def delay(self, station_id, tx=None):
+        """Propagation delay from a transmitter to a station (s)"""
+        tx = tx or self.tx
+        pos = self.stations[station_id]
+        return float(np.linalg.norm(lat_lon_to_xy(pos['lat'], pos['lon'], tx['lat'], tx['lon']))) / C
+
+    def true_tdoa(self, stat1, stat2):
+        """Ground-truth TDOA in the processor's convention (arrival at stat1 minus stat2)"""
+        return self.delay(stat1) - self.delay(stat2)
+
+    def _received(self, station_id, source, tx, freq, snr_db, n_range, rng, path_phases):
+        """Samples n_range of one station's capture of `source`"""
+        n = np.arange(*n_range, dtype=np.float64)
+        eps = self.ppm[station_id] * 1e-6
+
+        # The station's sample clock and LO share one crystal, fast by eps
+        t_local = n / (self.sample_rate * (1 + eps))
+        # True time relative to `timestamp`: float64 spacing at a Unix epoch is
+        # ~240 ns, so the epoch only goes into the metadata
+        t_true = self.start_offsets[station_id] + t_local
+        tau = self.delay(station_id, tx)
+
+        x = source.baseband(t_true - tau)
+        for (excess, gain_db), phase in zip(self.multipath, path_phases):
+            x += 10 ** (gain_db / 20) * np.exp(1j * phase) * source.baseband(t_true - tau - excess)
+        x *= np.exp(-2j * np.pi * freq * eps * t_local)
+
+        sigma = np.sqrt(10 ** (-snr_db / 10) / 2)
+        x += sigma * (rng.normal(size=len(n)) + 1j * rng.normal(size=len(n)))
+        return x.astype(np.complex64)
+
+    def capture(self, station_id, block=1 << 18):
+        """Yield (array name, complex64 block) for one station's capture, in order"""
+        index = list(self.stations).index(station_id)
+        n_samples = int(round(self.duration * self.sample_rate))
+        channels = [('samples', NFMSource(self.tx_offset_hz, self.deviation, seed=self.seed),
+                     self.tx, self.center_freq, self.snr_db)]
+        if self.ref_tx is not None:
+            channels.append(('ref_samples', NFMSource(0.0, self.deviation, seed=self.seed + 1),
+                             self.ref_tx, self.ref_freq or self.center_freq, self.ref_snr_db))
+
+        for k, (name, source, tx, freq, snr_db) in enumerate(channels):
+            rng = np.random.default_rng([self.seed, index, k])
+            path_phases = rng.uniform(0, 2 * np.pi, size=len(self.multipath))
+            for start in range(0, n_samples, block):
+                yield name, self._received(station_id, source, tx, freq, snr_db,
+                                           (start, min(start + block, n_samples)), rng, path_phases)
+
+    def metadata(self, station_id):
+        meta = {
+            'station_id': station_id,
+            'timestamp': self.timestamp + self.start_offsets[station_id] + self.clock_error[station_id],
+            'sample_rate': self.sample_rate,
+            'center_freq': self.center_freq,
+            'ref_freq': self.ref_freq if self.ref_tx is not None else None
+        }
+        if self.ref_tx is not None:
+            meta['ref_phase'] = 0.0
+        return meta
+
+    def write(self, out_dir, fmt='npz'):
+        """Write every station's capture (npz like the collector, or sidecar) plus scenario.json"""
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {}
+
+        for station_id in self.stations:
+            base = os.path.join(out_dir, f"tdoa_{station_id}_{int(self.timestamp)}")
+            meta = self.metadata(station_id)
+
+            if fmt == 'sidecar':
+                writer = SidecarWriter(base)
+                for name, block in self.capture(station_id):
+                    writer.write(name, block, 'complex64')
+                paths[station_id] = writer.close(meta)
+            else:
+                arrays = {}
+                for name, block in self.capture(station_id):
+                    arrays.setdefault(name, []).append(block)
+                arrays = {name: np.concatenate(blocks) for name, blocks in arrays.items()}
+                np.savez_compressed(base + '.npz', **arrays, **meta)
+                paths[station_id] = base + '.npz'
+
+        with open(os.path.join(out_dir, TRUTH_FILE), 'w') as f:
+            json.dump(self.truth(), f, indent=2)
+        return paths
+
+    def truth(self):
+        """JSON ground truth, including the true TDOA of every station pair"""
+        return {
+            'stations': self.stations,
+            'tx': self.tx,
+            'ref_tx': self.ref_tx,
+            'ref_freq': self.ref_freq,
+            'sample_rate': self.sample_rate,
+            'center_freq': self.center_freq,
+            'duration': self.duration,
+            'timestamp': self.timestamp,
+            'snr_db': self.snr_db,
+            'tx_offset_hz': self.tx_offset_hz,
+            'ppm': self.ppm,
+            'clock_error': self.clock_error,
+            'start_offsets': self.start_offsets,
+            'multipath': self.multipath,
+            'seed': self.seed,
+            'true_tdoa': {f"{s1}-{s2}": self.true_tdoa(s1, s2)
+                          for s1, s2 in combinations(self.stations, 2)}
+        }
+
+
+def load_truth(data_dir):
+    with open(os.path.join(data_dir, TRUTH_FILE)) as f:
+        return json.load(f)
+
+
+def configure_processor(processor, truth):
+    """Point a ThreeStationTDOA at a scenario's stations, transmitter and reference"""
+    processor.station_positions = {s: dict(pos) for s, pos in truth['stations'].items()}
+    processor.actual_tx = dict(processor.actual_tx, name='Scenario TX',
+                               lat=truth['tx']['lat'], lon=truth['tx']['lon'])
+    if truth.get('ref_tx'):
+        processor.reference_tx = dict(processor.reference_tx, **truth['ref_tx'])
+    return processor
+
+
+def truth_tdoa(truth, stat1, stat2):
+    """True TDOA for a pair in either order"""
+    key = f"{stat1}-{stat2}"
+    if key in truth['true_tdoa']:
+        return truth['true_tdoa'][key]
+    return -truth['true_tdoa'][f"{stat2}-{stat1}"]
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Write a synthetic TDOA capture group with ground truth")
+    parser.add_argument('out_dir', help="Directory for the captures and scenario.json")
+    parser.add_argument('--stations', type=int, default=3, help="Number of stations [default=%(default)r]")
+    parser.add_argument('--duration', type=float, default=1.0, help="Capture length in seconds [default=%(default)r]")
+    parser.add_argument('--snr', type=float, default=20.0, help="SNR in dB [default=%(default)r]")
+    parser.add_argument('--radius', type=float, default=8000.0, help="Station ring radius in m [default=%(default)r]")
+    parser.add_argument('--ppm', type=float, default=0.0, help="Std dev of station clock error in ppm [default=%(default)r]")
+    parser.add_argument('--clock-jitter', type=float, default=0.0,
+                        help="Std dev of timestamp error in seconds [default=%(default)r]")
+    parser.add_argument('--multipath', type=float, nargs=2, action='append', default=[],
+                        metavar=('DELAY_US', 'GAIN_DB'), help="Add a multipath echo (repeatable)")
+    parser.add_argument('--reference', type=float, nargs=2, default=None, metavar=('LAT', 'LON'),
+                        help="Record a reference channel from a transmitter at LAT LON")
+    parser.add_argument('--format', choices=('npz', 'sidecar'), default='npz',
+                        help="Capture format [default=%(default)r]")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed [default=%(default)r]")
+    args = parser.parse_args()
+
+    scenario = Scenario.random(
+        n_stations=args.stations, radius_m=args.radius, seed=args.seed,
+        clock_jitter=args.clock_jitter, ppm_spread=args.ppm,
+        duration=args.duration, snr_db=args.snr,
+        multipath=[(delay * 1e-6, gain) for delay, gain in args.multipath],
+        ref_tx={'lat': args.reference[0], 'lon': args.reference[1]} if args.reference else None,
+        ref_freq=174.309e6 if args.reference else None)
+
+    paths = scenario.write(args.out_dir, args.format)
+    print(f"Wrote {len(paths)} captures to '{args.out_dir}'")
+    print(f"  Transmitter: {scenario.tx['lat']:.6f}, {scenario.tx['lon']:.6f}")
+    for station_id, path in paths.items():
+        print(f"  {station_id}: {os.path.basename(path)} "
+              f"(delay {scenario.delay(station_id)*1e6:.2f} us, {scenario.ppm[station_id]:+.2f} ppm)")
+
+
+if __name__ == "__main__":
+    main()
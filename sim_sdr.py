@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Simulated RTL-SDR device and real-time replay harness
+Stands in for rtlsdr.RtlSdr so TDOACollector can run, and be benchmarked, without hardware
+"""
+
+import numpy as np
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+
+class SyntheticSource:
+    """Carriers at absolute RF frequencies plus complex white noise"""
+
+    def __init__(self, emitters, noise_power=1.0, seed=None):
+        # emitters: list of (rf_freq_hz, amplitude)
+        self.emitters = list(emitters)
+        self.noise_power = noise_power
+        self.rng = np.random.default_rng(seed)
+
+    def generate(self, start_index, num_samples, sample_rate, center_freq):
+        n = np.arange(start_index, start_index + num_samples, dtype=np.float64)
+        out = np.zeros(num_samples, dtype=np.complex64)
+
+        for rf_freq, amplitude in self.emitters:
+            offset = rf_freq - center_freq
+            if abs(offset) < sample_rate / 2:
+                out += (amplitude * np.exp(2j * np.pi * offset * n / sample_rate)).astype(np.complex64)
+
+        if self.noise_power > 0:
+            scale = np.sqrt(self.noise_power / 2)
+            out += (self.rng.normal(scale=scale, size=num_samples) +
+                    1j * self.rng.normal(scale=scale, size=num_samples)).astype(np.complex64)
+
+        return out
+
+
+class ReplaySource:
+    """Replay recorded IQ (capture .npz, complex64 .bin or rtl_sdr .cu8) when tuned to its frequency"""
+
+    def __init__(self, samples, center_freq=None, tolerance=1e3, loop=True):
+        if isinstance(samples, str):
+            samples, recorded_freq = self.load(samples)
+            if center_freq is None:
+                center_freq = recorded_freq
+        self.samples = samples
+        self.center_freq = center_freq
+        self.tolerance = tolerance
+        self.loop = loop
+
+    @staticmethod
+    def load(path):
+        """Return (samples, center_freq) from a capture or raw IQ file"""
+        if path.endswith('.npz'):
+            data = np.load(path)
+            return data['samples'].astype(np.complex64), float(data['center_freq'])
+        if path.endswith('.cu8'):
+            raw = np.memmap(path, dtype=np.uint8, mode='r')
+            iq = (raw[:len(raw) // 2 * 2].astype(np.float32) - 127.5) / 127.5
+            return (iq[0::2] + 1j * iq[1::2]).astype(np.complex64), None
+        return np.memmap(path, dtype=np.complex64, mode='r'), None
+
+    def generate(self, start_index, num_samples, sample_rate, center_freq):
+        if self.center_freq is not None and abs(center_freq - self.center_freq) > self.tolerance:
+            return np.zeros(num_samples, dtype=np.complex64)
+
+        total = len(self.samples)
+        if self.loop:
+            idx = (start_index + np.arange(num_samples)) % total
+            return np.asarray(self.samples[idx], dtype=np.complex64)
+
+        out = np.zeros(num_samples, dtype=np.complex64)
+        chunk = self.samples[start_index:start_index + num_samples]
+        out[:len(chunk)] = chunk
+        return out
+
+
+class SimulatedRtlSdr:
+    """
+    Minimal RtlSdr-compatible device (sample_rate, center_freq, gain,
+    read_samples, close) producing samples on a real-time clock
+
+    The dongle keeps streaming whether or not the host reads; once the host
+    falls more than buffer_samples behind, the oldest samples are lost, just
+    like librtlsdr's USB buffer ring. Random USB drops and retune delay are
+    emulated on top, and every lost sample is counted in dropped_samples.
+    """
+
+    def __init__(self, sources, sample_rate=2.048e6, retune_delay=0.0005, realtime=True,
+                 buffer_samples=15 * 16384, drop_rate=0.0, drop_length=16384, seed=None):
+        self.sources = list(sources)
+        self._sample_rate = float(sample_rate)
+        self._center_freq = 100e6
+        self.gain = 'auto'
+        self.retune_delay = retune_delay
+        self.realtime = realtime
+        self.buffer_samples = buffer_samples
+        self.drop_rate = drop_rate
+        self.drop_length = drop_length
+        self.rng = np.random.default_rng(seed)
+
+        # Telemetry
+        self.dropped_samples = 0
+        self.drop_events = 0
+        self.queue_high_water = 0
+        self.retunes = 0
+
+        self._restart_stream()
+
+    def _restart_stream(self):
+        self._t0 = time.perf_counter()
+        self._read_index = 0
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, rate):
+        self._sample_rate = float(rate)
+        self._restart_stream()
+
+    @property
+    def center_freq(self):
+        return self._center_freq
+
+    @center_freq.setter
+    def center_freq(self, freq):
+        # Tuning blocks the caller; the stream keeps running underneath
+        if self.retune_delay:
+            time.sleep(self.retune_delay)
+        self._center_freq = float(freq)
+        self.retunes += 1
+
+    @property
+    def sample_count(self):
+        """Stream index of the next sample read_samples will return (drops included)"""
+        return self._read_index
+
+    def _produced(self):
+        """Samples the dongle has produced so far on the real-time clock"""
+        if not self.realtime:
+            return self._read_index
+        return int((time.perf_counter() - self._t0) * self._sample_rate)
+
+    def read_samples(self, num_samples):
+        num_samples = int(num_samples)
+
+        # Host fell behind: the buffer ring overflowed and old samples are gone
+        backlog = self._produced() - self._read_index
+        self.queue_high_water = max(self.queue_high_water, min(backlog, self.buffer_samples))
+        if backlog > self.buffer_samples:
+            lost = backlog - self.buffer_samples
+            self._read_index += lost
+            self.dropped_samples += lost
+            self.drop_events += 1
+
+        # Random USB transfer loss
+        if self.drop_rate and self.rng.random() < self.drop_rate:
+            self._read_index += self.drop_length
+            self.dropped_samples += self.drop_length
+            self.drop_events += 1
+
+        # Pace to real time: wait for the requested samples to exist
+        if self.realtime:
+            ready_at = self._t0 + (self._read_index + num_samples) / self._sample_rate
+            wait = ready_at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        out = np.zeros(num_samples, dtype=np.complex64)
+        for source in self.sources:
+            out += source.generate(self._read_index, num_samples, self._sample_rate, self._center_freq)
+
+        self._read_index += num_samples
+        return out
+
+    def close(self):
+        pass
+
+
+def run_replay_benchmark(captures=3, duration=1.0, use_reference=True, drop_rate=0.0,
+                         sources=None, realtime=True):
+    """Drive TDOACollector against a simulated device and report CPU, memory and drops"""
+    from sync_collect_samples import TDOACollector, SYNC_FREQ
+
+    center_freq = 162.4e6
+    if sources is None:
+        sources = [SyntheticSource([(center_freq + 12.5e3, 0.5), (SYNC_FREQ + 1e3, 2.0)],
+                                   noise_power=0.5, seed=1)]
+
+    device = SimulatedRtlSdr(sources, drop_rate=drop_rate, realtime=realtime, seed=2)
+    collector = TDOACollector('sim1', center_freq=center_freq, ref_freq=SYNC_FREQ, sdr=device)
+
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    locked = collector.acquire_reference_lock(timeout=5.0) if use_reference else False
+
+    capture_reports = []
+    for _ in range(captures):
+        dropped_before = device.dropped_samples
+        cap_cpu = time.process_time()
+        cap_wall = time.perf_counter()
+        data = collector.collect_samples(duration=duration, use_reference=use_reference)
+        capture_reports.append({
+            'wall': time.perf_counter() - cap_wall,
+            'cpu': time.process_time() - cap_cpu,
+            'device_dropped': device.dropped_samples - dropped_before,
+            'flagged': data['integrity']['compromised'],
+            'detected': data['detection']['detected'],
+            'channel_snr_db': data['detection']['snr_db']
+        })
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'reference_locked': locked,
+        'captures': capture_reports,
+        'wall_time': wall,
+        'cpu_time': cpu,
+        'cpu_fraction': cpu / wall if wall > 0 else 0.0,
+        'peak_traced_bytes': peak_traced,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'device_dropped_samples': device.dropped_samples,
+        'device_drop_events': device.drop_events,
+        'device_queue_high_water': device.queue_high_water,
+        'collector_counters': dict(collector.counters)
+    }
+
+
+def main():
+    # Usage: sim_sdr.py [captures] [duration_s] [drop_rate] [replay_file ...]
+    captures = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    drop_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    replay_files = sys.argv[4:]
+
+    sources = None
+    if replay_files:
+        sources = [ReplaySource(path) for path in replay_files if os.path.exists(path)]
+
+    report = run_replay_benchmark(captures=captures, duration=duration,
+                                  drop_rate=drop_rate, sources=sources)
+
+    print("\n" + "="*50)
+    print("Simulated Collector Replay Benchmark")
+    print("="*50)
+    print(f"Reference locked: {report['reference_locked']}")
+    for idx, cap in enumerate(report['captures']):
+        print(f"  Capture {idx}: wall {cap['wall']:.2f} s, CPU {cap['cpu']:.2f} s, "
+              f"dropped {cap['device_dropped']}, flagged {cap['flagged']}, "
+              f"signal {cap['detected']} ({cap['channel_snr_db']:+.1f} dB)")
+    print(f"Total wall time: {report['wall_time']:.2f} s")
+    print(f"Total CPU time: {report['cpu_time']:.2f} s ({report['cpu_fraction']*100:.0f}% of one core)")
+    print(f"Peak traced memory: {report['peak_traced_bytes']/1e6:.1f} MB")
+    print(f"Max RSS: {report['max_rss_kb']/1e3:.1f} MB")
+    print(f"Device dropped samples: {report['device_dropped_samples']} "
+          f"in {report['device_drop_events']} events")
+    print(f"Device queue high-water: {report['device_queue_high_water']} samples")
+    print(f"Collector counters: {report['collector_counters']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for the TDOA pipeline
+Each stage records wall and CPU time, peak memory and whatever counters the
+code inside it reports (bytes read, FFT sizes, solver evaluations). Records are
+appended as JSON lines, and a Prometheus text file can be rewritten after
+every run. A cProfile dump per stage is opt-in.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def max_rss_bytes():
+    """Process peak resident set size so far, or None where unavailable"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+class StageMetrics:
+    """
+    Collects one record per pipeline stage. Without output paths it only keeps
+    the records of the current run in memory, which costs two clock reads per
+    stage, so processors always carry one.
+
+    jsonl_path      -- append every stage record (and a per-run total) as JSON lines
+    prometheus_path -- rewrite a Prometheus text-format file after each run
+    profile_dir     -- dump a cProfile of every stage as <run>-<stage>.prof
+    trace_memory    -- track the peak Python/numpy heap per stage with tracemalloc
+                       (slower; otherwise only the process peak RSS is recorded)
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None, profile_dir=None, trace_memory=False):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self.runs = 0
+        self.run_id = None
+        self.records = []
+        self.totals = {}  # stage -> [count, wall, cpu] over all runs
+        self._stack = []
+        self._run_start = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure the enclosed block as one stage of the current run"""
+        if self.run_id is None:
+            self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.runs}"
+            self._run_start = time.time()
+
+        record = {'run': self.run_id, 'stage': name, 'started': time.time()}
+        self._stack.append(record)
+
+        # cProfile allows one active profiler, so nested stages share the outer one
+        profiler = None
+        if self.profile_dir and len(self._stack) == 1:
+            profiler = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = time.process_time() - cpu
+            record['max_rss_bytes'] = max_rss_bytes()
+            if self.trace_memory:
+                record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1] - traced_start
+            if profiler is not None:
+                path = os.path.join(self.profile_dir, f"{self.run_id}-{_metric_name(name)}.prof")
+                profiler.dump_stats(path)
+                record['profile'] = path
+
+            self._stack.pop()
+            self.records.append(record)
+            totals = self.totals.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += record['wall_s']
+            totals[2] += record['cpu_s']
+            self._write_jsonl([record])
+
+    def record(self, **values):
+        """Attach values (e.g. fft_size, evaluations) to the innermost running stage"""
+        if self._stack:
+            self._stack[-1].update(values)
+
+    def add(self, name, amount):
+        """Accumulate a counter (e.g. bytes_read) on the innermost running stage"""
+        if self._stack:
+            self._stack[-1][name] = self._stack[-1].get(name, 0) + amount
+
+    def finish(self, **extra):
+        """Close the current run: write its total and the Prometheus file; returns the run's records"""
+        records, self.records = self.records, []
+        if self.run_id is None:
+            return records
+
+        total = {'run': self.run_id, 'stage': 'total', 'started': self._run_start,
+                 'wall_s': time.time() - self._run_start,
+                 'cpu_s': sum(r['cpu_s'] for r in records), 'max_rss_bytes': max_rss_bytes()}
+        total.update(extra)
+        self._write_jsonl([total])
+        self.runs += 1
+        self._write_prometheus(records + [total])
+        self.run_id = None
+        return records + [total]
+
+    def _write_jsonl(self, records):
+        if not self.jsonl_path:
+            return
+        with open(self.jsonl_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, default=float) + '\n')
+
+    def _write_prometheus(self, records):
+        if not self.prometheus_path:
+            return
+
+        lines = [
+            '# HELP tdoa_stage_wall_seconds Wall time of each stage in the last run',
+            '# TYPE tdoa_stage_wall_seconds gauge'
+        ]
+        lines += [f'tdoa_stage_wall_seconds{{stage="{r["stage"]}"}} {r["wall_s"]:.6f}' for r in records]
+        lines += [
+            '# HELP tdoa_stage_cpu_seconds CPU time (all threads) of each stage in the last run',
+            '# TYPE tdoa_stage_cpu_seconds gauge'
+        ]
+        lines += [f'tdoa_stage_cpu_seconds{{stage="{r["stage"]}"}} {r["cpu_s"]:.6f}' for r in records]
+
+        # Numeric counters the stages reported, one gauge family per name
+        standard = {'run', 'stage', 'started', 'wall_s', 'cpu_s', 'profile'}
+        families = {}
+        for r in records:
+            for key, value in r.items():
+                if key not in standard and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    families.setdefault(key, []).append((r['stage'], value))
+        for key, values in sorted(families.items()):
+            metric = f"tdoa_stage_{_metric_name(key)}"
+            lines.append(f'# TYPE {metric} gauge')
+            lines += [f'{metric}{{stage="{stage}"}} {value}' for stage, value in values]
+
+        lines += [
+            '# HELP tdoa_stage_seconds_total Wall time spent in each stage since start',
+            '# TYPE tdoa_stage_seconds_total counter'
+        ]
+        lines += [f'tdoa_stage_seconds_total{{stage="{stage}"}} {wall:.6f}'
+                  for stage, (_, wall, _) in sorted(self.totals.items())]
+        lines += [
+            '# HELP tdoa_stage_cpu_seconds_total CPU time spent in each stage since start',
+            '# TYPE tdoa_stage_cpu_seconds_total counter'
+        ]
+        lines += [f'tdoa_stage_cpu_seconds_total{{stage="{stage}"}} {cpu:.6f}'
+                  for stage, (_, _, cpu) in sorted(self.totals.items())]
+        lines += [
+            '# HELP tdoa_runs_total Pipeline runs since start',
+            '# TYPE tdoa_runs_total counter',
+            f'tdoa_runs_total {self.runs}'
+        ]
+
+        # Written atomically so a node_exporter textfile collector never sees half a file
+        tmp_path = self.prometheus_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prometheus_path)
+
+
+def summarize(path):
+    """Mean wall/CPU time per stage over a JSON lines file"""
+    stages = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                stages.setdefault(record['stage'], []).append(record)
+    return stages
+
+
+def main():
+    # Usage: stage_metrics.py metrics.jsonl   -- per-stage means over the recorded runs
+    path = sys.argv[1] if len(sys.argv) > 1 else 'nice_data/tdoa_metrics.jsonl'
+    stages = summarize(path)
+
+    print(f"{'stage':<20} {'runs':>5} {'wall ms':>10} {'cpu ms':>10} {'max rss MB':>11}")
+    for stage, records in stages.items():
+        wall = sum(r['wall_s'] for r in records) / len(records)
+        cpu = sum(r['cpu_s'] for r in records) / len(records)
+        rss = max((r.get('max_rss_bytes') or 0) for r in records)
+        print(f"{stage:<20} {len(records):5d} {wall*1e3:10.1f} {cpu*1e3:10.1f} {rss/2**20:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Station-side DSP helpers for the TDOA collector
+Precomputed, averaged spectrum estimation, a target-channel squelch and a
+narrowband reference carrier tracker
+"""
+
+import numpy as np
+
+
+class SpectrumAverager:
+    """Averaged power spectrum with the window and frequency axis computed once"""
+
+    def __init__(self, sample_rate, fft_size=16384):
+        self.sample_rate = sample_rate
+        self.fft_size = fft_size
+
+        # Precompute everything that only depends on the FFT geometry
+        self.window = np.hanning(fft_size).astype(np.float32)
+        self.window_power = float(np.sum(self.window**2))
+        self.freqs = np.fft.fftshift(np.fft.fftfreq(fft_size, 1/sample_rate))
+        self.bin_width = sample_rate / fft_size
+
+    def averaged_power(self, samples):
+        """Return (power, n_segments) averaged over whole FFT segments, DC centred"""
+        n_seg = len(samples) // self.fft_size
+        if n_seg == 0:
+            raise ValueError(f"Need at least {self.fft_size} samples, got {len(samples)}")
+
+        segments = np.asarray(samples[:n_seg * self.fft_size]).reshape(n_seg, self.fft_size)
+        spectra = np.fft.fft(segments * self.window, axis=1)
+        power = np.mean(spectra.real**2 + spectra.imag**2, axis=0) / self.window_power
+
+        return np.fft.fftshift(power), n_seg
+
+    def band_slice(self, low_hz, high_hz):
+        """Index slice of the (shifted) spectrum covering [low_hz, high_hz]"""
+        start = int(np.searchsorted(self.freqs, low_hz, side='left'))
+        stop = int(np.searchsorted(self.freqs, high_hz, side='right'))
+        return slice(start, max(stop, start + 1))
+
+
+class SpectralSquelch:
+    """
+    Target-channel detector: averaged power in the channel against the median
+    noise floor of the rest of the band. The window, frequency axis and band
+    slices are computed once, and only max_segments FFT segments spread evenly
+    over the capture are transformed, so the cost per capture is fixed. The
+    DC bin is left out of both so the RTL-SDR's DC spike can't open the squelch.
+    """
+
+    def __init__(self, sample_rate, channel_offset=0.0, channel_width=25e3, fft_size=1024,
+                 threshold_db=6.0, max_segments=256, exclude_dc=True):
+        self.spectrum = SpectrumAverager(sample_rate, fft_size)
+        self.channel_offset = channel_offset
+        self.channel_width = channel_width
+        self.threshold_db = threshold_db
+        self.max_segments = max_segments
+
+        band = self.spectrum.band_slice(channel_offset - channel_width / 2,
+                                        channel_offset + channel_width / 2)
+        self.band_bins = np.zeros(fft_size, dtype=bool)
+        self.band_bins[band] = True
+        self.noise_bins = ~self.band_bins
+        if exclude_dc:
+            self.band_bins[fft_size // 2] = self.noise_bins[fft_size // 2] = False
+
+    def detect(self, samples):
+        """JSON-safe detection result for one capture"""
+        fft_size = self.spectrum.fft_size
+        n_seg = min(len(samples) // fft_size, self.max_segments)
+        if n_seg == 0:
+            return {'detected': False, 'snr_db': None, 'threshold_db': self.threshold_db, 'segments': 0}
+
+        starts = np.linspace(0, len(samples) - fft_size, n_seg).astype(int)
+        segments = np.concatenate([samples[start:start + fft_size] for start in starts])
+        power, _ = self.spectrum.averaged_power(segments)
+
+        noise_floor = float(np.median(power[self.noise_bins]))
+        snr_db = float(10 * np.log10(np.mean(power[self.band_bins]) / (noise_floor + 1e-20)))
+        return {
+            'detected': snr_db >= self.threshold_db,
+            'snr_db': snr_db,
+            'threshold_db': self.threshold_db,
+            'channel_offset': self.channel_offset,
+            'channel_width': self.channel_width,
+            'segments': int(n_seg)
+        }
+
+
+class ReferenceTracker:
+    """
+    Acquire a reference carrier with averaged power-of-two FFTs, then track it
+    with a block NCO (single-bin DFT) so offset, phase and SNR stay available
+    between captures without repeating the full FFT search
+    """
+
+    def __init__(self, sample_rate, fft_size=16384, n_avg=8, snr_threshold=20.0,
+                 block_size=4096, lost_margin=6.0):
+        self.sample_rate = sample_rate
+        self.spectrum = SpectrumAverager(sample_rate, fft_size)
+        self.n_avg = n_avg
+        self.snr_threshold = snr_threshold
+        self.block_size = block_size
+        self.lost_margin = lost_margin
+
+        # Acquisition accumulator (averaged across reads until n_avg segments)
+        self._accum = None
+        self._accum_count = 0
+
+        # Tracking state
+        self.locked = False
+        self.freq_offset = 0.0
+        self.phase = 0.0
+        self.snr_db = float('-inf')
+        self.sample_index = 0
+        self._nco_phase = 0.0
+        self._table = None
+
+    @property
+    def acquire_chunk_size(self):
+        """Samples per read that give one full averaged acquisition estimate"""
+        return self.spectrum.fft_size * self.n_avg
+
+    def reset(self):
+        """Drop lock and any partially accumulated acquisition spectra"""
+        self._accum = None
+        self._accum_count = 0
+        self.locked = False
+        self.snr_db = float('-inf')
+
+    def acquire(self, samples):
+        """Feed samples to the FFT search; returns True once the carrier is locked"""
+        power, n_seg = self.spectrum.averaged_power(samples)
+
+        if self._accum is None:
+            self._accum = power * n_seg
+        else:
+            self._accum += power * n_seg
+        self._accum_count += n_seg
+
+        if self._accum_count < self.n_avg:
+            return False
+
+        power = self._accum / self._accum_count
+        self._accum = None
+        self._accum_count = 0
+
+        # Peak against a robust noise floor estimate
+        peak_idx = int(np.argmax(power))
+        noise_floor = float(np.median(power))
+        snr = 10 * np.log10(power[peak_idx] / (noise_floor + 1e-20))
+
+        self.snr_db = snr
+        if snr < self.snr_threshold:
+            return False
+
+        # Parabolic interpolation on log power for a sub-bin frequency estimate
+        offset = 0.0
+        if 0 < peak_idx < len(power) - 1:
+            y0, y1, y2 = np.log(power[peak_idx - 1:peak_idx + 2] + 1e-20)
+            denom = y0 - 2*y1 + y2
+            if denom != 0:
+                offset = 0.5 * (y0 - y2) / denom
+
+        self._start_tracking(self.spectrum.freqs[peak_idx] + offset * self.spectrum.bin_width)
+        return True
+
+    def _start_tracking(self, freq_offset):
+        self.locked = True
+        self.sample_index = 0
+        self._nco_phase = 0.0
+        self._set_frequency(freq_offset)
+
+    def _set_frequency(self, freq_offset):
+        self.freq_offset = float(freq_offset)
+        n = np.arange(self.block_size)
+        self._table = np.exp(-2j * np.pi * self.freq_offset * n / self.sample_rate).astype(np.complex64)
+
+    def restart_phase(self):
+        """Measure phase from the next sample on, when the gap since the last one is unknown"""
+        self._nco_phase = 0.0
+
+    def advance(self, n_samples):
+        """Advance the NCO over samples that were not observed (e.g. retune gaps)"""
+        self._nco_phase = (self._nco_phase + 2*np.pi*self.freq_offset*n_samples/self.sample_rate) % (2*np.pi)
+        self.sample_index += int(n_samples)
+
+    def update(self, samples, gap_samples=0):
+        """
+        Track the locked carrier over a block of samples
+
+        Returns a dict with the frequency offset (Hz), phase of the first and
+        last block (radians, continuous with previous calls) and SNR (dB)
+        """
+        if not self.locked:
+            raise RuntimeError("Reference tracker is not locked")
+
+        if gap_samples:
+            self.advance(gap_samples)
+
+        B = self.block_size
+        n_blk = len(samples) // B
+        if n_blk == 0:
+            self.advance(len(samples))
+            return self.status()
+
+        blocks = np.asarray(samples[:n_blk * B]).reshape(n_blk, B)
+
+        # Single-bin DFT per block, rotated by the NCO phase at each block start
+        start_phase = self._nco_phase + 2*np.pi*self.freq_offset*B*np.arange(n_blk)/self.sample_rate
+        z = (blocks @ self._table) * np.exp(-1j * start_phase)
+
+        # SNR in one block-length bin: coherent power against the residual
+        coherent = np.abs(z)**2 / B**2
+        total = np.mean(blocks.real**2 + blocks.imag**2, axis=1)
+        residual = np.maximum(total - coherent, 1e-20)
+        self.snr_db = float(10 * np.log10(np.mean(coherent) * B / np.mean(residual)))
+
+        start_block_phase = float(np.angle(z[0]))
+        self.phase = float(np.angle(z[-1]))
+
+        # Residual frequency from the block-to-block phase slope
+        residual_hz = 0.0
+        if n_blk > 1:
+            dphi = np.angle(np.sum(z[1:] * np.conj(z[:-1])))
+            residual_hz = float(dphi * self.sample_rate / (2*np.pi*B))
+
+        self.advance(len(samples))
+
+        # Frequency-locked loop: fold the measured residual back into the NCO
+        if residual_hz:
+            self._set_frequency(self.freq_offset + residual_hz)
+
+        if self.snr_db < self.snr_threshold - self.lost_margin:
+            self.locked = False
+
+        status = self.status()
+        status['start_phase'] = start_block_phase
+        status['residual_hz'] = residual_hz
+        return status
+
+    def status(self):
+        return {
+            'locked': self.locked,
+            'freq_offset': self.freq_offset,
+            'phase': self.phase,
+            'snr_db': self.snr_db,
+            'sample_index': self.sample_index
+        }
@@ -1,22 +1,127 @@
 #!/usr/bin/env python3
 import numpy as np
-from rtlsdr import RtlSdr
 import time
-import socket
 import json
 from datetime import datetime
 from scipy import signal
 import threading
+from station_dsp import ReferenceTracker, SpectralSquelch
+
+try:
+    from rtlsdr import RtlSdr
+except ImportError:  # no pyrtlsdr: only simulated devices (sim_sdr.py) can be used
+    RtlSdr = None
 
 SYNC_FREQ=506.31e6
 
+class CaptureIntegrity:
+    """Per-capture timing and sample-count telemetry for detecting silent gaps"""
+    
+    def __init__(self, sample_rate, timing_tolerance=0.005, drift_tolerance=None, clock=time.time):
+        self.sample_rate = sample_rate
+        self.clock = clock
+        # Slack (seconds) allowed between a read's wall time and its sample time
+        self.timing_tolerance = timing_tolerance
+        # Slack for the whole capture's wall time over its sample time: a few reads' worth
+        self.drift_tolerance = 3 * timing_tolerance if drift_tolerance is None else drift_tolerance
+        self.hops = []
+        self.retune_latency = []
+        self.read_gaps = []
+        self.queue_high_water = 0
+        self.clock_drift = 0.0
+        self._last_read_end = None
+        self._retune_time = 0.0
+        self._start = self.clock()
+    
+    def retune(self, sdr, freq, settle=0.001):
+        """Retune the dongle, recording how long the tune and settle took"""
+        t0 = self.clock()
+        sdr.center_freq = freq
+        time.sleep(settle)
+        self.retune_latency.append(self.clock() - t0)
+        self._retune_time += self.retune_latency[-1]
+    
+    def read(self, sdr, num_samples, label):
+        """Read samples and record expected vs received count and timing"""
+        t_start = self.clock()
+        samples = sdr.read_samples(num_samples)
+        t_end = self.clock()
+        
+        # A read taking much longer than its sample time means the stream stalled
+        # (USB overrun / dropped buffers) somewhere inside it
+        sample_time = len(samples) / self.sample_rate
+        excess = (t_end - t_start) - sample_time
+        
+        # A host stall between reads overflows the buffer instead, and the next
+        # reads return on time from what is left; only the time since the last
+        # read, less deliberate retunes, against the samples shows it
+        since = t_start
+        if self._last_read_end is not None:
+            self.read_gaps.append(t_start - self._last_read_end)
+            since = self._last_read_end
+        self.clock_drift += (t_end - since) - self._retune_time - sample_time
+        self._retune_time = 0.0
+        self._last_read_end = t_end
+        self.hops.append({
+            'label': label,
+            'expected': int(num_samples),
+            'received': int(len(samples)),
+            'start': t_start,
+            'duration': t_end - t_start,
+            'excess': excess
+        })
+        
+        # Devices with a buffer queue (e.g. the async reader) report its depth
+        depth = getattr(sdr, 'queue_high_water', None)
+        if depth is not None:
+            self.queue_high_water = max(self.queue_high_water, int(depth))
+        
+        return samples
+    
+    def summary(self):
+        """Compact JSON-safe integrity report for the capture metadata"""
+        expected = sum(h['expected'] for h in self.hops)
+        received = sum(h['received'] for h in self.hops)
+        excess = [h['excess'] for h in self.hops]
+        suspect_reads = sum(1 for x in excess if x > self.timing_tolerance)
+        
+        # Wall-clock time not accounted for by samples, retunes or read gaps
+        wall = self.clock() - self._start
+        sample_time = received / self.sample_rate
+        
+        return {
+            'reads': len(self.hops),
+            'samples_expected': expected,
+            'samples_received': received,
+            'short_reads': sum(1 for h in self.hops if h['received'] < h['expected']),
+            'suspect_reads': suspect_reads,
+            'max_read_excess': max(excess) if excess else 0.0,
+            'max_read_gap': max(self.read_gaps) if self.read_gaps else 0.0,
+            'mean_read_gap': float(np.mean(self.read_gaps)) if self.read_gaps else 0.0,
+            'max_retune_latency': max(self.retune_latency) if self.retune_latency else 0.0,
+            'mean_retune_latency': float(np.mean(self.retune_latency)) if self.retune_latency else 0.0,
+            'wall_time': wall,
+            'sample_time': sample_time,
+            'queue_high_water': self.queue_high_water,
+            'clock_drift': self.clock_drift,
+            'compromised': (received < expected or suspect_reads > 0 or
+                            self.clock_drift > self.drift_tolerance)
+        }
+
 class TDOACollector:
-    def __init__(self, station_id, center_freq=162.4e6, sample_rate=2.048e6, ref_freq=SYNC_FREQ):
+    def __init__(self, station_id, center_freq=162.4e6, sample_rate=2.048e6, ref_freq=SYNC_FREQ, sdr=None):
         self.station_id = station_id
         self.center_freq = center_freq
         self.sample_rate = sample_rate
         self.ref_freq = ref_freq
-        self.sdr = RtlSdr()
+        
+        # Any object with RtlSdr's sample_rate/center_freq/gain attributes and
+        # read_samples() works here, e.g. sim_sdr.SimulatedRtlSdr for testing
+        if sdr is None:
+            if RtlSdr is None:
+                raise RuntimeError("pyrtlsdr is not installed - pass a device via sdr=")
+            sdr = RtlSdr()
+        self.sdr = sdr
         self.sdr.sample_rate = sample_rate
         self.sdr.gain = 'auto'
         
@@ -24,6 +129,30 @@ class TDOACollector:
         self.ref_lock = False
         self.ref_phase = 0
         self.ref_timestamp = None
+        self.ref_tracker = ReferenceTracker(sample_rate)
+        # Device sample count at the end of the last reference samples the
+        # tracker saw, so the NCO is advanced over the exact gap before the next
+        # tracked hop. Host timestamps jitter by far more than a carrier cycle,
+        # so on devices without a sample counter (a real RtlSdr) the NCO phase
+        # restarts at every hop instead
+        self.ref_end_count = None
+        
+        # Squelch on the target channel: every capture is tagged with whether the
+        # carrier was on air, and empty ones can be dropped before they are saved
+        self.squelch = SpectralSquelch(sample_rate)
+        self.discard_empty = False
+        
+        # Running integrity counters across all captures
+        self.counters = {
+            'captures': 0,
+            'compromised_captures': 0,
+            'samples_expected': 0,
+            'samples_received': 0,
+            'short_reads': 0,
+            'suspect_reads': 0,
+            'queue_high_water': 0,
+            'empty_captures': 0
+        }
         
     def acquire_reference_lock(self, timeout=10.0):
         """Acquire lock on reference frequency for synchronization"""
@@ -34,33 +163,22 @@ class TDOACollector:
         self.sdr.center_freq = self.ref_freq
         
         start_time = time.time()
-        samples_per_read = int(self.sample_rate * 0.1)  # 100ms chunks
+        # Power-of-two FFT segments averaged across one read
+        samples_per_read = self.ref_tracker.acquire_chunk_size
+        self.ref_tracker.reset()
         
         while (time.time() - start_time) < timeout:
             # Read samples
             samples = self.sdr.read_samples(samples_per_read)
             
-            # Compute FFT to find reference signal
-            fft_data = np.fft.fftshift(np.fft.fft(samples))
-            freqs = np.fft.fftshift(np.fft.fftfreq(len(samples), 1/self.sample_rate))
-            
-            # Find peak near DC (reference should be strong)
-            power = np.abs(fft_data)**2
-            peak_idx = np.argmax(power)
-            peak_freq = freqs[peak_idx]
-            peak_power = power[peak_idx]
-            
-            # Check if we have a strong signal
-            avg_power = np.mean(power)
-            snr = 10 * np.log10(peak_power / avg_power)
-            
-            if snr > 20:  # 20 dB SNR threshold
-                # Extract phase of reference signal
-                ref_bin = peak_idx
-                self.ref_phase = np.angle(fft_data[ref_bin])
+            if self.ref_tracker.acquire(samples):
+                # Switch to the narrowband tracker to measure phase
+                status = self.ref_tracker.update(samples)
+                self.ref_phase = status['phase']
                 self.ref_timestamp = time.time()
+                self.ref_end_count = getattr(self.sdr, 'sample_count', None)
                 self.ref_lock = True
-                print(f"Reference locked! SNR: {snr:.1f} dB, Offset: {peak_freq:.1f} Hz")
+                print(f"Reference locked! SNR: {status['snr_db']:.1f} dB, Offset: {status['freq_offset']:.1f} Hz")
                 break
         
         # Return to original frequency
@@ -107,36 +225,62 @@ class TDOACollector:
         hop_duration = 0.01  # 10ms per hop
         samples_per_hop = int(self.sdr.sample_rate * hop_duration)
         
-        target_samples = []
-        ref_samples = []
+        # Preallocated so hops are copied in place rather than appended sample by sample
+        # (short reads leave zeros behind and are flagged by the integrity check)
+        target_samples = np.zeros(num_samples, dtype=np.complex64)
+        ref_samples = np.zeros(num_samples, dtype=np.complex64)
+        filled = 0
         timestamps = []
+        ref_status = []
+        last_ref_end = self.ref_end_count
+        integrity = CaptureIntegrity(self.sample_rate)
         
         start_time = time.time()
         
-        while len(target_samples) < num_samples:
+        while filled < num_samples:
+            count = min(samples_per_hop, num_samples - filled)
+            
             # Collect target frequency
-            self.sdr.center_freq = self.center_freq
-            time.sleep(0.001)  # Settling time
+            integrity.retune(self.sdr, self.center_freq)  # includes settling time
             t1 = time.time()
-            samples = self.sdr.read_samples(samples_per_hop)
-            target_samples.extend(samples)
+            samples = integrity.read(self.sdr, samples_per_hop, 'target')[:count]
+            target_samples[filled:filled + len(samples)] = samples
             
             # Collect reference frequency
-            self.sdr.center_freq = self.ref_freq
-            time.sleep(0.001)  # Settling time
+            integrity.retune(self.sdr, self.ref_freq)
             t2 = time.time()
-            samples = self.sdr.read_samples(samples_per_hop)
-            ref_samples.extend(samples)
+            hop = integrity.read(self.sdr, samples_per_hop, 'ref')
+            samples = hop[:count]
+            ref_samples[filled:filled + len(samples)] = samples
+            filled += count
+            
+            # Keep the NCO running across the target hop so phase stays continuous
+            end_count = getattr(self.sdr, 'sample_count', None)
+            hop_start = None if end_count is None else end_count - len(hop)
+            if self.ref_tracker.locked:
+                if hop_start is None or last_ref_end is None:
+                    self.ref_tracker.restart_phase()
+                    gap = 0
+                else:
+                    gap = max(hop_start - last_ref_end, 0)
+                ref_status.append(self.ref_tracker.update(samples, gap_samples=gap))
+            last_ref_end = None if hop_start is None else hop_start + len(samples)
             
             timestamps.append((t1, t2))
-        
-        # Trim to exact length
-        target_samples = np.array(target_samples[:num_samples])
-        ref_samples = np.array(ref_samples[:num_samples])
+        self.ref_end_count = last_ref_end
         
         # Extract reference phase for fine time alignment
-        ref_fft = np.fft.fft(ref_samples[:1024])
-        ref_phase = np.angle(ref_fft[np.argmax(np.abs(ref_fft))])
+        if ref_status:
+            ref_phase = ref_status[0]['start_phase']
+            ref_freq_offset = float(np.mean([st['freq_offset'] for st in ref_status]))
+            ref_snr = float(np.mean([st['snr_db'] for st in ref_status]))
+        else:
+            ref_fft = np.fft.fft(ref_samples[:1024])
+            ref_phase = np.angle(ref_fft[np.argmax(np.abs(ref_fft))])
+            ref_freq_offset = None
+            ref_snr = None
+        self.ref_phase = ref_phase
+        self.ref_lock = self.ref_tracker.locked
         
         return {
             'station_id': self.station_id,
@@ -144,30 +288,65 @@ class TDOACollector:
             'samples': target_samples,
             'ref_samples': ref_samples,
             'ref_phase': ref_phase,
+            'ref_freq_offset': ref_freq_offset,
+            'ref_snr': ref_snr,
             'sample_rate': self.sdr.sample_rate,
             'center_freq': self.center_freq,
-            'ref_freq': self.ref_freq
+            'ref_freq': self.ref_freq,
+            'integrity': self._record_integrity(integrity)
         }
     
+    def _record_integrity(self, integrity):
+        """Fold one capture's integrity summary into the running counters"""
+        summary = integrity.summary()
+        
+        self.counters['captures'] += 1
+        self.counters['compromised_captures'] += int(summary['compromised'])
+        self.counters['samples_expected'] += summary['samples_expected']
+        self.counters['samples_received'] += summary['samples_received']
+        self.counters['short_reads'] += summary['short_reads']
+        self.counters['suspect_reads'] += summary['suspect_reads']
+        self.counters['queue_high_water'] = max(self.counters['queue_high_water'],
+                                                summary['queue_high_water'])
+        
+        if summary['compromised']:
+            print(f"WARNING: capture integrity compromised "
+                  f"({summary['samples_received']}/{summary['samples_expected']} samples, "
+                  f"{summary['suspect_reads']} stalled reads, "
+                  f"{summary['clock_drift']*1e3:+.1f} ms wall time over sample time)")
+        
+        return summary
+    
     def collect_samples(self, duration=1.0, use_reference=True):
         """Main collection method"""
         if use_reference and self.ref_lock:
-            return self.collect_samples_with_reference(duration)
+            data = self.collect_samples_with_reference(duration)
         else:
             # Standard collection without reference
-            self.sdr.center_freq = self.center_freq
+            integrity = CaptureIntegrity(self.sample_rate)
+            integrity.retune(self.sdr, self.center_freq, settle=0)
             num_samples = int(self.sdr.sample_rate * duration)
             timestamp = time.time()
-            samples = self.sdr.read_samples(num_samples)
+            samples = integrity.read(self.sdr, num_samples, 'target')
             
-            return {
+            data = {
                 'station_id': self.station_id,
                 'timestamp': timestamp,
                 'samples': samples,
                 'sample_rate': self.sdr.sample_rate,
                 'center_freq': self.sdr.center_freq,
-                'ref_freq': None
+                'ref_freq': None,
+                'integrity': self._record_integrity(integrity)
             }
+        
+        data['detection'] = self.squelch.detect(data['samples'])
+        if not data['detection']['detected']:
+            self.counters['empty_captures'] += 1
+        return data
+    
+    def keep_capture(self, data):
+        """False for captures the squelch found empty when discard_empty is set"""
+        return not self.discard_empty or data.get('detection', {}).get('detected', True)
     
     def save_samples(self, data, filename):
         """Save samples to file with metadata"""
@@ -184,16 +363,30 @@ class TDOACollector:
         if 'ref_samples' in data:
             save_dict['ref_samples'] = data['ref_samples']
             save_dict['ref_phase'] = data['ref_phase']
+            if data.get('ref_freq_offset') is not None:
+                save_dict['ref_freq_offset'] = data['ref_freq_offset']
+                save_dict['ref_snr'] = data['ref_snr']
+        
+        # Integrity telemetry and the squelch result travel with the capture as JSON strings
+        if 'integrity' in data:
+            save_dict['integrity'] = json.dumps(data['integrity'])
+        if 'detection' in data:
+            save_dict['detection'] = json.dumps(data['detection'])
         
         np.savez_compressed(filename, **save_dict)
 
 def main():
     import sys
-    station_id = sys.argv[1] if len(sys.argv) > 1 else "station1"
+    # Usage: sync_collect_samples.py [station_id] [host[:port]] [--discard-empty]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    station_id = args[0] if len(args) > 0 else "station1"
+    # Optional central receiver (host[:port]) to stream the capture to
+    processor_addr = args[1] if len(args) > 1 else None
     
     # Initialize collector with reference frequency
     # 174.309 MHz could be a local FM station or other stable signal
     collector = TDOACollector(station_id, ref_freq=SYNC_FREQ)
+    collector.discard_empty = '--discard-empty' in sys.argv
     
     print(f"Station {station_id} TDOA Collector")
     print(f"Target: 162.400 MHz (NOAA WXL68)")
@@ -215,14 +408,36 @@ def main():
     print("Collecting samples...")
     data = collector.collect_samples(duration=2.0)
     
+    detection = data['detection']
+    if detection['snr_db'] is not None:
+        print(f"Target channel: {detection['snr_db']:+.1f} dB over noise floor "
+              f"({'signal' if detection['detected'] else 'no signal'})")
+    if not collector.keep_capture(data):
+        print("No signal on the target channel - capture discarded")
+        return
+    
     # Save data
     filename = f"nice_data/tdoa_{station_id}_{int(data['timestamp'])}.npz"
     collector.save_samples(data, filename)
     print(f"Saved to {filename}")
     
+    if processor_addr:
+        from sample_transport import SampleSender, DEFAULT_PORT
+        host, _, port = processor_addr.partition(':')
+        with SampleSender(host, int(port or DEFAULT_PORT)) as sender:
+            ack = sender.send_capture(data)
+        print(f"Streamed to {processor_addr}: {ack['path']} "
+              f"({ack['latency']*1e3:.1f} ms capture-to-store)")
+    
     # Print phase info if using reference
     if 'ref_phase' in data:
         print(f"Reference phase: {data['ref_phase']:.3f} radians")
+    
+    integrity = data['integrity']
+    print(f"Integrity: {integrity['samples_received']}/{integrity['samples_expected']} samples, "
+          f"{integrity['suspect_reads']} stalled reads, "
+          f"max retune {integrity['max_retune_latency']*1e3:.1f} ms, "
+          f"max read gap {integrity['max_read_gap']*1e3:.1f} ms")
 
 if __name__ == "__main__":
     main()
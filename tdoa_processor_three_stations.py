@@ -6,8 +6,7 @@ Processes synchronized data files from three RTL-SDR stations to locate NOAA tra
 
 import pdb
 import numpy as np
-from scipy import signal
-from scipy.optimize import minimize
+from scipy.optimize import least_squares, minimize
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import folium
@@ -16,6 +15,33 @@ import os
 from datetime import datetime
 import json
 import re
+import time
+import contextlib
+import copy
+import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from capture_format import CAPTURE_PATTERNS, capture_array, open_capture, read_block
+from channelizer import NOAA_CHANNELS, PolyphaseChannelizer
+from fast_correlation import DEFAULT_WORKERS, StreamingCorrelator, correlation_bytes, correlator_for
+from result_cache import ResultCache
+from results_store import ResultsStore
+from stage_metrics import StageMetrics
+
+def lat_lon_to_xy(lat, lon, ref_lat, ref_lon):
+    """Convert lat/lon to local XY coordinates (meters) around a reference point"""
+    meters_per_degree_lat = 111320.0
+    meters_per_degree_lon = meters_per_degree_lat * np.cos(np.radians(ref_lat))
+    
+    x = (lon - ref_lon) * meters_per_degree_lon
+    y = (lat - ref_lat) * meters_per_degree_lat
+    return np.array([x, y])
+
+def xy_to_lat_lon(x, y, ref_lat, ref_lon):
+    """Inverse of lat_lon_to_xy"""
+    lat = ref_lat + y / 111320.0
+    lon = ref_lon + x / (111320.0 * np.cos(np.radians(ref_lat)))
+    return lat, lon
 
 def get_station_id_from(filepath):
     match = re.search(r'tdoa_station(\d+)', filepath)
@@ -59,30 +85,127 @@ class ThreeStationTDOA:
             'freq': '162.400 MHz'
         }
         
+        # Reference (sync) transmitter received on the collector's ref channel.
+        # Set lat/lon so its geometric TDOA can be removed from the clock offsets;
+        # left as None the reference is treated as equidistant from all stations.
+        self.reference_tx = {
+            'name': 'Sync reference',
+            'lat': None,
+            'lon': None
+        }
+        
+        # Capture integrity limits (collector telemetry): captures beyond these
+        # are rejected before correlation, milder problems are down-weighted
+        self.integrity_limits = {
+            'max_drop_fraction': 0.001,
+            'max_suspect_fraction': 0.25,
+            'max_clock_drift': 0.015  # seconds of wall time unaccounted for by samples
+        }
+        
+        # Captures the station squelch tagged as empty (no target signal) are
+        # skipped before correlation; untagged captures are always used
+        self.require_detection = True
+        
+        # Wideband channelizer settings: sub-channels analysed independently,
+        # the power above the local noise floor that marks one as active, and how
+        # far below a neighbouring bin a channel counts as that neighbour's leakage
+        self.channels = list(NOAA_CHANNELS)
+        self.channel_spacing = 25e3
+        self.channel_activity_threshold = 6.0  # dB
+        self.adjacent_channel_rejection = 20.0  # dB
+        
+        # Correlation window length (None = whole capture) and Nelder-Mead options;
+        # both are part of the result cache keys, so changing them invalidates cached results
+        self.correlation_seconds = 0.1
+        self.solver_options = {'maxiter': 10000, 'xatol': 0.1, 'fatol': 1e-3}
+        
+        # Threads shared by the FFTs and the pair thread pool
+        self.fft_workers = DEFAULT_WORKERS
+        
+        # Correlation working-set budget: windows that don't fit are streamed
+        # block by block, searching lags within +/- max_lag_seconds
+        self.memory_budget = 256 * 1024**2
+        self.max_lag_seconds = 0.05
+        
+        # Per-pair TDOA uncertainty: scatter of the delay over this many
+        # sub-windows of the correlation, searched within +/- tdoa_sigma_lags
+        # samples of the pair's peak, never below the floor (in samples)
+        self.tdoa_sigma_segments = 8
+        self.tdoa_sigma_lags = 32
+        self.tdoa_sigma_floor = 0.1
+        
+        # Every fix is appended here; tdoa_results.json only holds the latest
+        self.results_db = os.path.join(self.data_dir, 'tdoa_results.db')
+        
+        # Optional content-addressed result cache (see enable_cache)
+        self.cache = None
+        self.cache_lag_window = 1e-3  # seconds of correlation kept either side of the peak
+        
+        # Optional emitter tracker that warm-starts solves (see enable_tracking)
+        self.tracker = None
+        
+        # Per-stage timings and counters; only kept in memory unless enable_metrics is called
+        self.metrics = StageMetrics()
+        
+        # Plots are drawn from +/- window_s of each correlation peak, decimated to
+        # max_points, by a background process (see submit_plots)
+        self.plot_options = {'dpi': 150, 'formats': ['png'], 'window_s': 200e-6, 'max_points': 2000}
+        self.renderer = None
+        
         self.data_files = {}
         self.tdoa_results = {}
+        self.clock_offsets = {}
+        self.station_weights = {}
+        self.channel_results = {}
+        self._capture_index = {}
+        self._processed_groups = set()
 
         
-    def find_synchronized_files(self):
-        """Find and group synchronized data files"""
-        print(f"\nSearching for data files in '{self.data_dir}'...")
-        
-        npz_files = glob.glob(os.path.join(self.data_dir, 'tdoa_*.npz'))
+    def enable_cache(self, cache_dir=None, max_bytes=512 * 1024**2):
+        """Cache pair correlations and solves keyed on capture content and parameters"""
+        cache_dir = cache_dir or os.path.join(self.data_dir, '.tdoa_cache')
+        self.cache = ResultCache(cache_dir, max_bytes)
+        return self.cache
+    
+    def enable_tracking(self, **options):
+        """Track fixes over time and seed each solve from the track's prediction"""
+        from emitter_tracker import TrackBank
+        ref_lat = np.mean([pos['lat'] for pos in self.station_positions.values()])
+        ref_lon = np.mean([pos['lon'] for pos in self.station_positions.values()])
+        self.tracker = TrackBank(ref_lat, ref_lon, **options)
+        return self.tracker
+    
+    def enable_metrics(self, jsonl_path=None, prometheus_path=None, profile_dir=None, trace_memory=False):
+        """Write per-stage metrics as JSON lines and/or a Prometheus text file, optionally profiling"""
+        jsonl_path = jsonl_path or os.path.join(self.data_dir, 'tdoa_metrics.jsonl')
+        self.metrics = StageMetrics(jsonl_path, prometheus_path, profile_dir, trace_memory)
+        return self.metrics
+    
+    def group_capture_files(self, verbose=True):
+        """Scan data_dir and group capture files by (rounded) timestamp"""
+        # .npz captures from the collector and raw IQ + sidecar captures from GNU Radio
+        capture_files = []
+        for pattern in CAPTURE_PATTERNS:
+            capture_files.extend(glob.glob(os.path.join(self.data_dir, pattern)))
 
         # breakpoint()
         
-        if not npz_files:
-            raise ValueError(f"No .npz files found in {self.data_dir}")
-        
         # Group files by timestamp
         file_groups = {}
         
-        for filepath in npz_files:
+        for filepath in capture_files:
             try:
-                data = np.load(filepath)
-                # breakpoint()
-                timestamp = float(data['timestamp'])
-                station_id = str(data['station_id'])
+                # Metadata is re-read only when a file is new or has changed
+                st = os.stat(filepath)
+                stamp = (st.st_size, st.st_mtime_ns)
+                cached = self._capture_index.get(filepath)
+                if cached is not None and cached[0] == stamp:
+                    timestamp = cached[1]
+                else:
+                    data = open_capture(filepath)
+                    # breakpoint()
+                    timestamp = float(data['timestamp'])
+                    self._capture_index[filepath] = (stamp, timestamp)
                 station_id = get_station_id_from(filepath)
                 
                 # Round to nearest second for grouping
@@ -91,12 +214,24 @@ class ThreeStationTDOA:
                 if time_key not in file_groups:
                     file_groups[time_key] = {}
                 
-                print(f"{filepath} time_key={time_key} station_id={station_id}")
+                if verbose:
+                    print(f"{filepath} time_key={time_key} station_id={station_id}")
                 file_groups[time_key][station_id] = filepath
                 
             except Exception as e:
                 print(f"Error reading {filepath}: {e}")
         
+        return file_groups
+    
+    def find_synchronized_files(self):
+        """Find and group synchronized data files"""
+        print(f"\nSearching for data files in '{self.data_dir}'...")
+        
+        file_groups = self.group_capture_files()
+        
+        if not file_groups:
+            raise ValueError(f"No capture files found in {self.data_dir}")
+        
         # Find the best synchronized set (closest to 3 stations)
         best_group = None
         best_count = 0
@@ -125,48 +260,246 @@ class ThreeStationTDOA:
         self.station_data = {}
         
         for station_id, filepath in self.data_files.items():
-            data = np.load(filepath)
+            data = open_capture(filepath)
             
+            # Sample arrays stay on disk (memmaps / compressed streams) and are
+            # read as complex64 blocks by the correlators and the channelizer
             self.station_data[station_id] = {
-                'samples': data['samples'],
+                'samples': capture_array(data, 'samples'),
                 'timestamp': float(data['timestamp']),
                 'sample_rate': float(data['sample_rate']),
                 'center_freq': float(data['center_freq'])
             }
             
+            samples = self.station_data[station_id]['samples']
+            self.metrics.add('captures', 1)
+            self.metrics.add('capture_bytes', len(samples) * samples.dtype.itemsize)
+            
+            if self.cache is not None:
+                self.station_data[station_id]['digest'] = self.cache.capture_digest(filepath)
+            
+            # Timing/sample-count telemetry recorded by the collector
+            if 'integrity' in data.files:
+                self.station_data[station_id]['integrity'] = json.loads(str(data['integrity']))
+            if 'detection' in data.files:
+                self.station_data[station_id]['detection'] = json.loads(str(data['detection']))
+            
+            # Reference channel recorded by the collector in frequency-hopping mode
+            if 'ref_samples' in data.files:
+                self.station_data[station_id]['ref_samples'] = capture_array(data, 'ref_samples')
+                self.station_data[station_id]['ref_phase'] = float(data['ref_phase'])
+                self.station_data[station_id]['ref_freq'] = float(data['ref_freq'])
+            
             print(f"\n{station_id}:")
-            print(f"  Samples: {len(data['samples'])}")
+            print(f"  Samples: {len(samples)}")
             print(f"  Sample rate: {data['sample_rate']/1e6:.3f} MHz")
             print(f"  Center freq: {data['center_freq']/1e6:.3f} MHz")
+            if 'ref_samples' in data.files:
+                print(f"  Reference: {data['ref_freq']/1e6:.3f} MHz, "
+                      f"{len(self.station_data[station_id]['ref_samples'])} samples")
     
-    def calculate_correlation(self, sig1, sig2, sample_rate):
-        """Calculate cross-correlation between two signals"""
-        # Use a reasonable correlation length (100ms of data)
-        corr_length = int(0.1 * sample_rate)
-        sig1_segment = sig1[:corr_length]
-        sig2_segment = sig2[:corr_length]
-        
-        # Remove DC and normalize
-        sig1_segment = sig1_segment - np.mean(sig1_segment)
-        sig2_segment = sig2_segment - np.mean(sig2_segment)
+    def check_capture_integrity(self, require_detection=None):
+        """Reject empty captures and reject or down-weight those whose telemetry shows gaps or stalls"""
+        require_detection = self.require_detection if require_detection is None else require_detection
+        self.station_weights = {}
+        rejected = []
+        
+        for station_id, data in self.station_data.items():
+            detection = data.get('detection')
+            if require_detection and detection is not None and not detection['detected']:
+                rejected.append(station_id)
+                print(f"\nRejecting {station_id}: station squelch found no signal on the target channel")
+                continue
+            
+            integrity = data.get('integrity')
+            if integrity is None:
+                self.station_weights[station_id] = 1.0
+                continue
+            
+            expected = max(integrity['samples_expected'], 1)
+            drop_fraction = 1.0 - integrity['samples_received'] / expected
+            suspect_fraction = integrity['suspect_reads'] / max(integrity['reads'], 1)
+            clock_drift = integrity.get('clock_drift', 0.0)
+            
+            if (drop_fraction > self.integrity_limits['max_drop_fraction'] or
+                    suspect_fraction > self.integrity_limits['max_suspect_fraction'] or
+                    clock_drift > self.integrity_limits['max_clock_drift']):
+                rejected.append(station_id)
+                print(f"\nRejecting {station_id}: {drop_fraction*100:.2f}% samples missing, "
+                      f"{integrity['suspect_reads']}/{integrity['reads']} stalled reads, "
+                      f"{clock_drift*1e3:+.1f} ms wall time over sample time")
+                continue
+            
+            weight = ((1.0 - drop_fraction / self.integrity_limits['max_drop_fraction']) *
+                      (1.0 - suspect_fraction / self.integrity_limits['max_suspect_fraction']))
+            self.station_weights[station_id] = weight
+            
+            if weight < 1.0:
+                print(f"\nDown-weighting {station_id} to {weight:.2f} "
+                      f"({integrity['suspect_reads']}/{integrity['reads']} stalled reads)")
         
-        # Normalize power
-        sig1_segment = sig1_segment / (np.std(sig1_segment) + 1e-10)
-        sig2_segment = sig2_segment / (np.std(sig2_segment) + 1e-10)
+        for station_id in rejected:
+            del self.station_data[station_id]
         
-        # Cross-correlation using FFT method for speed
-        correlation = signal.correlate(sig1_segment, sig2_segment, mode='full', method='fft')
-        lags = signal.correlation_lags(len(sig1_segment), len(sig2_segment), mode='full')
+        return len(self.station_data)
+    
+    def correlation_length(self, sample_rate, *signals):
+        """Samples correlated: correlation_seconds worth, or all of the shortest signal"""
+        n = min(len(sig) for sig in signals)
+        if self.correlation_seconds is not None:
+            n = min(n, int(self.correlation_seconds * sample_rate))
+        return n
+    
+    def calculate_correlation(self, sig1, sig2, sample_rate):
+        """Calculate cross-correlation between two signals"""
+        correlator = correlator_for(self.correlation_length(sample_rate, sig1, sig2), self.fft_workers)
         
+        # DC removal, power normalisation and the FFT happen in complex64 scratch buffers
+        correlation, lags = correlator.correlate(correlator.spectrum(sig1), correlator.spectrum(sig2))
+        return self.correlation_peak(correlation, lags, sample_rate)
+    
+    def correlation_peak(self, correlation, lags, sample_rate):
+        """(time delay, correlation, lags, peak magnitude) with a sub-sample peak lag"""
         # Find peak
-        peak_idx = np.argmax(np.abs(correlation))
+        magnitude = np.abs(correlation)
+        peak_idx = np.argmax(magnitude)
         peak_lag = lags[peak_idx]
-        peak_value = np.abs(correlation[peak_idx])
+        peak_value = magnitude[peak_idx]
+        
+        # Parabolic interpolation for a sub-sample lag (matters at channel rates)
+        if 0 < peak_idx < len(magnitude) - 1:
+            y0, y1, y2 = magnitude[peak_idx - 1:peak_idx + 2]
+            denom = y0 - 2*y1 + y2
+            if denom != 0:
+                peak_lag = peak_lag + 0.5 * (y0 - y2) / denom
         
         # Convert lag to time
-        time_delay = peak_lag / sample_rate
+        time_delay = float(peak_lag / sample_rate)
         
-        return time_delay, correlation, lags, peak_value
+        return time_delay, correlation, lags, float(peak_value)
+    
+    def correlation_method(self, n_signals, n_pairs, n):
+        """How n-sample correlations are computed: in memory, or streamed under the budget"""
+        if correlation_bytes(n_signals, n_pairs, n) > self.memory_budget:
+            return ('streamed', self.max_lag_seconds, self.memory_budget)
+        return ('in-memory',)
+    
+    def cached_correlation(self, key_parts, sample_rate, n, method=('in-memory',)):
+        """(cache key, cached result or None); the key is None when caching is off"""
+        if self.cache is None or key_parts is None:
+            return None, None
+        # Correlated length and method are part of the key as well as the samples
+        key = self.cache.key('correlation', key_parts, sample_rate, self.correlation_seconds, n, method)
+        return key, self.cache.get(key)
+    
+    def store_correlation(self, key, result, sample_rate):
+        if key is None:
+            return
+        time_delay, correlation, lags, peak = result
+        # Only the region around the peak is kept (plenty for the plots); the
+        # peak itself is already reduced
+        centre = int(np.argmax(np.abs(correlation)))
+        half = int(self.cache_lag_window * sample_rate)
+        keep = slice(max(centre - half, 0), centre + half + 1)
+        self.cache.put(key, (time_delay, correlation[keep], lags[keep], peak))
+    
+    def correlate_pair(self, key_parts, sig1, sig2, sample_rate):
+        """calculate_correlation through the result cache when one is enabled"""
+        n = self.correlation_length(sample_rate, sig1, sig2)
+        key, cached = self.cached_correlation(key_parts, sample_rate, n)
+        if cached is not None:
+            return cached
+        
+        result = self.calculate_correlation(sig1, sig2, sample_rate)
+        self.store_correlation(key, result, sample_rate)
+        return result
+    
+    def reference_geometric_tdoa(self, stat1, stat2):
+        """Expected reference-channel TDOA between two stations from geometry alone"""
+        if self.reference_tx.get('lat') is None or self.reference_tx.get('lon') is None:
+            return 0.0
+        
+        ref_lat, ref_lon = self.reference_tx['lat'], self.reference_tx['lon']
+        pos1, pos2 = self.station_positions[stat1], self.station_positions[stat2]
+        dist1 = np.linalg.norm(lat_lon_to_xy(pos1['lat'], pos1['lon'], ref_lat, ref_lon))
+        dist2 = np.linalg.norm(lat_lon_to_xy(pos2['lat'], pos2['lon'], ref_lat, ref_lon))
+        return (dist1 - dist2) / self.c
+    
+    def align_reference_clocks(self, window=0.1):
+        """Measure each station's sample-clock offset and drift from the common reference channel"""
+        self.clock_offsets = {}
+        stations = [s for s, d in self.station_data.items() if 'ref_samples' in d]
+        
+        if len(stations) < 2:
+            print("\nNo common reference channel - falling back to timestamp alignment")
+            return False
+        
+        print("\n" + "="*50)
+        print("Aligning Station Clocks on Reference Channel")
+        print("="*50)
+        
+        if self.reference_tx.get('lat') is None:
+            print("  Reference transmitter position unknown - assuming equidistant stations")
+        
+        # All offsets are relative to the first station's clock
+        base = stations[0]
+        base_data = self.station_data[base]
+        self.clock_offsets[base] = {'offset': 0.0, 'drift': 0.0, 'ref_time': 0.0, 'quality': None}
+        
+        for stat in stations[1:]:
+            data = self.station_data[stat]
+            sample_rate = base_data['sample_rate']
+            win = int(window * sample_rate)
+            n = min(len(base_data['ref_samples']), len(data['ref_samples']))
+            
+            digests = (base_data.get('digest'), data.get('digest'))
+            key_parts = None if None in digests else digests + ('ref', window, n)
+            
+            self.metrics.add('bytes_read', 2 * min(n, win) * (2 if n >= 2 * win else 1) *
+                             data['ref_samples'].dtype.itemsize)
+            
+            # Reuse the pair correlation engine on a window at each end of the capture
+            early, _, _, quality = self.correlate_pair(
+                key_parts and key_parts + ('early',),
+                base_data['ref_samples'][:min(n, win)], data['ref_samples'][:min(n, win)], sample_rate)
+            t_early = 0.5 * window
+            
+            if n >= 2 * win:
+                late, _, _, _ = self.correlate_pair(
+                    key_parts and key_parts + ('late',),
+                    base_data['ref_samples'][n - win:n], data['ref_samples'][n - win:n], sample_rate)
+                t_late = (n - win / 2) / sample_rate
+                drift = (late - early) / (t_late - t_early)
+            else:
+                drift = 0.0
+            
+            # measured(base, stat) = geometric(base, stat) + clock[base] - clock[stat]
+            geometric = self.reference_geometric_tdoa(base, stat)
+            offset = geometric - early
+            self.clock_offsets[stat] = {
+                'offset': offset,
+                'drift': -drift,
+                'ref_time': t_early,
+                'quality': quality
+            }
+            
+            print(f"\n{stat} relative to {base}:")
+            print(f"  Clock offset: {offset*1e6:+.2f} μs")
+            print(f"  Clock drift: {-drift*1e6:+.3f} μs/s")
+            print(f"  Reference correlation peak: {quality:.3f}")
+        
+        return True
+    
+    def clock_correction(self, stat1, stat2, t):
+        """Clock offset difference (stat1 - stat2) at capture time t, or None if unaligned"""
+        if stat1 not in self.clock_offsets or stat2 not in self.clock_offsets:
+            return None
+        
+        def offset_at(stat):
+            clock = self.clock_offsets[stat]
+            return clock['offset'] + clock['drift'] * (t - clock['ref_time'])
+        
+        return offset_at(stat1) - offset_at(stat2)
     
     def compute_all_tdoa(self):
         """Compute TDOA between all station pairs"""
@@ -179,104 +512,234 @@ class ThreeStationTDOA:
         self.tdoa_pairs = {}
         self.correlation_quality = {}
         
+        pairs = [(stations[i], stations[j])
+                 for i in range(len(stations)) for j in range(i + 1, len(stations))]
+        sample_rate = self.station_data[stations[0]]['sample_rate'] if stations else None
+        n = self.correlation_length(sample_rate, *(d['samples'] for d in self.station_data.values())) \
+            if stations else 0
+        # Chosen for the whole group so that cached and fresh pairs agree on it
+        method = self.correlation_method(len(stations), len(pairs), n)
+        
+        # Cached pairs first; only the rest need spectra
+        results, pending, keys, windows = {}, {}, {}, {}
+        for stat1, stat2 in pairs:
+            data1 = self.station_data[stat1]
+            data2 = self.station_data[stat2]
+            digests = (data1.get('digest'), data2.get('digest'))
+            key_parts = None if None in digests else digests + ('samples', data1['center_freq'])
+            key, cached = self.cached_correlation(key_parts, data1['sample_rate'], n, method)
+            keys[(stat1, stat2)] = key
+            if cached is not None:
+                results[(stat1, stat2)] = cached
+            else:
+                pending[(stat1, stat2)] = key
+        
+        needed = sorted({stat for pair in pending for stat in pair})
+        self.metrics.record(pairs=len(pairs), cached_pairs=len(results), correlation_samples=n)
+        for stat in needed:
+            samples = self.station_data[stat]['samples']
+            self.metrics.add('bytes_read', n * samples.dtype.itemsize)
+        
+        if pending and method[0] == 'streamed':
+            # Too long to hold: accumulate cross-spectra block by block, one
+            # sequential pass over each capture shared by all pairs
+            correlator = StreamingCorrelator(self.max_lag_seconds * sample_rate, self.memory_budget,
+                                             n_buffers=2 * len(needed) + len(pending) + 4,
+                                             workers=self.fft_workers)
+            print(f"\nStreaming {n/sample_rate:.1f} s per station in {-(-n // correlator.block)} blocks "
+                  f"(lags within +/-{self.max_lag_seconds*1e3:.0f} ms, "
+                  f"{self.memory_budget/2**20:.0f} MB budget)")
+            self.metrics.record(fft_size=correlator.nfft, streamed_blocks=-(-n // correlator.block))
+            signals = {stat: self.station_data[stat]['samples'] for stat in needed}
+            for pair, (correlation, lags) in correlator.correlate(signals, list(pending), n).items():
+                results[pair] = self.correlation_peak(correlation, lags, sample_rate)
+                self.store_correlation(pending[pair], results[pair], sample_rate)
+        
+        elif pending:
+            # One forward FFT per station, shared by all of its pairs; the FFTs
+            # release the GIL, so stations and pairs run on a thread pool with
+            # the FFT threads split between them
+            correlator = correlator_for(n, self.fft_workers)
+            self.metrics.record(fft_size=correlator.nfft)
+            
+            n_threads = min(len(needed), self.fft_workers)
+            fft_threads = max(1, self.fft_workers // n_threads)
+            # Each window is read once and kept for the uncertainty pass below
+            windows = {stat: read_block(self.station_data[stat]['samples'], 0, n) for stat in needed}
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                spectra = dict(zip(needed, pool.map(
+                    lambda stat: correlator.spectrum(windows[stat], fft_threads), needed)))
+                
+                fft_threads = max(1, self.fft_workers // min(len(pending), self.fft_workers))
+                futures = {pair: pool.submit(correlator.correlate,
+                                             spectra[pair[0]], spectra[pair[1]], fft_threads)
+                           for pair in pending}
+                for pair, future in futures.items():
+                    results[pair] = self.correlation_peak(*future.result(), sample_rate)
+                    self.store_correlation(pending[pair], results[pair], sample_rate)
+        
+        # A second, cheaper pass over sub-windows for each pair's uncertainty;
+        # timed as its own stage because it runs on every group
+        with self.metrics.stage('tdoa_sigma'):
+            self.metrics.record(sigma_segments=self.tdoa_sigma_segments, sigma_lags=self.tdoa_sigma_lags)
+            sigmas = self.pair_sigmas(pairs, keys, {pair: result[0] * sample_rate
+                                                    for pair, result in results.items()},
+                                      n, sample_rate, windows) if pairs else {}
+        
         # Calculate TDOA for each pair
         pair_count = 0
-        for i in range(len(stations)):
-            for j in range(i + 1, len(stations)):
-                stat1, stat2 = stations[i], stations[j]
-                
-                data1 = self.station_data[stat1]
-                data2 = self.station_data[stat2]
-                
-                # Calculate correlation
-                time_delay, corr, lags, peak = self.calculate_correlation(
-                    data1['samples'],
-                    data2['samples'],
-                    data1['sample_rate']
-                )
-                
-                # Account for any GPS timestamp differences
+        for stat1, stat2 in pairs:
+            data1 = self.station_data[stat1]
+            data2 = self.station_data[stat2]
+            time_delay, corr, lags, peak = results[(stat1, stat2)]
+            
+            # Prefer the reference-channel clock alignment (evaluated at the
+            # centre of the correlation window), else GPS timestamp differences
+            correction = self.clock_correction(stat1, stat2, n / sample_rate / 2)
+            if correction is not None:
+                adjusted_delay = time_delay - correction
+            else:
                 gps_diff = data1['timestamp'] - data2['timestamp']
                 adjusted_delay = time_delay + gps_diff
-                
-                # Store results
-                pair_key = f"{stat1}-{stat2}"
-                self.tdoa_pairs[pair_key] = {
-                    'stations': (stat1, stat2),
-                    'tdoa': adjusted_delay,
-                    'correlation': corr,
-                    'lags': lags,
-                    'peak_value': peak,
-                    'sample_rate': data1['sample_rate']
-                }
-                
-                self.correlation_quality[pair_key] = peak
-                
-                # Convert to distance difference
-                distance_diff = adjusted_delay * self.c
-                
-                print(f"\n{pair_key}:")
-                print(f"  Time delay: {adjusted_delay*1e6:+.2f} μs")
-                print(f"  Distance difference: {distance_diff:+.1f} m")
-                print(f"  Correlation peak: {peak:.3f}")
-                
-                pair_count += 1
-        
-        print(f"\nProcessed {pair_count} station pairs")
-    
-    def plot_correlations(self):
-        """Plot correlation functions for all pairs"""
-        n_pairs = len(self.tdoa_pairs)
-        fig, axes = plt.subplots(n_pairs, 1, figsize=(12, 4*n_pairs))
-        
-        if n_pairs == 1:
-            axes = [axes]
-        
-        for idx, (pair_key, data) in enumerate(self.tdoa_pairs.items()):
-            ax = axes[idx]
             
-            # Convert lags to microseconds
-            time_lags = data['lags'] / data['sample_rate'] * 1e6
+            # Store results
+            pair_key = f"{stat1}-{stat2}"
+            self.tdoa_pairs[pair_key] = {
+                'stations': (stat1, stat2),
+                'tdoa': adjusted_delay,
+                'lag_delay': time_delay,
+                'correlation': corr,
+                'lags': lags,
+                'peak_value': peak,
+                'sample_rate': data1['sample_rate'],
+                'sigma': sigmas[(stat1, stat2)],
+                'weight': min(self.station_weights.get(stat1, 1.0),
+                              self.station_weights.get(stat2, 1.0))
+            }
             
-            # Plot correlation
-            ax.plot(time_lags, np.abs(data['correlation']), 'b-', alpha=0.7)
+            self.correlation_quality[pair_key] = peak
             
-            # Mark peak
-            peak_time = data['tdoa'] * 1e6
-            ax.axvline(x=peak_time, color='r', linestyle='--', linewidth=2,
-                      label=f'Peak: {peak_time:.2f} μs')
+            # Convert to distance difference
+            distance_diff = adjusted_delay * self.c
             
-            # Formatting
-            ax.set_xlabel('Time Lag (μs)')
-            ax.set_ylabel('Correlation')
-            ax.set_title(f'Cross-Correlation: {pair_key} (Quality: {data["peak_value"]:.3f})')
-            ax.grid(True, alpha=0.3)
-            ax.legend()
+            print(f"\n{pair_key}:")
+            print(f"  Time delay: {adjusted_delay*1e6:+.2f} ± {sigmas[(stat1, stat2)]*1e6:.3f} μs")
+            print(f"  Distance difference: {distance_diff:+.1f} m")
+            print(f"  Correlation peak: {peak:.3f}")
             
-            # Limit x-axis to ±200 microseconds
-            ax.set_xlim(-200, 200)
+            pair_count += 1
         
-        plt.tight_layout()
-        output_file = os.path.join(self.data_dir, 'correlation_analysis.png')
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        print(f"\nSaved correlation plots to: {output_file}")
-        plt.close()
+        print(f"\nProcessed {pair_count} station pairs")
+    
+    def pair_sigmas(self, pairs, keys, lags, n, sample_rate, windows=None):
+        """
+        1-sigma TDOA (s) of each pair from the scatter of its delay over
+        tdoa_sigma_segments sub-windows of the n correlated samples, scaled
+        to the full window by sqrt(L/n). Tracks the correlation SNR where a
+        closed-form bound from the peak shape is far too optimistic for
+        narrowband FM; never below tdoa_sigma_floor samples.
+        
+        Each sub-window is only correlated at the lags within tdoa_sigma_lags
+        of the pair's peak (in samples, `lags`), by direct dot products, so
+        the pass costs a fraction of the main correlation. `windows` holds
+        station windows already read into memory (zero beyond n); the rest
+        are read again from the captures.
+        """
+        K, W = self.tdoa_sigma_segments, self.tdoa_sigma_lags
+        floor = self.tdoa_sigma_floor / sample_rate
+        L = n // max(K, 1)
+        if K < 2 or L < 4 * W:
+            return {pair: floor for pair in pairs}
+        
+        scatter, pending = {}, {}
+        for pair in pairs:
+            key = None if self.cache is None or keys.get(pair) is None else \
+                self.cache.key('tdoa_sigma', keys[pair], K, L, W)
+            cached = None if key is None else self.cache.get(key)
+            if cached is not None:
+                scatter[pair] = cached
+            else:
+                pending[pair] = key
+        
+        if pending:
+            # Per station, the span each segment needs: its own L samples as
+            # the second of a pair, shifted by the peak lag +/- W as the first
+            centres = {pair: int(round(lags[pair])) for pair in pending}
+            spans = {}
+            for (stat1, stat2), centre in centres.items():
+                for stat, lo, hi in ((stat1, centre - W, centre + W + L), (stat2, 0, L)):
+                    old = spans.get(stat, (lo, hi))
+                    spans[stat] = (min(old[0], lo), max(old[1], hi))
+            
+            # Segments overlap by the lag spread; carrying the overlap over keeps
+            # the reads sequential, which streamed (compressed) captures need
+            signals = {stat: windows[stat] if windows and stat in windows else self.station_data[stat]['samples']
+                       for stat in spans}
+            delays = {pair: [] for pair in pending}
+            blocks = {}
+            for k in range(K):
+                for stat, (lo, hi) in spans.items():
+                    start, stop = k * L + lo, k * L + hi
+                    if stat in blocks and blocks[stat][1] > start:
+                        kept = blocks[stat][2][start - blocks[stat][0]:]
+                        fresh = read_block(signals[stat], blocks[stat][1], stop)
+                        blocks[stat] = (start, stop, np.concatenate([kept, fresh]))
+                    else:
+                        blocks[stat] = (start, stop,
+                                        read_block(signals[stat], start, stop))
+                
+                for (stat1, stat2), centre in centres.items():
+                    offset = k * L + centre - W - blocks[stat1][0]
+                    seg1 = blocks[stat1][2][offset:offset + L + 2 * W]
+                    offset = k * L - blocks[stat2][0]
+                    seg2 = blocks[stat2][2][offset:offset + L]
+                    seg1 = seg1 - seg1.mean()
+                    seg2 = seg2 - seg2.mean()
+                    # correlation[j] = sum seg1[i + j] * conj(seg2[i]), lag centre - W + j
+                    correlation = np.array([np.vdot(seg2, seg1[j:j + L]) for j in range(2 * W + 1)])
+                    delays[(stat1, stat2)].append(self.correlation_peak(
+                        correlation, np.arange(centre - W, centre + W + 1), sample_rate)[0])
+            
+            for pair, key in pending.items():
+                scatter[pair] = float(np.std(delays[pair], ddof=1) * np.sqrt(L / n))
+                if key is not None:
+                    self.cache.put(key, scatter[pair])
+        
+        return {pair: max(value, floor) for pair, value in scatter.items()}
+    
+    def plot_correlations(self):
+        """Plot correlation functions for all pairs"""
+        from plot_worker import plot_payload, render_correlations
+        payload = plot_payload(self, self.plot_options['window_s'], self.plot_options['max_points'])
+        for output_file in render_correlations(payload, self.plot_options['dpi'], self.plot_options['formats']):
+            print(f"\nSaved correlation plots to: {output_file}")
+    
+    def submit_plots(self):
+        """Queue the correlation and analysis plots on the background renderer; returns a Future"""
+        from plot_worker import PlotRenderer, plot_payload
+        if self.renderer is None:
+            self.renderer = PlotRenderer(self.plot_options['dpi'], self.plot_options['formats'])
+        payload = plot_payload(self, self.plot_options['window_s'], self.plot_options['max_points'])
+        return self.renderer.submit(payload)
+    
+    def close_renderer(self):
+        """Wait for the queued plots and stop the background renderer"""
+        if self.renderer is None:
+            return
+        for output_file in self.renderer.close():
+            print(f"Saved plot to: {output_file}")
+        self.renderer = None
     
-    def multilateration(self):
-        """Perform TDOA multilateration to find transmitter position"""
+    def multilateration(self, initial_position=None):
+        """Perform TDOA multilateration to find transmitter position
+
+        initial_position ({'lat', 'lon'}, e.g. a track prediction) warm-starts a
+        Gauss-Newton style least-squares solve instead of the cold Nelder-Mead search
+        """
         print("\n" + "="*50)
         print("Performing Multilateration")
         print("="*50)
         
-        # Convert lat/lon to local XY coordinates (meters)
-        def lat_lon_to_xy(lat, lon, ref_lat, ref_lon):
-            meters_per_degree_lat = 111320.0
-            meters_per_degree_lon = meters_per_degree_lat * np.cos(np.radians(ref_lat))
-            
-            x = (lon - ref_lon) * meters_per_degree_lon
-            y = (lat - ref_lat) * meters_per_degree_lat
-            return np.array([x, y])
-        
         # Use center of stations as reference
         ref_lat = np.mean([pos['lat'] for pos in self.station_positions.values()])
         ref_lon = np.mean([pos['lon'] for pos in self.station_positions.values()])
@@ -287,9 +750,10 @@ class ThreeStationTDOA:
             if stat_id in self.station_data:
                 station_xy[stat_id] = lat_lon_to_xy(pos['lat'], pos['lon'], ref_lat, ref_lon)
         
-        # Objective function for optimization
-        def tdoa_objective(tx_xy):
-            error = 0
+        # Residuals as range differences (m) so the solvers' absolute tolerances
+        # are meaningful, weighted by capture integrity
+        def tdoa_residuals(tx_xy):
+            residuals = []
             for pair_key, data in self.tdoa_pairs.items():
                 stat1, stat2 = data['stations']
                 
@@ -301,29 +765,68 @@ class ThreeStationTDOA:
                     # Predicted TDOA
                     predicted_tdoa = (dist1 - dist2) / self.c
                     
-                    # Squared error
-                    error += (predicted_tdoa - data['tdoa']) ** 2
+                    residuals.append(np.sqrt(data.get('weight', 1.0)) *
+                                     (predicted_tdoa - data['tdoa']) * self.c)
             
-            return error
+            return np.array(residuals)
         
-        # Initial guess: centroid of stations
-        initial_xy = np.mean(list(station_xy.values()), axis=0)
-        
-        # Optimize
-        result = minimize(tdoa_objective, initial_xy, method='Nelder-Mead',
-                         options={'maxiter': 10000})
+        # Objective function for optimization
+        def tdoa_objective(tx_xy):
+            return np.sum(tdoa_residuals(tx_xy) ** 2)
+        
+        # Initial guess: the supplied position, else the centroid of stations
+        if initial_position is not None:
+            initial_xy = lat_lon_to_xy(initial_position['lat'], initial_position['lon'], ref_lat, ref_lon)
+            method = 'least_squares'
+        else:
+            initial_xy = np.mean(list(station_xy.values()), axis=0)
+            method = 'nelder-mead'
+        
+        # Solves are cached on the measurements, geometry and the solver options
+        # they use (Nelder-Mead only); warm solves also on their start point,
+        # which decides where they converge
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                'solve', method,
+                sorted((list(d['stations']), float(d['tdoa']), float(d.get('weight', 1.0)))
+                       for d in self.tdoa_pairs.values()),
+                sorted((s, xy.tolist()) for s, xy in station_xy.items()),
+                self.solver_options if method == 'nelder-mead' else None,
+                initial_xy.tolist() if method == 'least_squares' else None)
+            cached = self.cache.get(cache_key)
+        
+        if cache_key is not None and cached is not None:
+            solution, fun, success, evaluations = cached
+        elif method == 'least_squares':
+            result = least_squares(tdoa_residuals, initial_xy)
+            solution, fun, success, evaluations = result.x, 2 * result.cost, result.success, result.nfev
+            if cache_key is not None:
+                self.cache.put(cache_key, (solution, fun, success, evaluations))
+        else:
+            # Optimize. The centroid is the origin of the local frame, where Nelder-Mead's
+            # default simplex would be sub-millimetre; start from a kilometre-scale one.
+            initial_simplex = initial_xy + np.array([[0.0, 0.0], [1000.0, 0.0], [0.0, 1000.0]])
+            result = minimize(tdoa_objective, initial_xy, method='Nelder-Mead',
+                             options=dict(self.solver_options, initial_simplex=initial_simplex))
+            solution, fun, success, evaluations = result.x, result.fun, result.success, result.nfev
+            if cache_key is not None:
+                self.cache.put(cache_key, (solution, fun, success, evaluations))
         
         # Convert back to lat/lon
-        est_x, est_y = result.x
-        est_lat = ref_lat + est_y / 111320.0
-        est_lon = ref_lon + est_x / (111320.0 * np.cos(np.radians(ref_lat)))
+        est_x, est_y = solution
+        est_lat, est_lon = xy_to_lat_lon(est_x, est_y, ref_lat, ref_lon)
         
         self.estimated_position = {
             'lat': est_lat,
             'lon': est_lon,
-            'optimization_error': result.fun,
-            'success': result.success
+            'optimization_error': fun,
+            'success': success,
+            'evaluations': evaluations  # objective/residual evaluations, comparable across solvers
         }
+        self.metrics.record(solver=method, evaluations=int(evaluations),
+                            solver_cached=cache_key is not None and cached is not None)
+        self.estimated_position.update(self.position_uncertainty(solution, station_xy))
         
         # Calculate error from actual position
         actual_xy = lat_lon_to_xy(self.actual_tx['lat'], self.actual_tx['lon'], ref_lat, ref_lon)
@@ -339,7 +842,62 @@ class ThreeStationTDOA:
         print(f"  Latitude:  {self.actual_tx['lat']:.6f}°")
         print(f"  Longitude: {self.actual_tx['lon']:.6f}°")
         print(f"\nPosition error: {position_error:.1f} meters")
-        print(f"Optimization successful: {result.success}")
+        if 'semi_major_m' in self.estimated_position:
+            print(f"1-sigma error ellipse: {self.estimated_position['semi_major_m']:.0f} x "
+                  f"{self.estimated_position['semi_minor_m']:.0f} m, major axis at "
+                  f"{self.estimated_position['orientation_deg']:.0f}° from north")
+        print(f"Optimization successful: {success} ({evaluations} function evaluations, "
+              f"{'warm' if initial_position is not None else 'cold'} start)")
+    
+    def position_uncertainty(self, tx_xy, station_xy):
+        """
+        1-sigma position covariance from the range-difference model linearised
+        at the fix. Pairs sharing a station share its timing error, so the pair
+        covariance is D (A A^T / 2) D with A the pair/station incidence matrix
+        and D the per-pair sigmas; when the pairs over-determine the fix the
+        covariance is scaled up by the reduced chi-square of the residuals.
+        """
+        stations = sorted(station_xy)
+        rows, residuals, sigmas, incidence = [], [], [], []
+        for data in self.tdoa_pairs.values():
+            stat1, stat2 = data['stations']
+            if stat1 in station_xy and stat2 in station_xy:
+                u1 = tx_xy - station_xy[stat1]
+                u2 = tx_xy - station_xy[stat2]
+                rows.append(u1 / np.linalg.norm(u1) - u2 / np.linalg.norm(u2))
+                residuals.append(np.linalg.norm(u1) - np.linalg.norm(u2) - self.c * data['tdoa'])
+                sigma = data.get('sigma', self.tdoa_sigma_floor / data['sample_rate'])
+                sigmas.append(self.c * sigma / np.sqrt(data.get('weight', 1.0)))
+                row = np.zeros(len(stations))
+                row[stations.index(stat1)], row[stations.index(stat2)] = 1.0, -1.0
+                incidence.append(row)
+        
+        if len(rows) < 2:
+            return {}
+        J = np.array(rows)
+        r = np.array(residuals)
+        D = np.diag(sigmas)
+        A = np.array(incidence)
+        
+        try:
+            info = np.linalg.pinv(D @ (0.5 * A @ A.T) @ D, rcond=1e-9, hermitian=True)
+            cov = np.linalg.inv(J.T @ info @ J)
+        except np.linalg.LinAlgError:
+            return {}
+        
+        dof = np.linalg.matrix_rank(A) - 2
+        if dof > 0:
+            cov *= max(1.0, float(r @ info @ r) / dof)
+        
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        major = eigvecs[:, 1]
+        return {
+            'sigma_x_m': float(np.sqrt(cov[0, 0])),
+            'sigma_y_m': float(np.sqrt(cov[1, 1])),
+            'semi_major_m': float(np.sqrt(max(eigvals[1], 0.0))),
+            'semi_minor_m': float(np.sqrt(max(eigvals[0], 0.0))),
+            'orientation_deg': float(np.degrees(np.arctan2(major[0], major[1])) % 180.0)
+        }
     
     def create_map(self):
         """Create interactive Folium map"""
@@ -382,20 +940,14 @@ class ThreeStationTDOA:
             popup=f"Error radius: {self.estimated_position['error_meters']:.1f} meters"
         ).add_to(tdoa_map)
         
-        # Add TDOA hyperbolas (simplified - showing lines for now)
-        for stat_id in self.station_data.keys():
-            if stat_id in self.station_positions:
-                pos = self.station_positions[stat_id]
-                folium.PolyLine(
-                    locations=[
-                        [pos['lat'], pos['lon']],
-                        [self.estimated_position['lat'], self.estimated_position['lon']]
-                    ],
-                    color='gray',
-                    weight=1,
-                    opacity=0.5,
-                    dash_array='5'
-                ).add_to(tdoa_map)
+        # Add the TDOA hyperbola of every measured pair
+        from map_layers import add_hyperbolas, hyperbola_curves
+        ref_lat = np.mean([pos['lat'] for pos in self.station_positions.values()])
+        ref_lon = np.mean([pos['lon'] for pos in self.station_positions.values()])
+        station_xy = {stat_id: lat_lon_to_xy(pos['lat'], pos['lon'], ref_lat, ref_lon)
+                      for stat_id, pos in self.station_positions.items() if stat_id in self.station_data}
+        add_hyperbolas(tdoa_map, hyperbola_curves(station_xy, self.tdoa_pairs, ref_lat, ref_lon, self.c))
+        folium.LayerControl().add_to(tdoa_map)
         
         # Save map
         output_file = os.path.join(self.data_dir, 'tdoa_interactive_map.html')
@@ -404,118 +956,270 @@ class ThreeStationTDOA:
     
     def create_static_plot(self):
         """Create static visualization plot"""
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
+        from plot_worker import plot_payload, render_analysis
+        payload = plot_payload(self, self.plot_options['window_s'], self.plot_options['max_points'])
+        for output_file in render_analysis(payload, self.plot_options['dpi'], self.plot_options['formats']):
+            print(f"Saved analysis plot to: {output_file}")
+    
+    def save_results(self, summaries=None):
+        """Append fixes to the results store and write the latest as tdoa_results.json"""
+        if summaries is None:
+            summaries = [self.fix_summary()]
         
-        # Left plot: Geographic view
-        ax1.set_title('TDOA Direction Finding Results\nGeographic View', fontsize=14, fontweight='bold')
+        with ResultsStore(self.results_db) as store:
+            ids = store.add_fixes(summaries)
         
-        # Plot stations
-        for stat_id in self.station_data.keys():
-            if stat_id in self.station_positions:
-                pos = self.station_positions[stat_id]
-                ax1.scatter(pos['lon'], pos['lat'], s=200, c=pos['color'], 
-                          marker='^', edgecolor='black', linewidth=2, zorder=5,
-                          label=f"{stat_id} ({pos['name']})")
-                ax1.text(pos['lon'], pos['lat']-0.01, stat_id, ha='center', fontsize=8)
-        
-        # Plot estimated position
-        ax1.scatter(self.estimated_position['lon'], self.estimated_position['lat'],
-                   s=300, c='red', marker='*', edgecolor='black', linewidth=2,
-                   zorder=6, label='Estimated Position')
-        
-        # Plot actual position
-        ax1.scatter(self.actual_tx['lon'], self.actual_tx['lat'],
-                   s=300, c='green', marker='o', edgecolor='black', linewidth=2,
-                   zorder=6, label=f"Actual {self.actual_tx['name']}")
-        
-        # Draw connections
-        for stat_id in self.station_data.keys():
-            if stat_id in self.station_positions:
-                pos = self.station_positions[stat_id]
-                ax1.plot([pos['lon'], self.estimated_position['lon']],
-                        [pos['lat'], self.estimated_position['lat']],
-                        'gray', alpha=0.3, linestyle='--', linewidth=1)
-        
-        # Error line
-        ax1.plot([self.estimated_position['lon'], self.actual_tx['lon']],
-                [self.estimated_position['lat'], self.actual_tx['lat']],
-                'red', linewidth=2, label=f"Error: {self.estimated_position['error_meters']:.1f}m")
-        
-        ax1.set_xlabel('Longitude')
-        ax1.set_ylabel('Latitude')
-        ax1.grid(True, alpha=0.3)
-        ax1.legend(loc='best')
-        ax1.set_aspect(1/np.cos(np.radians(41.25)))
-        
-        # Right plot: TDOA measurements
-        ax2.set_title('TDOA Measurements\nTime Differences', fontsize=14, fontweight='bold')
-        
-        pairs = list(self.tdoa_pairs.keys())
-        tdoa_values = [data['tdoa'] * 1e6 for data in self.tdoa_pairs.values()]  # Convert to μs
-        quality_values = [data['peak_value'] for data in self.tdoa_pairs.values()]
-        
-        # Create bar chart
-        x = np.arange(len(pairs))
-        bars = ax2.bar(x, tdoa_values, color=['blue', 'green', 'red'][:len(pairs)])
-        
-        # Add quality scores on bars
-        for i, (bar, quality) in enumerate(zip(bars, quality_values)):
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{quality:.2f}', ha='center', va='bottom' if height > 0 else 'top')
-        
-        ax2.set_xlabel('Station Pairs')
-        ax2.set_ylabel('Time Difference (μs)')
-        ax2.set_xticks(x)
-        ax2.set_xticklabels(pairs, rotation=45)
-        ax2.grid(True, alpha=0.3, axis='y')
-        ax2.axhline(y=0, color='black', linewidth=0.5)
-        
-        # Add info text
-        info_text = (
-            f"Sample Rate: {list(self.station_data.values())[0]['sample_rate']/1e6:.3f} MHz\n"
-            f"Center Freq: {list(self.station_data.values())[0]['center_freq']/1e6:.3f} MHz\n"
-            f"Position Error: {self.estimated_position['error_meters']:.1f} meters"
-        )
-        ax2.text(0.02, 0.98, info_text, transform=ax2.transAxes,
-                bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5),
-                verticalalignment='top', fontsize=10)
-        
-        plt.tight_layout()
-        
-        # Save plot
-        output_file = os.path.join(self.data_dir, 'tdoa_analysis_results.png')
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        print(f"Saved analysis plot to: {output_file}")
-        plt.close()
-    
-    def save_results(self):
-        """Save numerical results to JSON file"""
-        results = {
-            'timestamp': datetime.now().isoformat(),
-            'station_positions': self.station_positions,
-            'actual_transmitter': self.actual_tx,
-            'estimated_position': self.estimated_position,
-            'tdoa_measurements': {
+        latest = {
+            'processed_at': datetime.now().isoformat(),
+            'fixes': [dict(summary, id=fix_id) for summary, fix_id in zip(summaries, ids)]
+        }
+        output_file = os.path.join(self.data_dir, 'tdoa_results.json')
+        tmp_file = output_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(latest, f, indent=2)
+        os.replace(tmp_file, output_file)
+        
+        print(f"Appended {len(summaries)} fix(es) to {self.results_db}; latest in {output_file}")
+    
+    def channelize_stations(self, channels=None):
+        """Split every station's capture into sub-channels with one filter bank pass each"""
+        channels = self.channels if channels is None else channels
+        
+        print("\n" + "="*50)
+        print("Channelizing Station Captures")
+        print("="*50)
+        
+        channel_data = {freq: {} for freq in channels}
+        activity = {freq: [] for freq in channels}
+        
+        for station_id, data in self.station_data.items():
+            channelizer = PolyphaseChannelizer(data['sample_rate'], self.channel_spacing)
+            offsets = [freq - data['center_freq'] for freq in channels]
+            outputs, bin_powers = channelizer.extract(data['samples'], offsets)
+            levels, adjacent = channelizer.activity_levels(bin_powers)
+            
+            for freq, offset in zip(channels, offsets):
+                k, _ = channelizer.bin_for(offset)
+                activity[freq].append((levels[k], adjacent[k]))
+                
+                channel_data[freq][station_id] = {
+                    'samples': outputs[offset],
+                    'timestamp': data['timestamp'],
+                    'sample_rate': channelizer.output_rate,
+                    'center_freq': freq
+                }
+                if 'digest' in data:
+                    channel_data[freq][station_id]['digest'] = data['digest']
+            
+            print(f"{station_id}: {channelizer.M} bins of {channelizer.bin_spacing/1e3:.2f} kHz "
+                  f"at {channelizer.output_rate/1e3:.2f} kS/s")
+        
+        # A channel is active when every station sees it above the noise floor
+        # and it is not just the filter bank leakage of a stronger neighbour
+        active = {}
+        for freq in channels:
+            level = min((a[0] for a in activity[freq]), default=float('-inf'))
+            adjacent = min((a[1] for a in activity[freq]), default=float('-inf'))
+            if level < self.channel_activity_threshold:
+                state = 'quiet'
+            elif adjacent < -self.adjacent_channel_rejection:
+                state = 'adjacent leakage'
+            else:
+                state = 'active'
+            print(f"  {freq/1e6:.3f} MHz: {level:+.1f} dB over floor, "
+                  f"{adjacent:+.1f} dB vs neighbours ({state})")
+            if state == 'active':
+                active[freq] = {'stations': channel_data[freq], 'snr_db': level}
+        
+        return active
+    
+    def channel_processor(self, freq, station_data):
+        """Lightweight copy of this processor that analyses one sub-channel"""
+        worker = copy.copy(self)
+        worker.station_data = station_data
+        worker.channel_results = {}
+        worker.fft_workers = 1  # parallelism comes from the per-channel process pool
+        worker.metrics = StageMetrics()
+        worker.renderer = None
+        worker.actual_tx = dict(self.actual_tx, freq=f"{freq/1e6:.3f} MHz")
+        return worker
+    
+    def run_channelized_analysis(self, channels=None, workers=None):
+        """Locate every active emitter in the band: TDOA and multilateration per channel"""
+        print("\n" + "="*60)
+        print("WIDEBAND CHANNELIZED TDOA PROCESSOR")
+        print("="*60)
+        
+        try:
+            return self._channelized_analysis(channels, workers)
+        finally:
+            self.metrics.finish()
+    
+    def _channelized_analysis(self, channels, workers):
+        with self.metrics.stage('find_files'):
+            n_stations = self.find_synchronized_files()
+        with self.metrics.stage('load'):
+            self.load_station_data()
+        # The station squelch only watches the target channel; here every
+        # channel is gated on its own activity by channelize_stations
+        with self.metrics.stage('integrity'):
+            n_stations = self.check_capture_integrity(require_detection=False)
+        if n_stations < 3:
+            print("\nERROR: Need 3 stations for per-channel position estimates!")
+            return {}
+        with self.metrics.stage('align_clocks'):
+            self.align_reference_clocks()
+        
+        with self.metrics.stage('channelize'):
+            active = self.channelize_stations(channels)
+        if not active:
+            print("\nNo active channels found")
+            return {}
+        
+        # Workers only need the channel samples, not the wideband captures
+        jobs = {freq: self.channel_processor(freq, info['stations'])
+                for freq, info in active.items()}
+        wideband = self.station_data
+        self.station_data = {}
+        
+        print(f"\nSolving {len(jobs)} active channels...")
+        # Spawned workers: the channelizer's FFT threads are running by now (see PlotRenderer)
+        with self.metrics.stage('solve_channels'), \
+                ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            self.metrics.record(channels=len(jobs))
+            futures = {freq: pool.submit(solve_channel, job) for freq, job in jobs.items()}
+            self.channel_results = {freq: future.result() for freq, future in futures.items()}
+        
+        self.station_data = wideband
+        for freq, result in self.channel_results.items():
+            result['snr_db'] = float(active[freq]['snr_db'])
+        
+        print("\n" + "="*50)
+        print("Per-Channel Position Estimates")
+        print("="*50)
+        for freq, result in sorted(self.channel_results.items()):
+            pos = result['estimated_position']
+            print(f"  {freq/1e6:.3f} MHz: {pos['lat']:.6f}, {pos['lon']:.6f} "
+                  f"(SNR {result['snr_db']:.1f} dB, success {pos['success']})")
+        
+        with self.metrics.stage('save'):
+            self.save_results([self.channel_results[freq] for freq in sorted(self.channel_results)])
+        return self.channel_results
+    
+    def fix_summary(self):
+        """Compact, JSON-safe summary of the current TDOA pairs and position fix"""
+        timestamps = [data['timestamp'] for data in self.station_data.values()]
+        summary = {
+            'timestamp': float(np.mean(timestamps)) if timestamps else None,
+            'stations': sorted(self.station_data),
+            'center_freq': (float(next(iter(self.station_data.values()))['center_freq'])
+                            if self.station_data else None),
+            'files': {station: os.path.basename(filepath)
+                      for station, filepath in self.data_files.items()},
+            'tdoa': {
                 pair: {
-                    'tdoa_seconds': data['tdoa'],
-                    'tdoa_microseconds': data['tdoa'] * 1e6,
-                    'distance_difference_meters': data['tdoa'] * self.c,
-                    'correlation_quality': data['peak_value']
+                    'stations': list(data['stations']),
+                    'tdoa': float(data['tdoa']),
+                    'quality': float(data['peak_value']),
+                    'sigma': float(data['sigma']),
+                    'weight': float(data.get('weight', 1.0))
                 }
-                for pair, data in self.tdoa_pairs.items()
+                for pair, data in getattr(self, 'tdoa_pairs', {}).items()
             },
-            'files_processed': {
-                station: os.path.basename(filepath)
-                for station, filepath in self.data_files.items()
-            }
+            'estimated_position': None
         }
         
-        output_file = os.path.join(self.data_dir, 'tdoa_results.json')
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        if getattr(self, 'estimated_position', None):
+            summary['estimated_position'] = {
+                k: (bool(v) if k == 'success' else float(v))
+                for k, v in self.estimated_position.items()
+            }
         
-        print(f"Saved numerical results to: {output_file}")
+        return summary
+    
+    def process_group(self, data_files):
+        """Load, align, correlate and solve one capture group; returns its fix summary"""
+        self.data_files = dict(data_files)
+        self.estimated_position = None
+        self.tdoa_pairs = {}
+        
+        try:
+            with self.metrics.stage('load'):
+                self.load_station_data()
+            with self.metrics.stage('integrity'):
+                n_stations = self.check_capture_integrity()
+            if n_stations < 2:
+                print("\nFewer than 2 captures passed integrity checks - skipping group")
+                return None
+            
+            with self.metrics.stage('align_clocks'):
+                self.align_reference_clocks()
+            with self.metrics.stage('correlate'):
+                self.compute_all_tdoa()
+            if n_stations < 3:
+                return self.fix_summary()
+            
+            initial_position = None
+            if self.tracker is not None:
+                summary = self.fix_summary()
+                initial_position = self.tracker.predict(self.tracker.key_for(summary), summary['timestamp'])
+            
+            with self.metrics.stage('multilateration'):
+                self.multilateration(initial_position)
+            summary = self.fix_summary()
+            
+            if self.tracker is not None:
+                track = summary['track'] = self.tracker.update([summary])[0]
+                print(f"Track: {track['lat']:.6f}, {track['lon']:.6f} +/- {track['semi_major_m']:.0f} x "
+                      f"{track['semi_minor_m']:.0f} m after {track['updates']} fixes"
+                      f"{'' if track['accepted'] else ' (fix rejected by gate)'}")
+            
+            with self.metrics.stage('save'):
+                self.save_results([summary])
+            return summary
+        finally:
+            self.metrics.finish()
+    
+    def watch(self, poll_interval=5.0, max_polls=None):
+        """Poll data_dir and process each capture group once it is complete"""
+        expected = set(self.station_positions)
+        print(f"\nWatching '{self.data_dir}' for complete groups of "
+              f"{', '.join(sorted(expected))} (every {poll_interval:g} s, Ctrl-C to stop)")
+        
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                file_groups = self.group_capture_files(verbose=False)
+                
+                for time_key in sorted(file_groups):
+                    files = file_groups[time_key]
+                    if set(files) != expected:
+                        continue
+                    
+                    # A group is identified by its files and their size/mtime stamps
+                    group_id = (time_key, tuple(sorted(
+                        (path, self._capture_index[path][0]) for path in files.values())))
+                    if group_id in self._processed_groups:
+                        continue
+                    self._processed_groups.add(group_id)
+                    
+                    print("\n" + "="*60)
+                    print(f"New capture group from {datetime.fromtimestamp(time_key)}")
+                    print("="*60)
+                    try:
+                        self.process_group(files)
+                    except Exception as e:
+                        print(f"\nERROR processing group {time_key}: {e}")
+                        continue
+                    
+                    if self.cache is not None:
+                        print(f"Cache: {self.cache.hits} hits, {self.cache.misses} misses")
+                
+                polls += 1
+                if max_polls is None or polls < max_polls:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("\nStopped watching")
     
     def run_analysis(self):
         """Run complete TDOA analysis pipeline"""
@@ -526,7 +1230,8 @@ class ThreeStationTDOA:
         
         try:
             # Step 1: Find data files
-            n_stations = self.find_synchronized_files()
+            with self.metrics.stage('find_files'):
+                n_stations = self.find_synchronized_files()
             
             if n_stations < 2:
                 print("\nERROR: Need at least 2 stations for TDOA!")
@@ -535,34 +1240,49 @@ class ThreeStationTDOA:
             # Step 2: Load data
             print("\n" + "-"*50)
             print("Loading station data...")
-            self.load_station_data()
+            with self.metrics.stage('load'):
+                self.load_station_data()
             
-            # Step 3: Compute TDOA
-            self.compute_all_tdoa()
+            # Drop captures the collector flagged as having gaps or stalls
+            with self.metrics.stage('integrity'):
+                n_stations = self.check_capture_integrity()
+            if n_stations < 2:
+                print("\nERROR: Fewer than 2 captures passed integrity checks!")
+                return
             
-            # Step 4: Create correlation plots
-            print("\n" + "-"*50)
-            print("Creating correlation analysis plots...")
-            self.plot_correlations()
+            # Step 2b: Align sample clocks on the reference channel (if recorded)
+            with self.metrics.stage('align_clocks'):
+                self.align_reference_clocks()
+            
+            # Step 3: Compute TDOA
+            with self.metrics.stage('correlate'):
+                self.compute_all_tdoa()
             
-            # Step 5: Multilateration (if we have 3 stations)
+            # Step 4: Multilateration (if we have 3 stations); the fix is saved
+            # before anything is drawn
             if n_stations >= 3:
-                self.multilateration()
+                with self.metrics.stage('multilateration'):
+                    self.multilateration()
                 
-                # Step 6: Create visualizations
-                print("\n" + "-"*50)
-                print("Creating visualizations...")
-                self.create_map()
-                self.create_static_plot()
-                
-                # Step 7: Save results
                 print("\n" + "-"*50)
                 print("Saving results...")
-                self.save_results()
+                with self.metrics.stage('save'):
+                    self.save_results()
             else:
                 print("\nWARNING: Need 3 stations for position estimation!")
                 print("Can only compute TDOA between 2 stations.")
             
+            # Step 5: Plots render in a background process; only shutdown
+            # (close_renderer) waits for them
+            print("\n" + "-"*50)
+            print("Creating visualizations...")
+            if self.plot_options['formats']:
+                with self.metrics.stage('plot_submit'):
+                    self.submit_plots()
+            if n_stations >= 3:
+                with self.metrics.stage('map'):
+                    self.create_map()
+            
             print("\n" + "="*60)
             print("ANALYSIS COMPLETE!")
             print("="*60)
@@ -571,26 +1291,120 @@ class ThreeStationTDOA:
             if n_stations >= 3:
                 print("  - tdoa_interactive_map.html   : Interactive map (open in browser)")
                 print("  - tdoa_analysis_results.png   : Static analysis plots")
-                print("  - tdoa_results.json          : Numerical results")
+                print("  - tdoa_results.json          : Latest fix")
+                print("  - tdoa_results.db            : Fix history (query with results_store.py)")
             
         except Exception as e:
             print(f"\nERROR: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            self.metrics.finish()
+
+
+def solve_channel(processor):
+    """Process-pool worker: TDOA and multilateration for one channel's data"""
+    # Keep the per-pair chatter of worker processes out of the console
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.compute_all_tdoa()
+        processor.multilateration()
+    
+    return processor.fix_summary()
+
+
+def solve_capture_group(data_dir, data_files, initial_position=None):
+    """Process-pool worker: full load/align/TDOA/solve for one matched capture group"""
+    processor = ThreeStationTDOA(data_directory=data_dir)
+    processor.data_files = dict(data_files)
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.load_station_data()
+        n_stations = processor.check_capture_integrity()
+        if n_stations >= 2:
+            processor.align_reference_clocks()
+            processor.compute_all_tdoa()
+        if n_stations >= 3:
+            processor.multilateration(initial_position)
+    
+    return processor.fix_summary()
 
 
 def main():
-    import sys
+    from argparse import ArgumentParser
     
-    # Get data directory from command line or use default
-    if len(sys.argv) > 1:
-        data_dir = sys.argv[1]
-    else:
-        data_dir = 'nice_data'
+    parser = ArgumentParser(description="Three station TDOA processor")
+    parser.add_argument('data_dir', nargs='?', default='nice_data',
+                        help="Directory containing the station captures [default=%(default)r]")
+    parser.add_argument('--channelize', action='store_true',
+                        help="Split the band into sub-channels and locate every active emitter")
+    parser.add_argument('--channels', type=float, nargs='+',
+                        help="Channel frequencies in MHz [default: NOAA 162.400-162.550]")
+    parser.add_argument('--channel-spacing', type=float, default=25e3,
+                        help="Filter bank channel spacing in Hz [default=%(default)r]")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for per-channel solving [default: CPU count]")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep polling data_dir and process each newly complete capture group")
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help="Watch mode polling interval in seconds [default=%(default)r]")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Result cache directory (enables caching) [default: <data_dir>/.tdoa_cache in watch mode]")
+    parser.add_argument('--cache-size', type=float, default=512,
+                        help="Result cache size budget in MB [default=%(default)r]")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Disable the result cache")
+    parser.add_argument('--track', action='store_true',
+                        help="Watch mode: track the emitter and warm-start each solve from the track")
+    parser.add_argument('--correlation-seconds', type=float, default=0.1,
+                        help="Seconds of each capture to correlate, 0 for the whole capture [default=%(default)r]")
+    parser.add_argument('--memory-budget', type=float, default=256,
+                        help="Correlation memory budget in MB; longer windows are streamed in blocks [default=%(default)r]")
+    parser.add_argument('--max-lag', type=float, default=50,
+                        help="Lag search range in ms when streaming [default=%(default)r]")
+    parser.add_argument('--metrics', nargs='?', const='', default=None, metavar='JSONL',
+                        help="Append per-stage metrics as JSON lines [default file: <data_dir>/tdoa_metrics.jsonl]")
+    parser.add_argument('--prometheus', default=None, metavar='FILE',
+                        help="Rewrite a Prometheus text-format metrics file after each run")
+    parser.add_argument('--profile-dir', default=None,
+                        help="Dump a cProfile of every stage into this directory")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Record each stage's peak heap with tracemalloc (slower)")
+    parser.add_argument('--plot-dpi', type=int, default=150,
+                        help="Resolution of the analysis plots [default=%(default)r]")
+    parser.add_argument('--plot-formats', nargs='+', default=['png'],
+                        help="Plot file formats, e.g. png svg pdf [default=%(default)r]")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Skip the matplotlib plots")
+    parser.add_argument('--ignore-squelch', action='store_true',
+                        help="Also process captures the station squelch tagged as empty")
+    args = parser.parse_args()
     
     # Create processor and run analysis
-    processor = ThreeStationTDOA(data_directory=data_dir)
-    processor.run_analysis()
+    processor = ThreeStationTDOA(data_directory=args.data_dir)
+    processor.correlation_seconds = args.correlation_seconds or None
+    processor.memory_budget = int(args.memory_budget * 1024**2)
+    processor.max_lag_seconds = args.max_lag / 1e3
+    processor.require_detection = not args.ignore_squelch
+    processor.plot_options.update(dpi=args.plot_dpi, formats=[] if args.no_plots else args.plot_formats)
+    
+    if args.metrics is not None or args.prometheus or args.profile_dir or args.trace_memory:
+        processor.enable_metrics(args.metrics or None, args.prometheus, args.profile_dir, args.trace_memory)
+    
+    if not args.no_cache and (args.watch or args.cache_dir):
+        processor.enable_cache(args.cache_dir, int(args.cache_size * 1024**2))
+    
+    if args.watch:
+        if args.track:
+            processor.enable_tracking()
+        processor.watch(poll_interval=args.poll_interval)
+    elif args.channelize:
+        processor.channel_spacing = args.channel_spacing
+        channels = [f * 1e6 for f in args.channels] if args.channels else None
+        processor.run_channelized_analysis(channels, workers=args.workers)
+    else:
+        processor.run_analysis()
+    
+    processor.close_renderer()
 
 
 if __name__ == "__main__":
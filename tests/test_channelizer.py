@@ -0,0 +1,53 @@
+import contextlib
+import glob
+import io
+import json
+import os
+import numpy as np
+import pytest
+from scenario_generator import Scenario, load_truth, configure_processor
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+
+def scenario_processor(data_dir, **kwargs):
+    Scenario.random(n_stations=3, duration=0.2, **kwargs).write(str(data_dir))
+    processor = configure_processor(ThreeStationTDOA(str(data_dir)), load_truth(str(data_dir)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.find_synchronized_files()
+        processor.load_station_data()
+    return processor
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_nfm_emitter_does_not_light_up_neighbouring_channels(tmp_path, seed):
+    # A strong NFM emitter leaks about -30 dB into the adjacent filter bank bins
+    processor = scenario_processor(tmp_path, snr_db=20.0, tx_offset_hz=50e3, seed=seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        active = processor.channelize_stations()
+    assert list(active) == [162.450e6]
+
+
+def test_weak_emitter_is_still_active(tmp_path):
+    processor = scenario_processor(tmp_path, snr_db=0.0, tx_offset_hz=0.0, seed=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        active = processor.channelize_stations()
+    assert list(active) == [162.400e6]
+    assert active[162.400e6]['snr_db'] > 10.0
+
+
+def tag_as_empty(data_dir):
+    """Add the station squelch's verdict for a quiet target channel to every capture"""
+    detection = json.dumps({'detected': False, 'snr_db': 0.5, 'threshold_db': 6.0})
+    for path in glob.glob(os.path.join(str(data_dir), '*.npz')):
+        with np.load(path, allow_pickle=True) as data:
+            fields = dict(data)
+        np.savez_compressed(path, detection=detection, **fields)
+
+
+def test_emitter_off_the_target_channel_survives_the_squelch(tmp_path):
+    Scenario.random(n_stations=3, duration=0.2, snr_db=20.0, tx_offset_hz=50e3, seed=0).write(str(tmp_path))
+    tag_as_empty(tmp_path)
+    processor = configure_processor(ThreeStationTDOA(str(tmp_path)), load_truth(str(tmp_path)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = processor.run_channelized_analysis(workers=1)
+    assert list(results) == [162.450e6]
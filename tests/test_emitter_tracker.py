@@ -0,0 +1,90 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from emitter_tracker import TrackBank
+from scenario_generator import Scenario, load_truth, configure_processor
+from tdoa_processor_three_stations import ThreeStationTDOA, lat_lon_to_xy, xy_to_lat_lon
+
+REF_LAT, REF_LON = 41.24, -96.02
+FREQ = 162.4e6
+
+
+def fix(t, xy, sigma_m):
+    lat, lon = xy_to_lat_lon(xy[0], xy[1], REF_LAT, REF_LON)
+    return {'timestamp': t, 'center_freq': FREQ,
+            'estimated_position': {'lat': lat, 'lon': lon, 'semi_major_m': sigma_m,
+                                   'semi_minor_m': sigma_m, 'orientation_deg': 0.0}}
+
+
+def test_constant_velocity_track_converges_on_noisy_fixes():
+    rng = np.random.default_rng(7)
+    start, velocity, sigma_m = np.array([1500.0, -800.0]), np.array([6.0, -4.0]), 50.0
+    times = np.arange(0.0, 600.0, 10.0)
+    truth = start + np.outer(times, velocity)
+
+    bank = TrackBank(REF_LAT, REF_LON)
+    fixes = [fix(t, xy + rng.normal(0, sigma_m, 2), sigma_m) for t, xy in zip(times, truth)]
+    states = [bank.update([f])[0] for f in fixes]
+
+    # The gate is 99.9%: an occasional noisy fix may be turned away, never a run of them
+    accepted = sum(state['accepted'] for state in states)
+    assert accepted >= len(times) - 2
+    assert bank.tracks()[0]['updates'] == accepted
+
+    def errors(positions):
+        return np.array([np.linalg.norm(lat_lon_to_xy(p['lat'], p['lon'], REF_LAT, REF_LON) - xy)
+                         for p, xy in zip(positions, truth)])
+
+    # Over the second half the track beats the fixes it is built from, and
+    # both its ellipse and its speed have settled
+    half = len(times) // 2
+    track_errors = errors(states)[half:]
+    assert track_errors.mean() < 0.85 * errors(f['estimated_position'] for f in fixes)[half:].mean()
+    assert all(track_errors < 4 * np.array([state['semi_major_m'] for state in states[half:]]))
+    assert states[-1]['semi_major_m'] < 0.6 * sigma_m
+    assert all(np.hypot(state['vx_m_s'] - velocity[0], state['vy_m_s'] - velocity[1]) < 2.0
+               for state in states[half:])
+
+    # The prediction follows the motion, not the last fix
+    predicted = bank.predict(int(FREQ), times[-1] + 60)
+    expected = truth[-1] + 60 * velocity
+    error = np.linalg.norm(lat_lon_to_xy(predicted['lat'], predicted['lon'], REF_LAT, REF_LON) - expected)
+    assert error < 3 * np.sqrt(np.linalg.eigvalsh(predicted['cov'])[1])
+    assert error < 60 * np.linalg.norm(velocity) / 2
+
+
+@pytest.fixture(scope='module')
+def processor(tmp_path_factory):
+    data_dir = str(tmp_path_factory.mktemp('scenario'))
+    Scenario.random(n_stations=3, duration=0.15, snr_db=20.0, seed=5).write(data_dir)
+    processor = configure_processor(ThreeStationTDOA(data_dir), load_truth(data_dir))
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.find_synchronized_files()
+        processor.load_station_data()
+        processor.compute_all_tdoa()
+    return processor
+
+
+def test_warm_solve_from_a_track_agrees_with_the_cold_solve(processor):
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.multilateration()
+        cold = dict(processor.estimated_position)
+
+        # A track a few hundred metres off, as if the emitter had moved
+        tracker = processor.enable_tracking()
+        summary = processor.fix_summary()
+        cold_xy = lat_lon_to_xy(cold['lat'], cold['lon'], tracker.ref_lat, tracker.ref_lon)
+        for k in range(3):
+            lat, lon = xy_to_lat_lon(*(cold_xy + [300.0 - 50 * k, -200.0]), tracker.ref_lat, tracker.ref_lon)
+            tracker.update([dict(summary, timestamp=summary['timestamp'] - 30 + 10 * k,
+                                 estimated_position=dict(cold, lat=lat, lon=lon))])
+        prediction = tracker.predict(tracker.key_for(summary), summary['timestamp'])
+        processor.multilateration(prediction)
+        warm = processor.estimated_position
+
+    start_xy = lat_lon_to_xy(prediction['lat'], prediction['lon'], tracker.ref_lat, tracker.ref_lon)
+    warm_xy = lat_lon_to_xy(warm['lat'], warm['lon'], tracker.ref_lat, tracker.ref_lon)
+    assert np.linalg.norm(start_xy - cold_xy) > 100
+    assert np.linalg.norm(warm_xy - cold_xy) < 1.0
+    assert warm['evaluations'] < cold['evaluations']
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from scipy import signal
+from fast_correlation import CrossCorrelator, StreamingCorrelator
+
+
+def noise(rng, n):
+    return (rng.normal(size=n) + 1j * rng.normal(size=n)).astype(np.complex64)
+
+
+def normalised(x):
+    x = x.astype(np.complex128)
+    x = x - x.mean()
+    return x / x.std()
+
+
+@pytest.mark.parametrize('n1, n2', [(1024, 1024), (1001, 1001), (1000, 777), (777, 1000), (999, 1024)])
+def test_matches_scipy_full_correlation(n1, n2):
+    rng = np.random.default_rng(n1 * n2)
+    sig1, sig2 = noise(rng, n1) + 0.3, noise(rng, n2) - 0.2j
+
+    correlator = CrossCorrelator(max(n1, n2), workers=1)
+    correlation, lags = correlator.correlate(correlator.spectrum(sig1), correlator.spectrum(sig2))
+
+    expected = signal.correlate(normalised(sig1), normalised(sig2), mode='full')
+    assert np.array_equal(lags, signal.correlation_lags(n1, n2, mode='full'))
+    assert np.allclose(correlation, expected, rtol=0, atol=1e-4 * np.abs(expected).max())
+
+
+@pytest.mark.parametrize('n, delay', [(4096, 37), (4095, -250)])
+def test_peak_is_at_the_known_lag(n, delay):
+    rng = np.random.default_rng(n)
+    base = noise(rng, n + abs(delay))
+    # sig1[i + delay] == sig2[i], before sig1's own noise
+    start1, start2 = max(-delay, 0), max(delay, 0)
+    sig1 = base[start1:start1 + n] + 0.05 * noise(rng, n)
+    sig2 = base[start2:start2 + n]
+
+    correlator = CrossCorrelator(n, workers=1)
+    correlation, lags = correlator.correlate(correlator.spectrum(sig1), correlator.spectrum(sig2))
+    assert lags[np.argmax(np.abs(correlation))] == delay
+
+
+
+def streamed_and_one_shot(signals, pairs, n, max_lag, memory_budget):
+    streamer = StreamingCorrelator(max_lag, memory_budget, n_buffers=8, workers=1)
+    streamed = streamer.correlate(signals, pairs, n)
+
+    one_shot = CrossCorrelator(n, workers=1)
+    spectra = {name: one_shot.spectrum(sig[:n]) for name, sig in signals.items()}
+    for pair in pairs:
+        full, full_lags = one_shot.correlate(spectra[pair[0]], spectra[pair[1]])
+        window = np.abs(full_lags) <= max_lag
+        yield pair, streamed[pair], (full[window], full_lags[window])
+
+
+@pytest.mark.parametrize('n', [20000, 20011, 1000])
+def test_streamed_correlation_matches_the_one_shot_within_max_lag(n):
+    rng = np.random.default_rng(n)
+    max_lag, delays = 300, {'a': 0, 'b': 123, 'c': -150}
+    base = noise(rng, n + 2 * max_lag + 500)
+    # Longer than n, so samples past n must be ignored, with a DC offset and noise
+    signals = {name: base[max_lag + delay:][:n + 500] + 0.5 * noise(rng, n + 500) + 0.2
+               for name, delay in delays.items()}
+    pairs = [('a', 'b'), ('a', 'c'), ('c', 'b')]
+
+    # A 2048-point FFT (1448-sample blocks): the long windows span 14 blocks,
+    # the last one partial, and the short one a single partial block
+    memory_budget = 8 * 2048 * 8
+    assert StreamingCorrelator(max_lag, memory_budget, n_buffers=8).block == 1448
+    for (stat1, stat2), (correlation, lags), (expected, expected_lags) in \
+            streamed_and_one_shot(signals, pairs, n, max_lag, memory_budget):
+        assert np.array_equal(lags, expected_lags)
+        peak = np.argmax(np.abs(correlation))
+        assert lags[peak] == expected_lags[np.argmax(np.abs(expected))] == delays[stat2] - delays[stat1]
+        assert np.abs(correlation[peak]) == pytest.approx(np.abs(expected).max(), rel=1e-4)
+        assert np.allclose(correlation, expected, rtol=0, atol=1e-4 * np.abs(expected).max())
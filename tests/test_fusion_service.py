@@ -0,0 +1,48 @@
+import asyncio
+import contextlib
+import io
+import time
+from fusion_service import FusionService
+from scenario_generator import Scenario
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+
+class RecordingSubscriber:
+    def __init__(self):
+        self.fixes = []
+
+    async def publish(self, fix):
+        self.fixes.append(fix)
+
+    async def close(self):
+        pass
+
+
+async def ingest_group(service, scenario, paths):
+    for station_id, path in paths.items():
+        await service.ingest(station_id, scenario.metadata(station_id)['timestamp'], path,
+                             scenario.center_freq)
+    while service._tasks:
+        await asyncio.gather(*service._tasks)
+
+
+def test_scenario_group_is_solved_in_the_pool_and_published(tmp_path):
+    defaults = ThreeStationTDOA(str(tmp_path))
+    scenario = Scenario(defaults.station_positions, defaults.actual_tx, duration=0.2,
+                        timestamp=time.time(), seed=0)
+    paths = scenario.write(str(tmp_path))
+
+    subscriber = RecordingSubscriber()
+    service = FusionService(str(tmp_path), workers=1, subscribers=[subscriber])
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(ingest_group(service, scenario, paths))
+    finally:
+        service.pool.shutdown()
+
+    assert service.pending == []
+    fix, = subscriber.fixes
+    assert fix['stations'] == sorted(paths)
+    assert len(fix['tdoa']) == 3
+    assert fix['estimated_position']['error_meters'] < 500.0
+    assert 0.0 < fix['latency']['last_arrival_to_fix'] <= fix['latency']['capture_to_fix'] < 60.0
@@ -0,0 +1,46 @@
+import importlib.util
+import json
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('gnuradio')
+
+from capture_format import open_capture
+
+FLOWGRAPH = os.path.join(os.path.dirname(__file__), '..', 'GRC', 'n3pay_tdoa_capture_headless.py')
+
+
+def load_flowgraph():
+    spec = importlib.util.spec_from_file_location('n3pay_tdoa_capture_headless', FLOWGRAPH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.n3pay_tdoa_capture_headless
+
+
+def test_file_source_replay_writes_the_samples_and_rx_time_sidecar(tmp_path):
+    samp_rate = 48000.0
+    start_time = 1700000000.0
+    samples = (np.arange(int(2.5 * samp_rate)) % 1000).astype(np.complex64) * (1 + 1j)
+    input_file = tmp_path / 'replay.cf32'
+    samples.tofile(str(input_file))
+
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    tb = load_flowgraph()(station_id='station2', output_dir=str(output_dir), input_file=str(input_file),
+                          start_time=start_time, samp_rate=samp_rate)
+    tb.start()
+    tb.wait()
+    sidecar_path = tb.write_sidecar()
+
+    assert os.path.basename(sidecar_path) == 'tdoa_station2_1700000000.sidecar.json'
+    with open(sidecar_path) as f:
+        sidecar = json.load(f)
+    assert sidecar['station_id'] == 'station2'
+    assert sidecar['timestamp'] == start_time
+    assert sidecar['arrays']['samples']['count'] == len(samples)
+    # One rx_time tag per second of samples, dated from start_time on the sample clock
+    assert sidecar['rx_time'] == [[0, start_time], [48000, start_time + 1.0], [96000, start_time + 2.0]]
+
+    capture = open_capture(sidecar_path)
+    assert np.array_equal(capture['samples'], samples)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from map_layers import hyperbola_curves
+from tdoa_processor_three_stations import ThreeStationTDOA, lat_lon_to_xy
+
+C = 299792458.0
+
+
+def distance_to_polyline(point, line):
+    """Shortest distance from a point to a polyline (n, 2), in the same units"""
+    a, b = line[:-1], line[1:]
+    ab = b - a
+    t = np.clip(np.einsum('ij,ij->i', point - a, ab) / np.einsum('ij,ij->i', ab, ab), 0.0, 1.0)
+    return np.min(np.linalg.norm(a + t[:, None] * ab - point, axis=1))
+
+
+@pytest.mark.parametrize('emitter', [
+    None,                   # the processor's own WXL68 position
+    (-15000.0, 4000.0),     # west, near station1
+    (14000.0, -9000.0),     # south-east, beyond station2
+])
+def test_truth_lies_on_the_drawn_branch_of_every_pair(emitter):
+    processor = ThreeStationTDOA()
+    positions = processor.station_positions
+    ref_lat = np.mean([pos['lat'] for pos in positions.values()])
+    ref_lon = np.mean([pos['lon'] for pos in positions.values()])
+    station_xy = {stat: lat_lon_to_xy(pos['lat'], pos['lon'], ref_lat, ref_lon)
+                  for stat, pos in positions.items()}
+    truth = (lat_lon_to_xy(processor.actual_tx['lat'], processor.actual_tx['lon'], ref_lat, ref_lon)
+             if emitter is None else np.array(emitter))
+
+    stations = sorted(station_xy)
+    pairs = {f"{s1}-{s2}": {'stations': [s1, s2],
+                            'tdoa': (np.linalg.norm(truth - station_xy[s1]) -
+                                     np.linalg.norm(truth - station_xy[s2])) / C}
+             for i, s1 in enumerate(stations) for s2 in stations[i + 1:]}
+    assert {np.sign(p['tdoa']) for p in pairs.values()} == {-1.0, 1.0}
+
+    curves = hyperbola_curves(station_xy, pairs, ref_lat, ref_lon, C, n_points=4096)
+    assert [curve['pair'] for curve in curves] == list(pairs)
+    for curve in curves:
+        s1, s2 = (station_xy[stat] for stat in pairs[curve['pair']]['stations'])
+        line = np.array([lat_lon_to_xy(lat, lon, ref_lat, ref_lon) for lat, lon in curve['locations']])
+
+        # Every drawn point has the measured range difference (to the 1e-6 degree rounding)...
+        range_difference = np.linalg.norm(line - s1, axis=1) - np.linalg.norm(line - s2, axis=1)
+        assert np.allclose(range_difference, C * curve['tdoa'], atol=0.5)
+        # ...so the truth, which has it too, must be on this branch and not its mirror
+        assert distance_to_polyline(truth, line) < 5.0
+
+
+def test_range_differences_beyond_the_baseline_are_left_out():
+    station_xy = {'a': np.array([-1000.0, 0.0]), 'b': np.array([1000.0, 0.0])}
+    pairs = {'a-b': {'stations': ['a', 'b'], 'tdoa': 2500.0 / C},
+             'b-a': {'stations': ['b', 'a'], 'tdoa': 1500.0 / C}}
+    assert [curve['pair'] for curve in hyperbola_curves(station_xy, pairs, 41.0, -96.0, C)] == ['b-a']
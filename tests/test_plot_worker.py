@@ -0,0 +1,46 @@
+import contextlib
+import io
+import os
+import threading
+from concurrent.futures import Future
+import pytest
+from scenario_generator import Scenario, load_truth, configure_processor
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+
+@pytest.fixture
+def processor(tmp_path):
+    Scenario.random(n_stations=3, duration=0.15, snr_db=20.0, seed=1).write(str(tmp_path))
+    processor = configure_processor(ThreeStationTDOA(str(tmp_path)), load_truth(str(tmp_path)))
+    processor.plot_options.update(dpi=50)
+    return processor
+
+
+def test_run_analysis_returns_without_waiting_for_the_plots(processor):
+    # A plot that never finishes must not hold up the fix
+    never = Future()
+    processor.submit_plots = lambda: never
+
+    run = threading.Thread(target=processor.run_analysis, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run.start()
+        run.join(timeout=60)
+    assert not run.is_alive()
+
+    assert 'plot_submit' in processor.metrics.totals and 'plot_wait' not in processor.metrics.totals
+    assert os.path.exists(os.path.join(processor.data_dir, 'tdoa_results.json'))
+
+
+def test_plots_are_drawn_by_a_spawned_worker_and_waited_for_at_shutdown(processor):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        processor.run_analysis()
+        # FFT threads have run in this process by now; a spawned worker inherits none of them
+        assert processor.renderer._pool._mp_context.get_start_method() == 'spawn'
+        processor.close_renderer()
+
+    assert processor.renderer is None
+    for name in ('correlation_analysis.png', 'tdoa_analysis_results.png'):
+        path = os.path.join(processor.data_dir, name)
+        assert os.path.getsize(path) > 0
+        assert f"Saved plot to: {path}" in output.getvalue()
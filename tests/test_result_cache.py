@@ -0,0 +1,99 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from scenario_generator import Scenario, load_truth, configure_processor
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+# Capture starts several ms apart, so every raw correlation peak lies well
+# outside +/- cache_lag_window of zero lag
+START_OFFSETS = {'station1': 0.0, 'station2': 3e-3, 'station3': -2.5e-3}
+
+
+@pytest.fixture(scope='module')
+def scenario_dir(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('scenario')
+    Scenario.random(n_stations=3, duration=0.25, snr_db=20.0, seed=4,
+                    start_offsets=START_OFFSETS).write(str(data_dir))
+    return data_dir
+
+
+def correlate(data_dir, cache_dir, **settings):
+    processor = configure_processor(ThreeStationTDOA(str(data_dir)), load_truth(str(data_dir)))
+    for name, value in settings.items():
+        setattr(processor, name, value)
+    processor.enable_cache(str(cache_dir))
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.find_synchronized_files()
+        processor.load_station_data()
+        processor.compute_all_tdoa()
+    return processor
+
+
+# Correlation and TDOA sigma for each of the three pairs
+PAIR_HITS = 6
+
+
+def peak_lag(pair):
+    return pair['lags'][np.argmax(np.abs(pair['correlation']))]
+
+
+def test_cache_hit_matches_cold_run_for_peaks_far_from_zero_lag(scenario_dir, tmp_path):
+    cold = correlate(scenario_dir, tmp_path)
+    warm = correlate(scenario_dir, tmp_path)
+
+    assert warm.cache.hits == PAIR_HITS
+    for key, pair in cold.tdoa_pairs.items():
+        assert abs(peak_lag(pair)) > cold.cache_lag_window * pair['sample_rate']
+        assert warm.tdoa_pairs[key]['tdoa'] == pair['tdoa']
+        assert peak_lag(warm.tdoa_pairs[key]) == peak_lag(pair)
+
+
+STREAMED = {'memory_budget': 16 * 1024**2, 'max_lag_seconds': 0.01}
+
+
+@pytest.mark.parametrize('base, changed', [
+    ({}, {'correlation_seconds': None}),
+    ({}, {'correlation_seconds': 0.05}),
+    ({}, STREAMED),
+    (STREAMED, dict(STREAMED, max_lag_seconds=0.02)),
+    (STREAMED, dict(STREAMED, memory_budget=24 * 1024**2)),
+])
+def test_settings_that_change_the_correlation_miss_the_cache(scenario_dir, tmp_path, base, changed):
+    correlate(scenario_dir, tmp_path, **base)
+    assert correlate(scenario_dir, tmp_path, **base).cache.hits == PAIR_HITS
+    assert correlate(scenario_dir, tmp_path, **changed).cache.hits == 0
+
+
+def solve(processor, initial_position):
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.multilateration(initial_position)
+    return processor.estimated_position
+
+
+def test_warm_solves_from_different_start_points_do_not_share_a_cache_entry(scenario_dir, tmp_path):
+    processor = correlate(scenario_dir, tmp_path)
+    start = {'lat': processor.actual_tx['lat'], 'lon': processor.actual_tx['lon']}
+    far = {'lat': start['lat'] + 0.5, 'lon': start['lon'] - 0.5}
+
+    solve(processor, start)
+    hits = processor.cache.hits
+    solve(processor, far)
+    assert processor.cache.hits == hits
+    solve(processor, start)
+    assert processor.cache.hits == hits + 1
+
+
+def test_only_the_cold_solve_is_keyed_on_the_nelder_mead_options(scenario_dir, tmp_path):
+    processor = correlate(scenario_dir, tmp_path)
+    start = {'lat': processor.actual_tx['lat'], 'lon': processor.actual_tx['lon']}
+    solve(processor, start)
+    solve(processor, None)
+
+    # least_squares never sees solver_options, so changing them keeps its entry
+    processor.solver_options = dict(processor.solver_options, xatol=0.01)
+    hits = processor.cache.hits
+    solve(processor, start)
+    assert processor.cache.hits == hits + 1
+    solve(processor, None)
+    assert processor.cache.hits == hits + 1
@@ -0,0 +1,89 @@
+import sqlite3
+import numpy as np
+import pytest
+from results_store import ResultsStore
+
+
+def summary(timestamp, center_freq=162.4e6, stations=('station1', 'station2', 'station3')):
+    # numpy scalars, as the processor's arrays produce them
+    return {
+        'timestamp': np.float64(timestamp),
+        'stations': sorted(stations),
+        'center_freq': center_freq,
+        'files': {station: f"tdoa_{station}_{int(timestamp)}.npz" for station in stations},
+        'tdoa': {
+            f"{a}-{b}": {'stations': [a, b], 'tdoa': np.float64(1e-6 * i),
+                         'quality': np.float32(0.5), 'sigma': np.float64(2e-8 * (i + 1)), 'weight': 1.0}
+            for i, (a, b) in enumerate(zip(stations, stations[1:]))
+        },
+        'estimated_position': {'lat': 41.26, 'lon': -96.08, 'optimization_error': 1e-3, 'success': True,
+                               'semi_major_m': 150.0, 'semi_minor_m': 40.0, 'orientation_deg': 30.0}
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        yield store
+
+
+def test_fix_round_trips(store):
+    written = summary(1.7e9)
+    fix_id = store.add_fix(written)
+
+    [fix] = store.query()
+    assert fix['id'] == fix_id
+    assert fix['timestamp'] == written['timestamp']
+    assert fix['center_freq'] == written['center_freq']
+    assert fix['stations'] == written['stations']
+    assert fix['files'] == written['files']
+    assert fix['estimated_position'] == written['estimated_position']
+    assert fix['tdoa'] == {pair: {key: pytest.approx(value) if key != 'stations' else value
+                                  for key, value in data.items()}
+                           for pair, data in written['tdoa'].items()}
+
+
+def test_a_bad_summary_rolls_back_the_whole_batch(store):
+    store.add_fix(summary(1.0))
+    bad = summary(3.0)
+    del bad['tdoa']['station2-station3']['tdoa']
+
+    with pytest.raises(KeyError):
+        store.add_fixes([summary(2.0), bad])
+
+    assert [fix['timestamp'] for fix in store.query()] == [1.0]
+    assert store.conn.execute('SELECT COUNT(*) FROM tdoa').fetchone()[0] == 2
+
+
+def test_time_channel_and_station_query_uses_the_indexes(store):
+    store.add_fixes([summary(t, freq, stations)
+                     for t in range(10)
+                     for freq in (162.4e6, 162.55e6)
+                     for stations in (('station1', 'station2', 'station3'), ('station1', 'station2'))])
+
+    fixes = store.query(start=3, end=7, center_freq=162.4e6, stations=['station2', 'station1'])
+    assert [fix['timestamp'] for fix in fixes] == [3, 4, 5, 6]
+    assert all(len(fix['tdoa']) == 1 for fix in fixes)
+
+    clauses, params = store._where(3, 7, 162.4e6, ['station1', 'station2'])
+    plans = [row[3] for row in store.conn.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM fixes WHERE ' + ' AND '.join(clauses) + ' ORDER BY capture_time, id',
+        params)]
+    plans += [row[3] for row in store.conn.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM tdoa WHERE fix_id IN (?, ?)', [1, 2])]
+    assert all('USING INDEX' in plan for plan in plans), plans
+    assert not any('TEMP B-TREE' in plan for plan in plans), plans
+
+
+def test_stores_written_before_sigmas_gain_the_column(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE tdoa (fix_id INTEGER NOT NULL, pair TEXT NOT NULL, station1 TEXT NOT NULL, '
+                 'station2 TEXT NOT NULL, tdoa REAL NOT NULL, quality REAL, weight REAL)')
+    conn.commit()
+    conn.close()
+
+    with ResultsStore(path) as store:
+        store.add_fix(summary(1.0))
+        [fix] = store.query()
+    assert all(data['sigma'] for data in fix['tdoa'].values())
@@ -0,0 +1,181 @@
+import contextlib
+import io
+import os
+import socket
+import time
+import zlib
+import numpy as np
+import pytest
+from capture_format import open_capture
+from sample_transport import (CaptureReceiver, SampleSender, send_frame, recv_frame,
+                              MSG_BEGIN, MSG_CHUNK, MSG_END, MSG_ACK, FLAG_COMPRESSED)
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    data_dir = tmp_path / 'captures'
+    with contextlib.redirect_stdout(io.StringIO()):
+        receiver = CaptureReceiver(str(data_dir), host='127.0.0.1', port=0).start()
+        yield receiver
+        receiver.stop()
+
+
+def capture(n=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = lambda: (rng.normal(size=n) + 1j * rng.normal(size=n)).astype(np.complex64)
+    return {
+        'station_id': 'station2',
+        'timestamp': 1700000000.25,
+        'samples': noise(),
+        'ref_samples': noise(),
+        'sample_rate': 2.048e6,
+        'center_freq': 162.4e6,
+        'ref_freq': None,
+        'integrity': {'compromised': False, 'samples_expected': n}
+    }
+
+
+def connect(receiver):
+    return socket.create_connection(('127.0.0.1', receiver.port), timeout=5.0)
+
+
+def begin_meta(**overrides):
+    meta = {'station_id': 'station1', 'timestamp': 1700000000.0,
+            'arrays': {'samples': {'dtype': 'complex64', 'count': 1024}}}
+    meta.update(overrides)
+    return meta
+
+
+def files_in(path):
+    return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(receiver, compress):
+    data = capture()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with SampleSender('127.0.0.1', receiver.port, compress=compress, chunk_bytes=64 * 1024, window=2) as sender:
+            ack = sender.send_capture(data)
+
+    assert os.path.dirname(ack['path']) == receiver.data_dir
+    stored = open_capture(ack['path'])
+    np.testing.assert_array_equal(stored['samples'], data['samples'])
+    np.testing.assert_array_equal(stored['ref_samples'], data['ref_samples'])
+    assert float(stored['timestamp']) == data['timestamp']
+    assert stored['station_id'] == 'station2'
+    assert '"samples_expected": 50000' in stored['integrity']
+    if compress:
+        assert ack['sent_bytes'] < data['samples'].nbytes + data['ref_samples'].nbytes
+
+
+@pytest.mark.parametrize('meta', [
+    begin_meta(station_id='../../x'),
+    begin_meta(station_id='station1/../../x'),
+    begin_meta(timestamp=float('nan')),
+    begin_meta(timestamp=float('inf')),
+    begin_meta(timestamp='1700000000'),
+    begin_meta(arrays={'../evil': {'dtype': 'complex64', 'count': 10}}),
+    begin_meta(arrays={'samples': {'dtype': 'object', 'count': 10}}),
+    begin_meta(arrays={'samples': {'dtype': 'complex64', 'count': -1}}),
+    begin_meta(arrays={}),
+])
+def test_malformed_begin_is_rejected(receiver, tmp_path, meta):
+    with connect(receiver) as sock:
+        send_frame(sock, MSG_BEGIN, meta)
+        msg_type, _, ack, _ = recv_frame(sock)
+
+    assert msg_type == MSG_ACK and 'error' in ack
+    assert files_in(receiver.data_dir) == []
+    assert files_in(tmp_path) == ['captures']
+
+
+def test_chunk_for_undeclared_array_is_rejected(receiver):
+    with connect(receiver) as sock:
+        send_frame(sock, MSG_BEGIN, begin_meta())
+        send_frame(sock, MSG_CHUNK, {'array': 'ref_samples', 'offset': 0}, bytes(64))
+        _, _, ack, _ = recv_frame(sock)
+
+    assert 'error' in ack
+    assert wait_for(lambda: files_in(receiver.data_dir) == [])
+
+
+def test_compressed_chunk_cannot_expand_past_its_array(receiver):
+    # 1024 declared samples are 8 KiB; this chunk inflates to 64 MiB
+    bomb = zlib.compress(bytes(64 << 20), 9)
+    with connect(receiver) as sock:
+        send_frame(sock, MSG_BEGIN, begin_meta())
+        send_frame(sock, MSG_CHUNK, {'array': 'samples', 'offset': 0}, bomb, FLAG_COMPRESSED)
+        _, _, ack, _ = recv_frame(sock)
+
+    assert 'error' in ack
+    assert wait_for(lambda: files_in(receiver.data_dir) == [])
+
+
+def test_disconnect_mid_capture_removes_partial_files(receiver):
+    with connect(receiver) as sock:
+        send_frame(sock, MSG_BEGIN, begin_meta())
+        send_frame(sock, MSG_CHUNK, {'array': 'samples', 'offset': 0}, bytes(4096))
+        msg_type, _, ack, _ = recv_frame(sock)
+        assert msg_type == MSG_ACK and ack == {'chunks': 1}
+        partial, = files_in(receiver.data_dir)
+        assert partial.startswith('tdoa_station1_1700000000.cf32.') and partial.endswith('.part')
+
+    assert wait_for(lambda: files_in(receiver.data_dir) == [])
+
+
+def test_end_before_all_samples_is_rejected(receiver):
+    with connect(receiver) as sock:
+        send_frame(sock, MSG_BEGIN, begin_meta())
+        send_frame(sock, MSG_CHUNK, {'array': 'samples', 'offset': 0}, bytes(4096))
+        recv_frame(sock)
+        send_frame(sock, MSG_END, {})
+        _, _, ack, _ = recv_frame(sock)
+
+    assert 'error' in ack
+    assert wait_for(lambda: files_in(receiver.data_dir) == [])
+
+
+def send(receiver, data):
+    with contextlib.redirect_stdout(io.StringIO()):
+        with SampleSender('127.0.0.1', receiver.port, chunk_bytes=64 * 1024) as sender:
+            return sender.send_capture(data)
+
+
+def test_dropped_resend_leaves_the_published_capture_intact(receiver):
+    original = capture(seed=0)
+    path = send(receiver, original)['path']
+    published = files_in(receiver.data_dir)
+
+    # The same capture again (same station and timestamp, so the same base),
+    # dropped after its first chunk
+    resend = capture(seed=1)
+    with connect(receiver) as sock:
+        send_frame(sock, MSG_BEGIN, begin_meta(
+            station_id=resend['station_id'], timestamp=resend['timestamp'],
+            arrays={'samples': {'dtype': 'complex64', 'count': len(resend['samples'])}}))
+        send_frame(sock, MSG_CHUNK, {'array': 'samples', 'offset': 0}, resend['samples'][:4096].tobytes())
+        msg_type, _, ack, _ = recv_frame(sock)
+        assert msg_type == MSG_ACK and ack == {'chunks': 1}
+
+    assert wait_for(lambda: files_in(receiver.data_dir) == published)
+    stored = open_capture(path)
+    np.testing.assert_array_equal(stored['samples'], original['samples'])
+    np.testing.assert_array_equal(stored['ref_samples'], original['ref_samples'])
+
+
+def test_completed_resend_replaces_the_published_capture(receiver):
+    send(receiver, capture(seed=0))
+    resend = capture(seed=1)
+    path = send(receiver, resend)['path']
+
+    assert len(files_in(receiver.data_dir)) == 3
+    np.testing.assert_array_equal(open_capture(path)['samples'], resend['samples'])
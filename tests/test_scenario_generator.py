@@ -0,0 +1,32 @@
+import contextlib
+import io
+import numpy as np
+from scenario_generator import Scenario, load_truth, configure_processor, truth_tdoa
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+
+def samples(scenario, station_id):
+    return np.concatenate([block for name, block in scenario.capture(station_id) if name == 'samples'])
+
+
+def test_samples_do_not_depend_on_the_epoch():
+    # Start offsets are rounded to the metadata's precision, so keep them at zero
+    at_epoch = Scenario.random(duration=0.05, seed=3, start_offsets={})
+    near_zero = Scenario.random(duration=0.05, seed=3, start_offsets={}, timestamp=1000.0)
+    for station_id in at_epoch.stations:
+        assert np.array_equal(samples(at_epoch, station_id), samples(near_zero, station_id))
+
+
+def test_tdoa_matches_truth_at_a_unix_epoch(tmp_path):
+    Scenario.random(duration=0.15, snr_db=30.0, seed=0).write(str(tmp_path))
+    truth = load_truth(str(tmp_path))
+    processor = configure_processor(ThreeStationTDOA(str(tmp_path)), truth)
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.find_synchronized_files()
+        processor.load_station_data()
+        processor.compute_all_tdoa()
+
+    # float64 spacing at 1.7e9 s is 238 ns; neither the waveform nor the
+    # timestamp alignment may inherit it
+    for pair in processor.tdoa_pairs.values():
+        assert abs(pair['tdoa'] - truth_tdoa(truth, *pair['stations'])) < 60e-9
@@ -0,0 +1,166 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+import time
+from sim_sdr import SimulatedRtlSdr, SyntheticSource, run_replay_benchmark
+from sync_collect_samples import CaptureIntegrity, TDOACollector, SYNC_FREQ
+
+CENTER_FREQ = 162.4e6
+
+
+def collector_on(device):
+    return TDOACollector('station1', center_freq=CENTER_FREQ, ref_freq=SYNC_FREQ, sdr=device)
+
+
+def source(seed=1):
+    return SyntheticSource([(CENTER_FREQ + 5e3, 0.5), (SYNC_FREQ + 1130.0, 2.0)], noise_power=0.05, seed=seed)
+
+
+def test_collector_locks_and_captures_on_injected_device():
+    # Not paced on the host clock, so scheduler load can't cost samples. The
+    # integrity flag also times reads on that clock, so check the counts instead
+    device = SimulatedRtlSdr([source()], realtime=False, seed=2)
+    collector = collector_on(device)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert collector.acquire_reference_lock(timeout=2.0)
+        data = collector.collect_samples(duration=0.2)
+
+    assert len(data['samples']) == int(0.2 * device.sample_rate)
+    assert data['ref_freq_offset'] == pytest.approx(1130.0, abs=1.0)
+    assert device.dropped_samples == 0
+    assert data['integrity']['samples_received'] == data['integrity']['samples_expected']
+    assert data['detection']['detected']
+    assert collector.counters['captures'] == 1
+
+
+def test_usb_drops_are_flagged_as_compromised():
+    device = SimulatedRtlSdr([source()], drop_rate=1.0, drop_length=65536, seed=2)
+    collector = collector_on(device)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = collector.collect_samples(duration=0.2, use_reference=False)
+
+    assert device.dropped_samples > 0
+    assert data['integrity']['compromised']
+    assert collector.counters['compromised_captures'] == 1
+
+
+class OverrunDevice:
+    """
+    Device on a manual clock whose reads always take exactly their sample time:
+    a USB overrun during a host stall loses samples without a slow read
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def read_samples(self, num_samples):
+        self.now += num_samples / self.sample_rate
+        return np.zeros(num_samples, dtype=np.complex64)
+
+
+def test_silent_overrun_is_flagged_although_reads_return_on_time():
+    device = OverrunDevice(2.048e6)
+    integrity = CaptureIntegrity(device.sample_rate, clock=device.clock)
+    for _ in range(4):
+        integrity.read(device, 20480, 'target')
+        device.now += 0.01  # host stall; the samples streamed meanwhile are lost
+    summary = integrity.summary()
+
+    assert summary['samples_received'] == summary['samples_expected']
+    assert summary['suspect_reads'] == 0
+    assert summary['clock_drift'] == pytest.approx(0.03)
+    assert summary['compromised']
+
+
+def test_retunes_between_on_time_reads_are_not_drift():
+    device = OverrunDevice(2.048e6)
+    device.center_freq = CENTER_FREQ
+    integrity = CaptureIntegrity(device.sample_rate, clock=device.clock)
+    for _ in range(10):
+        integrity.read(device, 20480, 'target')
+        integrity.retune(device, CENTER_FREQ, settle=0)
+    summary = integrity.summary()
+
+    assert summary['clock_drift'] == pytest.approx(0.0, abs=1e-9)
+    assert not summary['compromised']
+
+
+def test_host_stall_overrun_on_the_real_time_device_is_flagged():
+    # Stalls longer than the device buffer lose samples in the gaps between reads
+    device = SimulatedRtlSdr([source()], buffer_samples=8192, seed=2)
+    integrity = CaptureIntegrity(device.sample_rate)
+    for _ in range(4):
+        integrity.read(device, 4096, 'target')
+        time.sleep(0.03)
+    summary = integrity.summary()
+
+    assert device.dropped_samples > 0
+    assert summary['samples_received'] == summary['samples_expected']
+    assert summary['clock_drift'] > 0.05
+    assert summary['compromised']
+
+
+def test_replay_benchmark_reports_every_capture():
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = run_replay_benchmark(captures=2, duration=0.1, realtime=False)
+
+    assert report['reference_locked']
+    assert len(report['captures']) == 2
+    assert report['collector_counters']['captures'] == 2
+    assert report['device_dropped_samples'] == 0
+    assert all(cap['detected'] for cap in report['captures'])
+
+
+
+def tracked_start_phases(collector, captures=2):
+    phases = []
+    update = collector.ref_tracker.update
+
+    def recording_update(*args, **kwargs):
+        status = update(*args, **kwargs)
+        phases.append(status['start_phase'])
+        return status
+
+    collector.ref_tracker.update = recording_update
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(captures):
+            collector.collect_samples(duration=0.1)
+    return np.array(phases)
+
+
+def test_reference_phase_is_continuous_across_hops_on_the_sample_counter():
+    # Paced on the host clock: the hop gaps must come from the device's sample
+    # counter, not from time.time()
+    device = SimulatedRtlSdr([SyntheticSource([(SYNC_FREQ + 1130.0, 2.0)], noise_power=0.01, seed=1)],
+                             seed=2)
+    collector = collector_on(device)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert collector.acquire_reference_lock(timeout=2.0)
+    lock_phase = collector.ref_phase
+
+    phases = tracked_start_phases(collector)
+    assert len(phases) == 20
+    assert np.all(np.abs(np.angle(np.exp(1j * (phases - phases[0])))) < 0.05)
+    assert abs(np.angle(np.exp(1j * (phases[0] - lock_phase)))) < 0.05
+
+
+class CounterlessDevice(SimulatedRtlSdr):
+    """Like a real RtlSdr: no stream sample counter"""
+    sample_count = None
+
+
+def test_reference_tracks_frequency_without_a_sample_counter():
+    device = CounterlessDevice([source()], realtime=False, seed=2)
+    collector = collector_on(device)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert collector.acquire_reference_lock(timeout=2.0)
+        data = collector.collect_samples(duration=0.2)
+
+    assert collector.ref_end_count is None
+    assert collector.ref_lock
+    assert data['ref_freq_offset'] == pytest.approx(1130.0, abs=1.0)
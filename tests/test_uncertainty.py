@@ -0,0 +1,53 @@
+import contextlib
+import io
+import pytest
+from scenario_generator import Scenario, load_truth, configure_processor
+from tdoa_processor_three_stations import ThreeStationTDOA
+
+SEEDS = (0, 1, 2)
+
+
+def locate(data_dir, snr_db, seed):
+    Scenario.random(n_stations=3, duration=0.15, snr_db=snr_db, seed=seed).write(str(data_dir))
+    processor = configure_processor(ThreeStationTDOA(str(data_dir)), load_truth(str(data_dir)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.find_synchronized_files()
+        processor.load_station_data()
+        processor.compute_all_tdoa()
+        processor.multilateration()
+    return processor
+
+
+@pytest.fixture(scope='module')
+def fixes(tmp_path_factory):
+    return {(snr_db, seed): locate(tmp_path_factory.mktemp('scenario'), snr_db, seed)
+            for snr_db in (20.0, 0.0) for seed in SEEDS}
+
+
+@pytest.mark.parametrize('snr_db', [20.0, 0.0])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_position_error_is_within_three_sigma(fixes, snr_db, seed):
+    position = fixes[(snr_db, seed)].estimated_position
+    assert position['error_meters'] < 3 * position['semi_major_m']
+
+
+def test_sigma_and_ellipse_grow_as_snr_falls(fixes):
+    for seed in SEEDS:
+        strong, weak = fixes[(20.0, seed)], fixes[(0.0, seed)]
+        for key, pair in strong.tdoa_pairs.items():
+            assert weak.tdoa_pairs[key]['sigma'] > 3 * pair['sigma']
+        assert weak.estimated_position['semi_major_m'] > 3 * strong.estimated_position['semi_major_m']
+
+
+def test_sigma_pass_is_timed_as_its_own_stage(fixes):
+    processor = fixes[(20.0, 0)]
+    records = [r for r in processor.metrics.records if r['stage'] == 'tdoa_sigma']
+    assert len(records) == 1
+    assert records[0]['sigma_lags'] == processor.tdoa_sigma_lags
+
+
+def test_fix_summary_carries_each_pair_sigma(fixes):
+    processor = fixes[(0.0, 0)]
+    summary = processor.fix_summary()
+    for key, pair in processor.tdoa_pairs.items():
+        assert summary['tdoa'][key]['sigma'] == pair['sigma']